@@ -0,0 +1,205 @@
+"""Фейковые бэкенды для нагрузочных тестов: сессия Bot API и PostgREST-клиент в памяти.
+
+FakeBotSession подменяет HTTP-сессию aiogram: запросы проходят через обычную
+цепочку request-middleware (планировщик, метрики), а ответы генерируются
+локально с заданной задержкой. FakeSupabaseClient реализует ту часть
+построителя запросов supabase-py, которой пользуется data.storage.SupabaseStorage,
+поэтому хранилище работает по своему настоящему коду.
+"""
+import asyncio
+import copy
+import datetime
+import itertools
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import EditMessageReplyMarkup, EditMessageText, SendMessage, SendPhoto, TelegramMethod
+from aiogram.types import Chat, InlineKeyboardMarkup, Message
+
+
+class FakeBotSession(BaseSession):
+    """Сессия Bot API без сети: считает вызовы и запоминает последнюю клавиатуру в каждом чате."""
+
+    def __init__(self, latency: float = 0.0, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.keyboards: Dict[int, Tuple[int, Optional[InlineKeyboardMarkup]]] = {} # chat_id -> (message_id, клавиатура)
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, (SendMessage, SendPhoto)):
+            message_id = next(self._message_ids)
+            self.keyboards[method.chat_id] = (message_id, method.reply_markup)
+            return self._message(method.chat_id, message_id, getattr(method, "text", None))
+        if isinstance(method, (EditMessageText, EditMessageReplyMarkup)):
+            self.keyboards[method.chat_id] = (method.message_id, method.reply_markup)
+            return self._message(method.chat_id, method.message_id, getattr(method, "text", None))
+        return True # answerCallbackQuery, deleteMessage(s) и т.п.
+
+    @staticmethod
+    def _message(chat_id: int, message_id: int, text: Optional[str]) -> Message:
+        return Message(message_id=message_id, date=datetime.datetime.now(), chat=Chat(id=chat_id, type="private"), text=text)
+
+    async def stream_content(self, *args: Any, **kwargs: Any):
+        raise NotImplementedError("FakeBotSession does not download files")
+        yield b"" # pragma: no cover
+
+    async def close(self) -> None:
+        pass
+
+
+class _Response:
+    __slots__ = ("data",)
+
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class FakeQuery:
+    """Построитель запроса к таблице в памяти (подмножество postgrest-py)."""
+
+    def __init__(self, client: "FakeSupabaseClient", table: str):
+        self._client = client
+        self._table = table
+        self._filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self._negate_next = False
+        self._columns: Tuple[str, ...] = ("*",)
+        self._order: List[Tuple[str, bool]] = []
+        self._range: Optional[Tuple[int, int]] = None
+        self._single = False
+        self._upsert: Optional[List[Dict[str, Any]]] = None
+
+    # --- Выборка и запись ---
+    def select(self, *columns: str) -> "FakeQuery":
+        self._columns = columns or ("*",)
+        return self
+
+    def upsert(self, rows: Any) -> "FakeQuery":
+        self._upsert = rows if isinstance(rows, list) else [rows]
+        return self
+
+    # --- Фильтры ---
+    def _filter(self, predicate: Callable[[Dict[str, Any]], bool]) -> "FakeQuery":
+        if self._negate_next:
+            self._negate_next = False
+            self._filters.append(lambda row: not predicate(row))
+        else:
+            self._filters.append(predicate)
+        return self
+
+    @property
+    def not_(self) -> "FakeQuery":
+        self._negate_next = True
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter(lambda row: row.get(column) == value)
+
+    def lte(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter(lambda row: row.get(column) is not None and row.get(column) <= value)
+
+    def in_(self, column: str, values: Sequence[Any]) -> "FakeQuery":
+        allowed = set(values)
+        return self._filter(lambda row: row.get(column) in allowed)
+
+    def or_(self, expression: str) -> "FakeQuery":
+        """Поддерживает условия вида "col.eq.N" и "col.is.null" через запятую."""
+        checks = []
+        for part in expression.split(","):
+            column, op, value = part.split(".", 2)
+            if op == "is" and value == "null":
+                checks.append(lambda row, c=column: row.get(c) is None)
+            elif op == "eq":
+                checks.append(lambda row, c=column, v=value: str(row.get(c)) == v)
+            else:
+                raise NotImplementedError(f"Unsupported or_ operator: {op}")
+        return self._filter(lambda row: any(check(row) for check in checks))
+
+    # --- Порядок и пагинация ---
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self._order.append((column, desc))
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self._range = (start, end)
+        return self
+
+    def limit(self, count: int) -> "FakeQuery":
+        self._range = (0, count - 1)
+        return self
+
+    def maybe_single(self) -> "FakeQuery":
+        self._single = True
+        return self
+
+    def retry(self, enabled: bool) -> "FakeQuery":
+        return self
+
+    async def execute(self) -> Optional[_Response]:
+        client = self._client
+        client.calls[(self._table, "upsert" if self._upsert is not None else "select")] += 1
+        if client.latency:
+            await asyncio.sleep(client.latency)
+
+        table = client.tables.setdefault(self._table, [])
+        if self._upsert is not None:
+            key = client.primary_keys.get(self._table, "id")
+            index = {row[key]: i for i, row in enumerate(table)}
+            for row in self._upsert:
+                if row[key] in index:
+                    table[index[row[key]]].update(copy.deepcopy(row))
+                else:
+                    table.append(copy.deepcopy(row))
+            return _Response(copy.deepcopy(self._upsert))
+
+        rows = [row for row in table if all(f(row) for f in self._filters)]
+        for column, desc in reversed(self._order):
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self._range is not None:
+            rows = rows[self._range[0]:self._range[1] + 1]
+        rows = [self._project(row) for row in rows]
+        if self._single:
+            return _Response(rows[0]) if rows else None
+        return _Response(rows)
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for column in self._columns:
+            if column == "*":
+                result.update(copy.deepcopy(row))
+            elif "(" in column:
+                # Встраивание связанной таблицы: child(col1,col2) по внешнему ключу <таблица>_id
+                child, inner = column[:-1].split("(", 1)
+                foreign_key = self._client.foreign_keys[(child, self._table)]
+                child_columns = inner.split(",")
+                result[child] = [
+                    {c: copy.deepcopy(child_row.get(c)) for c in child_columns}
+                    for child_row in self._client.tables.get(child, []) if child_row.get(foreign_key) == row.get("id")
+                ]
+            else:
+                result[column] = copy.deepcopy(row.get(column))
+        return result
+
+
+class FakeSupabaseClient:
+    """In-memory замена supabase AsyncClient для SupabaseStorage с настраиваемой задержкой ответа."""
+
+    def __init__(self, tables: Optional[Dict[str, List[Dict[str, Any]]]] = None, latency: float = 0.0):
+        self.tables: Dict[str, List[Dict[str, Any]]] = tables or {}
+        self.latency = latency
+        self.calls: Counter = Counter() # (таблица, операция) -> число запросов
+        self.primary_keys = {"players": "telegram_id"}
+        self.foreign_keys = {("event_options", "events"): "event_id"}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
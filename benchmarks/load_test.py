@@ -0,0 +1,269 @@
+"""Нагрузочный тест: настоящий Dispatcher с bot.handlers.router против фейковых Telegram и PostgREST.
+
+N игроков одновременно проходят игру: /start, нажатия narrative_next_* во
+вступлении и choice_* в событиях (кнопка выбирается случайно из последней
+клавиатуры, которую бот отправил игроку). Апдейты подаются через
+dp.feed_update, как при webhook. Запросы к Bot API и к Supabase не уходят в
+сеть: их обслуживают benchmarks.fakes с заданной задержкой. Хранилище -
+настоящий SupabaseStorage поверх FakeSupabaseClient.
+
+Отчет: пропускная способность, p50/p95/p99 задержки по типам апдейтов,
+запросы к БД и к Bot API на ход (ход - обработанный choice_*).
+
+Запуск:
+    python -m benchmarks.load_test --players 200 --turns 20 --db-latency-ms 30 --api-latency-ms 50
+    python -m benchmarks.load_test --content content.json --no-catalog --no-session-cache
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import random
+import statistics
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+import config
+from benchmarks.fakes import FakeBotSession, FakeSupabaseClient
+from bot.handlers import router as main_router
+from bot.middlewares import ConcurrencyLimitMiddleware
+from bot.outbound import OutboundScheduler
+from data.save_queue import SaveCoalescer
+from data.session_cache import PlayerSessionCache
+from data.storage import SupabaseStorage
+from game.catalog import EventCatalog
+from game.narrative import NarrativeCatalog
+from game.speculation import TurnSpeculator
+
+BOT_TOKEN = "123456:LOAD-TEST"
+CHAT_DATE = int(datetime.datetime(2024, 1, 1).timestamp())
+
+
+def synthetic_content(events: int, options: int, intro_blocks: int, seed: int) -> Dict[str, List[Dict[str, Any]]]:
+    """Генерирует контент: цепочку вступления и события random/conditional с вариантами."""
+    rng = random.Random(seed)
+    narrative_blocks = [{
+        "id": i, "block_type": "intro", "text": f"Вступление, часть {i}", "image_url": None,
+        "button_text": "Далее", "is_final_in_sequence": i == intro_blocks,
+        "required_playthrough": 0, "sequence_order": i,
+    } for i in range(1, intro_blocks + 1)]
+
+    event_rows, option_rows = [], []
+    option_ids = itertools.count(1)
+    for event_id in range(1, events + 1):
+        conditional = event_id % 5 == 0
+        event_rows.append({
+            "id": event_id, "name": f"event_{event_id}", "description": f"Событие {event_id}: совет ждет решения.",
+            "image_url_prompt": None, "character_name": "Советник" if event_id % 3 == 0 else None,
+            "trigger_conditions": {"support": {"<=": 40}} if conditional else None,
+            "frequency_weight": rng.randint(1, 5),
+            "event_type": "conditional" if conditional else "random",
+            "min_year": rng.choice((0, 0, 0, 3, 10)),
+            "max_year": rng.choice((None, None, None, 20)),
+            "is_unique": event_id % 4 == 0,
+        })
+        for order in range(options):
+            option_rows.append({
+                "id": next(option_ids), "event_id": event_id, "button_text": f"Вариант {order + 1}",
+                "effects": {"support": rng.randint(-8, 8), "treasury": rng.randint(-120, 150)},
+                "outcome_text": f"Итог варианта {order + 1}.", "image_url_result": None,
+                "next_event_name": None, "display_order": order,
+            })
+    return {"events": event_rows, "event_options": option_rows, "narrative_blocks": narrative_blocks}
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class LoadTest:
+    """Один прогон: собирает бота и диспетчер как bot.main и гоняет игроков."""
+
+    def __init__(self, args: argparse.Namespace, content: Dict[str, List[Dict[str, Any]]]):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        tables = {
+            "players": [],
+            "events": content["events"],
+            "event_options": content["event_options"],
+            "narrative_blocks": content.get("narrative_blocks", []),
+        }
+        self.db = FakeSupabaseClient(tables, latency=args.db_latency_ms / 1000)
+        self.storage = SupabaseStorage(self.db)
+        self.session = FakeBotSession(latency=args.api_latency_ms / 1000)
+        self.bot = Bot(token=BOT_TOKEN, session=self.session)
+        self.dp = Dispatcher()
+        self.latencies: Dict[str, List[float]] = {"start": [], "narrative": [], "choice": []}
+        self.errors = 0
+        self._update_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    async def setup(self) -> None:
+        args = self.args
+        event_catalog = EventCatalog()
+        narrative_catalog = NarrativeCatalog()
+        if not args.no_catalog:
+            await event_catalog.load(self.storage)
+            await narrative_catalog.load(self.storage)
+        self.session_cache = None if args.no_session_cache else PlayerSessionCache(self.storage)
+        self.save_queue = SaveCoalescer(self.storage) if self.session_cache is None and not args.no_save_queue else None
+        self.speculator = None if args.no_speculation else TurnSpeculator()
+        self.scheduler = OutboundScheduler() if args.scheduler else None
+        if self.scheduler is not None:
+            self.session.middleware(self.scheduler)
+
+        self.dp["db_client"] = self.storage
+        self.dp["event_catalog"] = event_catalog if not args.no_catalog else None
+        self.dp["narrative_catalog"] = narrative_catalog if not args.no_catalog else None
+        self.dp["session_cache"] = self.session_cache
+        self.dp["save_queue"] = self.save_queue
+        self.dp["speculator"] = self.speculator
+        self.dp["outbound_scheduler"] = self.scheduler
+        self.dp.include_router(main_router)
+        self.dp.update.outer_middleware(ConcurrencyLimitMiddleware(args.max_concurrent))
+        if self.session_cache is not None:
+            self.session_cache.start()
+        # Загрузка каталогов не входит в нагрузку
+        self.db.calls.clear()
+
+    async def close(self) -> None:
+        if self.speculator is not None:
+            self.speculator.close()
+        if self.session_cache is not None:
+            await self.session_cache.close()
+        if self.save_queue is not None:
+            await self.save_queue.close()
+        if self.scheduler is not None:
+            await self.scheduler.close()
+        await self.bot.session.close()
+
+    def _user(self, player_id: int) -> Dict[str, Any]:
+        return {"id": player_id, "is_bot": False, "first_name": f"Player{player_id}"}
+
+    def _chat(self, player_id: int) -> Dict[str, Any]:
+        return {"id": player_id, "type": "private"}
+
+    def _start_update(self, player_id: int) -> Dict[str, Any]:
+        return {"update_id": next(self._update_ids), "message": {
+            "message_id": 1, "date": CHAT_DATE, "chat": self._chat(player_id), "from": self._user(player_id),
+            "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }}
+
+    def _callback_update(self, player_id: int, message_id: int, data: str) -> Dict[str, Any]:
+        return {"update_id": next(self._update_ids), "callback_query": {
+            "id": str(next(self._callback_ids)), "from": self._user(player_id), "chat_instance": str(player_id),
+            "data": data, "message": {"message_id": message_id, "date": CHAT_DATE, "chat": self._chat(player_id),
+                                      "text": "..."},
+        }}
+
+    async def _feed(self, kind: str, raw: Dict[str, Any]) -> None:
+        update = Update.model_validate(raw, context={"bot": self.bot})
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Update {raw['update_id']} ({kind}) failed: {e}")
+        self.latencies[kind].append(time.perf_counter() - started)
+
+    async def play(self, player_id: int) -> None:
+        """Один игрок: /start, затем нажатия кнопок, пока не сделано --turns ходов."""
+        turns = 0
+        await self._feed("start", self._start_update(player_id))
+        # Ограничиваем число апдейтов, чтобы игрок без кнопок не крутился бесконечно
+        for _ in range(self.args.turns * 4 + 10):
+            if turns >= self.args.turns:
+                break
+            if self.args.think_ms:
+                await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000)
+            message_id, markup = self.session.keyboards.get(player_id, (0, None))
+            buttons = [button for row in markup.inline_keyboard for button in row] if markup is not None else []
+            if not buttons:
+                # Конец игры (или сообщение без кнопок) - начинаем новое прохождение
+                await self._feed("start", self._start_update(player_id))
+                continue
+            data = self.rng.choice(buttons).callback_data
+            kind = "choice" if data.startswith("choice_") else "narrative"
+            await self._feed(kind, self._callback_update(player_id, message_id, data))
+            if kind == "choice":
+                turns += 1
+
+    async def run(self) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(self.play(1000 + i) for i in range(self.args.players)))
+        elapsed = time.perf_counter() - started
+        await self.close() # отложенные записи кэша сессий тоже считаются
+        return elapsed
+
+    def report(self, elapsed: float) -> None:
+        updates = sum(len(values) for values in self.latencies.values())
+        turns = len(self.latencies["choice"]) or 1
+        print(f"players={self.args.players} turns/player={self.args.turns} "
+              f"db_latency={self.args.db_latency_ms}ms api_latency={self.args.api_latency_ms}ms")
+        print(f"elapsed: {elapsed:.2f}s, updates: {updates}, errors: {self.errors}")
+        print(f"throughput: {updates / elapsed:.1f} updates/s, {len(self.latencies['choice']) / elapsed:.1f} turns/s")
+        for kind, values in self.latencies.items():
+            if not values:
+                continue
+            ms = [v * 1000 for v in values]
+            print(f"{kind:>9}: n={len(ms):<6} mean={statistics.fmean(ms):7.2f}ms p50={percentile(ms, 50):7.2f}ms "
+                  f"p95={percentile(ms, 95):7.2f}ms p99={percentile(ms, 99):7.2f}ms")
+        print(f"db calls/turn: {self.db.total_calls / turns:.2f} "
+              f"({', '.join(f'{table}.{op}={count}' for (table, op), count in sorted(self.db.calls.items()))})")
+        api_calls = Counter(self.session.calls)
+        print(f"api calls/turn: {sum(api_calls.values()) / turns:.2f} "
+              f"({', '.join(f'{method}={count}' for method, count in sorted(api_calls.items()))})")
+        if self.speculator is not None:
+            print(f"speculation: hits={self.speculator.hits} misses={self.speculator.misses}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load test of the bot against fake Telegram and PostgREST backends.")
+    parser.add_argument("--players", type=int, default=100, help="simulated concurrent players")
+    parser.add_argument("--turns", type=int, default=20, help="event choices per player")
+    parser.add_argument("--db-latency-ms", type=float, default=20.0, help="injected latency of each PostgREST request")
+    parser.add_argument("--api-latency-ms", type=float, default=40.0, help="injected latency of each Bot API request")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a reply and the next click")
+    parser.add_argument("--content", help="JSON file with 'events', 'event_options' and optional 'narrative_blocks'")
+    parser.add_argument("--events", type=int, default=200, help="synthetic events when --content is not given")
+    parser.add_argument("--options", type=int, default=3, help="options per synthetic event")
+    parser.add_argument("--intro-blocks", type=int, default=3, help="synthetic intro narrative blocks")
+    parser.add_argument("--max-concurrent", type=int, default=config.MAX_CONCURRENT_UPDATES)
+    parser.add_argument("--render-mode", choices=("edit", "send"), default=config.RENDER_MODE)
+    parser.add_argument("--no-catalog", action="store_true", help="do not load in-memory event/narrative catalogs")
+    parser.add_argument("--no-session-cache", action="store_true")
+    parser.add_argument("--no-save-queue", action="store_true")
+    parser.add_argument("--no-speculation", action="store_true")
+    parser.add_argument("--scheduler", action="store_true", help="route Bot API calls through OutboundScheduler")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+    config.RENDER_MODE = args.render_mode
+    if args.content:
+        with open(args.content, encoding="utf-8") as f:
+            content = json.load(f)
+    else:
+        content = synthetic_content(args.events, args.options, args.intro_blocks, args.seed)
+
+    async def run() -> None:
+        test = LoadTest(args, content)
+        await test.setup()
+        elapsed = await test.run()
+        test.report(elapsed)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
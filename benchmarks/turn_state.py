@@ -0,0 +1,145 @@
+"""Микробенчмарк: CPU-стоимость преобразований состояния игрока за один ход.
+
+Сравнивает прежний путь handle_event_choice (model_dump -> Player.load_country_state ->
+Country.update(dict) -> get_state -> CountryState.model_validate -> PlayerState(...) ->
+model_dump при сохранении) с быстрым путем data.codec (Country из CountryState,
+скомпилированный эффект, сборка моделей без валидации, прямая сборка строки). Ввода-вывода нет.
+Прежний путь использует копию исходных классов Country/Player (строковые уровни,
+update по словарю эффектов), а не текущий Country со слотами и кодами уровней.
+
+Запуск:
+    python -m benchmarks.turn_state --turns 200000
+"""
+import argparse
+import timeit
+from typing import Any, Dict, Optional, Sequence
+
+import config
+from data.codec import build_player_state, country_from_state, player_state_to_row
+from data.models import CountryState, PlayerState
+from game.core import Player
+from game.effects import compile_effects
+
+EFFECTS: Dict[str, Any] = {"support": 3, "treasury": -50, "army": "high"}
+
+
+def _loaded_state() -> PlayerState:
+    return PlayerState.model_validate({
+        "telegram_id": 123456789,
+        "country_state": {"support": 50, "treasury": 1000, "army": "medium", "peasants": "medium", "current_year": 5},
+        "current_event_id": 42,
+        "playthrough_count": 2,
+        "completed_narrative_block_ids": list(range(20)),
+        "message_ids": [1001],
+    })
+
+
+class LegacyCountry:
+    """Country до слотов и кодов уровней (game/core.py до перевода на __slots__)."""
+    def __init__(self):
+        self.support: int = config.INITIAL_SUPPORT
+        self.treasury: int = config.INITIAL_TREASURY
+        self.army: str = config.INITIAL_ARMY
+        self.peasants: str = config.INITIAL_PEASANTS
+        self.current_year: int = 1
+
+    def update(self, effects: Dict[str, Any]):
+        for key, value in effects.items():
+            if hasattr(self, key):
+                current_value = getattr(self, key)
+                if isinstance(current_value, int):
+                    setattr(self, key, current_value + value)
+                elif isinstance(current_value, str):
+                    setattr(self, key, value)
+            else:
+                print(f"Предупреждение: Неизвестный ключ '{key}' в эффектах события.")
+
+    def get_state(self) -> Dict[str, Any]:
+        return {
+            "support": self.support,
+            "treasury": self.treasury,
+            "army": self.army,
+            "peasants": self.peasants,
+            "current_year": self.current_year
+        }
+
+    def load_state(self, state_data: Dict[str, Any]):
+        self.support = state_data.get("support", config.INITIAL_SUPPORT)
+        self.treasury = state_data.get("treasury", config.INITIAL_TREASURY)
+        self.army = state_data.get("army", config.INITIAL_ARMY)
+        self.peasants = state_data.get("peasants", config.INITIAL_PEASANTS)
+        self.current_year = state_data.get("current_year", 1)
+
+
+class LegacyPlayer:
+    """Player до слотов: страна - LegacyCountry."""
+    def __init__(self, telegram_id: int):
+        self.telegram_id: int = telegram_id
+        self.country: LegacyCountry = LegacyCountry()
+        self.message_history: list[int] = []
+
+    def load_country_state(self, state_data: Dict[str, Any]):
+        self.country.load_state(state_data)
+
+
+def legacy_turn(loaded: PlayerState) -> Dict[str, Any]:
+    """Прежний путь хода: исходные Country/Player и четыре прохода валидации/сериализации Pydantic."""
+    player = LegacyPlayer(telegram_id=loaded.telegram_id)
+    player.load_country_state(loaded.country_state.model_dump())
+    player.country.update(EFFECTS)
+    player.country.current_year += 1
+    state = PlayerState(
+        telegram_id=player.telegram_id,
+        country_state=CountryState.model_validate(player.country.get_state()),
+        playthrough_count=loaded.playthrough_count,
+        completed_narrative_block_ids=loaded.completed_narrative_block_ids,
+        message_ids=[],
+        current_event_id=None,
+    )
+    return {
+        "telegram_id": state.telegram_id,
+        "state": state.country_state.model_dump(),
+        "current_event_id": state.current_event_id,
+        "playthrough_count": state.playthrough_count,
+        "completed_narrative_block_ids": state.completed_narrative_block_ids,
+        "message_ids": state.message_ids,
+    }
+
+
+_COMPILED = compile_effects(EFFECTS)
+
+
+def fast_turn(loaded: PlayerState) -> Dict[str, Any]:
+    """Быстрый путь хода через data.codec и скомпилированный эффект."""
+    player = Player(telegram_id=loaded.telegram_id)
+    player.country = country_from_state(loaded.country_state)
+    player.country.apply_effect(_COMPILED)
+    player.country.current_year += 1
+    state = build_player_state(
+        telegram_id=player.telegram_id,
+        country=player.country,
+        playthrough_count=loaded.playthrough_count,
+        completed_narrative_block_ids=loaded.completed_narrative_block_ids,
+    )
+    return player_state_to_row(state)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Per-turn CPU cost of player state conversions.")
+    parser.add_argument("--turns", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    loaded = _loaded_state()
+    assert legacy_turn(loaded) == fast_turn(loaded), "fast path must produce the same row"
+
+    results = {}
+    for name, func in (("legacy", legacy_turn), ("fast", fast_turn)):
+        best = min(timeit.repeat(lambda: func(loaded), number=args.turns, repeat=args.repeat))
+        results[name] = best / args.turns * 1e6
+        print(f"{name:>6}: {results[name]:.2f} us/turn")
+    print(f"speedup: {results['legacy'] / results['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
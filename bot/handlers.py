@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import random # Потребуется для поиска события по имени класса
 from typing import Dict, Optional, Type, Any, List
@@ -8,54 +9,94 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.exceptions import TelegramBadRequest
 
 from game.core import Player, Country # Импортируем Country для создания нового состояния
+from game.effects import compile_effects
 from game.events import EventData, get_next_event, fetch_event_options # ИМПОРТИРУЕМ обновленные функции из game.events
+from game.catalog import EventCatalog
+from bot.rendering import EVENT_RENDERS, render_status
+from game.narrative import NarrativeCatalog
+from game.speculation import TurnSpeculator
 from game.mechanics import check_game_over_conditions
 from data.database import load_player_state, save_player_state
+from data.codec import build_player_state, country_from_state, country_to_state
+from data.session_cache import PlayerSessionCache
+from data.save_queue import SaveCoalescer
 from data.models import PlayerState, CountryState # Импортируем Pydantic модели
 import config
+from utils.metrics import STORAGE_ERRORS, STORAGE_LATENCY, timed
+from utils.tracing import traced
 
-# Добавляем AsyncClient для type hinting
-from supabase._async.client import AsyncClient 
+# Хранилище (Supabase или SQLite) передается в хендлеры как db_client
+from data.storage import Storage
 
 # Используем Router для лучшей организации
 router = Router()
 
 # Временное хранилище player_states больше НЕ ИСПОЛЬЗУЕТСЯ
 # player_states: Dict[int, Player] = {}
+# Вместо него (опционально) используется PlayerSessionCache из data/session_cache.py
 
 
-def build_event_keyboard(event_data: EventData) -> types.InlineKeyboardMarkup:
-    """Строит клавиатуру с вариантами ответов для события (использует EventData)."""
-    builder = InlineKeyboardBuilder()
-    options = event_data.get_options_data()
-    for i, (text, _effects, _outcome, _img) in enumerate(options):
-        builder.button(text=text, callback_data=f"choice_{i}")
-    builder.adjust(1)
-    return builder.as_markup()
+@traced("load_state")
+async def load_state(db_client: Storage, player_id: int, session_cache: Optional[PlayerSessionCache] = None) -> Optional[PlayerState]:
+    """Загружает состояние игрока: из кэша сессий, если он включен, иначе напрямую из БД."""
+    if session_cache is not None:
+        return await session_cache.get(player_id)
+    return await load_player_state(db_client, player_id)
 
-async def send_event_to_player(message_or_callback: types.Message | types.CallbackQuery, player: Player, event_data: EventData) -> Optional[types.Message]:
-    """Отправляет НОВОЕ сообщение с событием и статусом.
-       Возвращает отправленное сообщение или None в случае ошибки.
+@traced("save_state")
+async def store_state(db_client: Storage, player_state: PlayerState, session_cache: Optional[PlayerSessionCache] = None, save_queue: Optional[SaveCoalescer] = None) -> bool:
+    """Сохраняет состояние игрока.
+
+    В кэш сессий (запись в БД произойдет позже), через очередь сохранения
+    (склеивается с записями других игроков в один upsert) или напрямую в БД.
+    """
+    if session_cache is not None:
+        session_cache.put(player_state)
+        return True
+    if save_queue is not None:
+        return await save_queue.save(player_state)
+    return await save_player_state(db_client, player_state)
+
+
+@traced("send")
+async def render_message(bot: Bot, chat_id: int, text: str, reply_markup: Optional[types.InlineKeyboardMarkup] = None,
+                         parse_mode: Optional[str] = None, edit_message: Optional[types.Message] = None) -> Optional[types.Message]:
+    """Показывает текст игроку: редактирует edit_message, а если это невозможно - отправляет новое сообщение.
+
+    Редактирование заменяет пару sendMessage + deleteMessage одним вызовом editMessageText.
+    Если отредактировать не удалось (сообщение слишком старое, удалено и т.п.),
+    отправляется новое сообщение, а edit_message удаляется.
     """
-    keyboard = build_event_keyboard(event_data)
-
-    # --- Формирование статус-блока --- 
-    status_lines = [
-        f"*Год:* {player.country.current_year}",
-        f"*Поддержка:* {player.country.support}",
-        f"*Казна:* {player.country.treasury}",
-        f"*Армия:* {player.country.army.capitalize()}", # low -> Low
-        f"*Крестьяне:* {player.country.peasants.capitalize()}"
-    ]
-    status_block = "\n\n" + "\n".join(status_lines)
-    # ----------------------------------
-
-    # Формируем текст сообщения с описанием, персонажем и статусом
-    description = event_data.description
-    if event_data.character_name:
-        description = f"**{event_data.character_name}:**\n{description}"
-
-    full_description = description + status_block # Добавляем статус
+    if edit_message is not None:
+        try:
+            edited = await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=edit_message.message_id,
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
+            return edited if isinstance(edited, types.Message) else edit_message
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                return edit_message # Текст и клавиатура уже такие же
+            logging.warning(f"Could not edit message {edit_message.message_id} in chat {chat_id}: {e}. Sending a new one.")
+        except Exception as e:
+            logging.exception(f"Unexpected error editing message {edit_message.message_id} in chat {chat_id}: {e}")
+
+    sent_message = await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, parse_mode=parse_mode)
+    if edit_message is not None:
+        await delete_player_messages(bot, chat_id, [edit_message.message_id], background=config.DELETE_MESSAGES_IN_BACKGROUND)
+    return sent_message
+
+async def send_event_to_player(message_or_callback: types.Message | types.CallbackQuery, player: Player, event_data: EventData, edit_message: Optional[types.Message] = None, event_catalog: Optional[EventCatalog] = None) -> Optional[types.Message]:
+    """Показывает событие со статусом: НОВЫМ сообщением или редактированием edit_message.
+       Текст события и клавиатура берутся готовыми из EVENT_RENDERS (bot/rendering.py),
+       на каждом ходу строится только статус-блок.
+       Возвращает отправленное (отредактированное) сообщение или None в случае ошибки.
+    """
+    rendered = EVENT_RENDERS.get(event_data, event_catalog)
+    full_description = rendered.body + render_status(player.country) # Добавляем статус
 
     # TODO: Добавить отправку картинки event_data.image_url_prompt
 
@@ -74,14 +115,15 @@ async def send_event_to_player(message_or_callback: types.Message | types.Callba
 
     if chat_id and bot:
         try:
-            # Всегда отправляем новое сообщение
-            sent_message = await bot.send_message(
-                chat_id=chat_id,
-                text=full_description,
-                reply_markup=keyboard,
-                parse_mode="Markdown"
+            sent_message = await render_message(
+                bot,
+                chat_id,
+                full_description,
+                reply_markup=rendered.keyboard,
+                parse_mode="Markdown",
+                edit_message=edit_message
             )
-            logging.info(f"Sent new event message {sent_message.message_id} to player {player.telegram_id}")
+            logging.info(f"Sent event message {sent_message.message_id} to player {player.telegram_id}")
         except Exception as e:
             logging.exception(f"Unexpected error sending message for player {player.telegram_id}: {e}")
     else:
@@ -94,34 +136,35 @@ async def send_event_to_player(message_or_callback: types.Message | types.Callba
 
 # --- Вспомогательные функции для нарративных блоков --- 
 
-async def find_next_narrative_block(db_client: AsyncClient, playthrough: int, completed_ids: list[int]) -> Optional[dict]:
-    """Находит следующий доступный нарративный блок."""
-    # logging.debug(f"[find_next_narrative_block] Using db_client: {db_client}")
+@timed(STORAGE_LATENCY, "find_next_narrative_block")
+@traced("find_narrative_block")
+async def find_next_narrative_block(db_client: Storage, player_state: PlayerState, block_type: str, narrative_catalog: Optional[NarrativeCatalog] = None, after_block_id: Optional[int] = None) -> Optional[dict]:
+    """Находит следующий доступный нарративный блок заданного типа.
+
+    Если загружен narrative_catalog, блок берется из готовой последовательности в памяти,
+    начиная с позиции after_block_id (курсор игрока). Иначе - запросом к хранилищу.
+    """
+    playthrough = player_state.playthrough_count
+    completed_ids = player_state.completed_narrative_block_ids
+    if narrative_catalog is not None and narrative_catalog.is_loaded:
+        narrative_catalog.schedule_refresh(db_client)
+        block = narrative_catalog.sequences.next_pending(block_type, playthrough, completed_ids, after_block_id)
+        if not block:
+            logging.info(f"No narrative blocks found for playthrough {playthrough} excluding IDs {completed_ids}")
+        return block
+
     if not db_client:
         logging.error("Invalid db_client provided to find_next_narrative_block.")
         return None
 
     try:
-        # logging.debug(f"[find_next_narrative_block] Executing query...")
-        query = (
-            db_client.table("narrative_blocks")
-            .select("id", "text", "image_url", "button_text", "is_final_in_sequence")
-            .eq("block_type", block_type)
-            .or_(f"required_playthrough.eq.0,required_playthrough.is.null,required_playthrough.eq.{playthrough}")
-            # Используем not_.in_ для исключения уже просмотренных
-            .not_.in_("id", completed_ids if completed_ids else [-1]) # -1 если список пуст
-            .order("sequence_order", desc=False) # Сортируем по порядку
-            .limit(1) # Берем первый не просмотренный
-        )
-        response = await query.execute()
-        # logging.debug(f"[find_next_narrative_block] Query response object: {response}")
-
-        if response.data:
-            # logging.debug(f"Narrative block query for playthrough {playthrough}, completed {completed_ids}: Response data: {response.data}")
-            return response.data[0]
-        else:
-            logging.info(f"No narrative blocks found for playthrough {playthrough} excluding IDs {completed_ids}")
+        block = await db_client.fetch_next_narrative_block(block_type, playthrough, completed_ids)
+        if block:
+            return block
+        logging.info(f"No narrative blocks found for playthrough {playthrough} excluding IDs {completed_ids}")
+        return None
     except Exception as e:
+        STORAGE_ERRORS.inc("find_next_narrative_block")
         # Убедимся, что исключение логируется
         logging.exception(f"[find_next_narrative_block] EXCEPTION during query execution or processing for type '{block_type}': {e}")
         return None
@@ -132,17 +175,21 @@ async def mark_narrative_block_completed(player_state: PlayerState, block_id: in
         player_state.completed_narrative_block_ids.append(block_id)
         # НЕ вызываем save_player_state здесь, сохранение будет при отправке сообщения
 
-async def start_game_proper(db_client: AsyncClient, message_or_callback: types.Message | types.CallbackQuery, player: Player, player_state: PlayerState):
+async def start_game_proper(db_client: Storage, message_or_callback: types.Message | types.CallbackQuery, player: Player, player_state: PlayerState, event_catalog: Optional[EventCatalog] = None, session_cache: Optional[PlayerSessionCache] = None, save_queue: Optional[SaveCoalescer] = None, speculator: Optional[TurnSpeculator] = None):
     """Начинает основной игровой цикл, используя db_client."""
     # Используем импортированную функцию get_next_event
-    first_event_data = await get_next_event(db_client, player.country) 
+    first_event_data = await get_next_event(db_client, player.country, event_catalog)
 
     if first_event_data:
-        sent_message = await send_event_to_player(message_or_callback, player, first_event_data)
+        sent_message = await send_event_to_player(message_or_callback, player, first_event_data, event_catalog=event_catalog)
         if sent_message:
+            player.country.history.record(first_event_data.id)
+            player_state.country_state = country_to_state(player.country)
             player_state.message_ids = [sent_message.message_id]
             player_state.current_event_id = first_event_data.id
-            await save_player_state(db_client, player_state)
+            await store_state(db_client, player_state, session_cache, save_queue)
+            if speculator is not None:
+                speculator.schedule(player_state.telegram_id, first_event_data, player.country, db_client, event_catalog)
         else:
             logging.error(f"Failed to send initial event for player {player_state.telegram_id}")
             # Пытаемся отправить сообщение об ошибке, если возможно
@@ -161,13 +208,13 @@ async def start_game_proper(db_client: AsyncClient, message_or_callback: types.M
 # --- Обновленные обработчики --- 
 
 @router.message(CommandStart())
-async def handle_start(message: types.Message, bot: Bot, db_client: AsyncClient):
+async def handle_start(message: types.Message, bot: Bot, db_client: Storage, event_catalog: Optional[EventCatalog] = None, narrative_catalog: Optional[NarrativeCatalog] = None, session_cache: Optional[PlayerSessionCache] = None, save_queue: Optional[SaveCoalescer] = None, speculator: Optional[TurnSpeculator] = None):
     """Обработчик /start: Удаляет старые сообщения, загружает игрока и запускает нарративный блок или игру."""
     player_id = message.from_user.id
     logging.info(f"Player {player_id} interacting via /start.")
 
     # Передаем db_client в load_player_state
-    loaded_state = await load_player_state(db_client, player_id) 
+    loaded_state = await load_state(db_client, player_id, session_cache)
     player_state: PlayerState # Для аннотации типа
 
     if loaded_state:
@@ -175,8 +222,10 @@ async def handle_start(message: types.Message, bot: Bot, db_client: AsyncClient)
         logging.info(f"Found existing state for player {player_id}, playthrough {player_state.playthrough_count}.")
         
         # --- Удаление старых сообщений --- 
-        await delete_player_messages(bot, player_id, player_state.message_ids)
+        await delete_player_messages(bot, player_id, player_state.message_ids, background=config.DELETE_MESSAGES_IN_BACKGROUND)
         player_state.message_ids = [] # Очищаем список в объекте
+        if speculator is not None:
+            speculator.discard(player_id) # Просчет для старого сообщения больше не нужен
         # Сохранять пустое состояние не обязательно сразу, оно сохранится при первом сообщении
         # await save_player_state(player_state)
         # ---------------------------------
@@ -192,14 +241,14 @@ async def handle_start(message: types.Message, bot: Bot, db_client: AsyncClient)
 
     # --- Создаем объект Player из PlayerState ---
     player = Player(telegram_id=player_id)
-    player.load_country_state(player_state.country_state.model_dump())
+    player.country = country_from_state(player_state.country_state)
     player.playthrough_count = player_state.playthrough_count
     player.completed_narrative_block_ids = player_state.completed_narrative_block_ids
     player.message_ids = player_state.message_ids # Загружаем ID сообщений
     # ------------------------------------------
 
     # Ищем следующий блок вступления ('intro')
-    next_intro_block = await find_next_narrative_block(db_client, player_state, 'intro')
+    next_intro_block = await find_next_narrative_block(db_client, player_state, 'intro', narrative_catalog)
 
     if next_intro_block:
         # Показываем блок вступления
@@ -216,7 +265,7 @@ async def handle_start(message: types.Message, bot: Bot, db_client: AsyncClient)
             # Отмечаем ИМЕННО ЭТОТ блок как пройденный (добавит ID в список)
             await mark_narrative_block_completed(player_state, next_intro_block['id'])
             # Сохраняем состояние с ID сообщения И обновленным списком пройденных блоков
-            await save_player_state(db_client, player_state)
+            await store_state(db_client, player_state, session_cache, save_queue)
             logging.info(f"Saved initial state for player {player_id} with intro block {next_intro_block['id']} and message {sent_block_message.message_id}")
         else:
              logging.error(f"Failed to send intro block message {next_intro_block['id']} for player {player_id}")
@@ -226,11 +275,11 @@ async def handle_start(message: types.Message, bot: Bot, db_client: AsyncClient)
         # Вступление пройдено или не требуется, начинаем игру
         logging.info(f"Intro sequence complete or not required for player {player_id}. Starting game proper.")
         # Передаем db_client в start_game_proper
-        await start_game_proper(db_client, message, player, player_state)
+        await start_game_proper(db_client, message, player, player_state, event_catalog, session_cache, save_queue, speculator)
 
 
 @router.callback_query(F.data.startswith("narrative_next_"))
-async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_client: AsyncClient):
+async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_client: Storage, event_catalog: Optional[EventCatalog] = None, narrative_catalog: Optional[NarrativeCatalog] = None, session_cache: Optional[PlayerSessionCache] = None, save_queue: Optional[SaveCoalescer] = None, speculator: Optional[TurnSpeculator] = None):
     """Обработчик нажатия кнопки 'Далее' в нарративных блоках."""
     player_id = callback.from_user.id
     chat_id = callback.message.chat.id # Получаем chat_id
@@ -241,14 +290,14 @@ async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_clie
         return
 
     logging.info(f"Player {player_id} pressed next on narrative block {block_id}")
-    loaded_state = await load_player_state(db_client, player_id)
+    loaded_state = await load_state(db_client, player_id, session_cache)
     if not loaded_state:
         await callback.answer("Ошибка: Не найдено состояние игры. Начните заново /start", show_alert=True)
         return
 
     # --- Удаляем предыдущие сообщения --- 
     if loaded_state.message_ids:
-        await delete_player_messages(bot, chat_id, loaded_state.message_ids)
+        await delete_player_messages(bot, chat_id, loaded_state.message_ids, background=config.DELETE_MESSAGES_IN_BACKGROUND)
         loaded_state.message_ids = [] # Очищаем сразу
     # ---------------------------------
     await callback.answer() # Отвечаем на коллбек здесь, т.к. дальше не всегда будет вызван send_event_to_player
@@ -257,12 +306,13 @@ async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_clie
     # Используем функцию, которая не сохраняет сама
     await mark_narrative_block_completed(loaded_state, block_id)
 
-    # Загружаем данные текущего блока, чтобы узнать тип и финальность
+    # Данные текущего блока (тип и финальность) берем из каталога в памяти, иначе из хранилища
     current_block_data = None
-    if db_client:
+    if narrative_catalog is not None and narrative_catalog.is_loaded:
+        current_block_data = narrative_catalog.sequences.get(block_id)
+    if not current_block_data and db_client:
         try:
-            resp = await db_client.table("narrative_blocks").select("block_type, is_final_in_sequence").eq("id", block_id).limit(1).execute()
-            current_block_data = resp.data[0] if resp.data else None
+            current_block_data = await db_client.fetch_narrative_block(block_id)
         except Exception as e:
             logging.error(f"Failed to fetch current block data {block_id}: {e}")
 
@@ -283,15 +333,15 @@ async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_clie
         logging.info(f"Final narrative block {block_id} completed for player {player_id}. Starting game proper.")
         # Создаем объект Player перед вызовом
         player = Player(telegram_id=player_id)
-        player.load_country_state(loaded_state.country_state.model_dump())
+        player.country = country_from_state(loaded_state.country_state)
         player.playthrough_count = loaded_state.playthrough_count
         player.completed_narrative_block_ids = loaded_state.completed_narrative_block_ids # Передаем обновленный список
         player.message_ids = [] # Начинаем с пустыми ID
         # Передаем db_client
-        await start_game_proper(db_client, callback, player, loaded_state) # Передаем callback, а не callback.message
+        await start_game_proper(db_client, callback, player, loaded_state, event_catalog, session_cache, save_queue, speculator) # Передаем callback, а не callback.message
     else:
         # Ищем следующий блок того же типа
-        next_block = await find_next_narrative_block(db_client, loaded_state, current_block_data['block_type'])
+        next_block = await find_next_narrative_block(db_client, loaded_state, current_block_data['block_type'], narrative_catalog, after_block_id=block_id)
         if next_block:
             logging.info(f"Showing next narrative block {next_block['id']} to player {player_id}")
             builder = InlineKeyboardBuilder()
@@ -308,7 +358,7 @@ async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_clie
             if sent_block_message:
                 loaded_state.message_ids = [sent_block_message.message_id] # Обновляем ID в Pydantic модели
                 # completed_narrative_block_ids уже обновлен ранее вызовом mark_narrative_block_completed
-                await save_player_state(db_client, loaded_state) # Сохраняем состояние
+                await store_state(db_client, loaded_state, session_cache, save_queue) # Сохраняем состояние
                 logging.info(f"Saved state for player {player_id} with next narrative block {next_block['id']} and message {sent_block_message.message_id}")
             else:
                 logging.error(f"Failed to send next narrative block message {next_block['id']} for player {player_id}")
@@ -318,12 +368,12 @@ async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_clie
             logging.warning(f"Could not find next narrative block after {block_id}, but not final. Starting game proper for player {player_id}.")
             # Создаем объект Player перед вызовом
             player = Player(telegram_id=player_id)
-            player.load_country_state(loaded_state.country_state.model_dump())
+            player.country = country_from_state(loaded_state.country_state)
             player.playthrough_count = loaded_state.playthrough_count
             player.completed_narrative_block_ids = loaded_state.completed_narrative_block_ids # Передаем обновленный список
             player.message_ids = [] # Начинаем с пустыми ID
             # Передаем db_client
-            await start_game_proper(db_client, callback, player, loaded_state) # Передаем callback
+            await start_game_proper(db_client, callback, player, loaded_state, event_catalog, session_cache, save_queue, speculator) # Передаем callback
 
     # Отвечать на callback в конце больше не нужно
     # await callback.answer()
@@ -332,20 +382,26 @@ async def handle_narrative_next(callback: types.CallbackQuery, bot: Bot, db_clie
 # --- Обработчик игровых событий (остается похожим, но нужны правки) --- 
 
 @router.callback_query(F.data.startswith("choice_"))
-async def handle_event_choice(callback: types.CallbackQuery, bot: Bot, db_client: AsyncClient):
+async def handle_event_choice(callback: types.CallbackQuery, bot: Bot, db_client: Storage, event_catalog: Optional[EventCatalog] = None, session_cache: Optional[PlayerSessionCache] = None, save_queue: Optional[SaveCoalescer] = None, speculator: Optional[TurnSpeculator] = None):
     """Обработчик нажатия на кнопку выбора варианта игрового события."""
     player_id = callback.from_user.id
     chat_id = callback.message.chat.id # Получаем chat_id для удаления
-    player_state_data = await load_player_state(db_client, player_id)
+    player_state_data = await load_state(db_client, player_id, session_cache)
 
     if not player_state_data:
         await callback.answer("Ошибка: Не найдено состояние игры. Начните заново /start", show_alert=True)
         return
 
+    # В режиме "edit" сообщение с нажатой кнопкой не удаляется, а превращается в следующее
+    edit_message = None
+    if config.RENDER_MODE == "edit" and isinstance(callback.message, types.Message):
+        edit_message = callback.message
+
     # --- Удаляем предыдущие сообщения --- 
-    if player_state_data.message_ids:
-        await delete_player_messages(bot, chat_id, player_state_data.message_ids)
-        player_state_data.message_ids = [] # Очищаем сразу в Pydantic модели
+    stale_message_ids = [msg_id for msg_id in player_state_data.message_ids if edit_message is None or msg_id != edit_message.message_id]
+    if stale_message_ids:
+        await delete_player_messages(bot, chat_id, stale_message_ids, background=config.DELETE_MESSAGES_IN_BACKGROUND)
+    player_state_data.message_ids = [] # Очищаем сразу в Pydantic модели
     # ---------------------------------
 
     event_id = player_state_data.current_event_id
@@ -354,45 +410,65 @@ async def handle_event_choice(callback: types.CallbackQuery, bot: Bot, db_client
         logging.warning(f"No current_event_id found for player {player_id} on choice callback.")
         return
 
-    # Используем импортированную функцию fetch_event_options
-    options_data = await fetch_event_options(db_client, event_id) 
-    if not options_data:
-         await callback.answer("Ошибка: Не удалось загрузить варианты для события.", show_alert=True)
-         logging.error(f"Failed to fetch event options for event {event_id}")
-         return
-
     try:
         choice_index = int(callback.data.split("_")[1])
-        if not 0 <= choice_index < len(options_data):
-            raise IndexError("Choice index out of range")
     except (IndexError, ValueError):
         await callback.answer("Ошибка: Неверный формат кнопки.", show_alert=True)
         logging.error(f"Invalid callback data format for player {player_id}: {callback.data}")
         return
 
-    chosen_option = options_data[choice_index]
-    effects = chosen_option.get('effects', {})
-    # outcome_text = chosen_option.get('outcome_text') # TODO
-    # next_event_name = chosen_option.get('next_event_name') # TODO
-
-    # --- Обновляем объект Player --- 
+    # --- Создаем объект Player --- 
     player = Player(telegram_id=player_id)
-    player.load_country_state(player_state_data.country_state.model_dump())
     player.playthrough_count = player_state_data.playthrough_count
     player.completed_narrative_block_ids = player_state_data.completed_narrative_block_ids
     player.message_ids = [] # Начинаем с пустого списка ID для этого хода
     # -----------------------------
 
-    # --- Применяем эффекты! --- 
-    player.country.update(effects)
-    player.country.current_year += 1
-    logging.info(f"Player {player_id} chose option {choice_index} for event {event_id}. Year: {player.country.current_year}")
+    # Если ход уже просчитан, пока игрок читал событие, берем готовую ветку
+    branch = None
+    if speculator is not None:
+        branch = await speculator.take(player_id, event_id, choice_index, player_state_data.country_state, event_catalog)
+
+    if branch is not None:
+        player.country = branch.country
+        game_over_reason = branch.game_over_reason
+    else:
+        # Варианты берем из каталога в памяти, в БД идем только если каталога нет
+        options_data = event_catalog.get_options(event_id) if event_catalog is not None else []
+        if not options_data:
+            options_data = await fetch_event_options(db_client, event_id)
+        if not options_data:
+             await callback.answer("Ошибка: Не удалось загрузить варианты для события.", show_alert=True)
+             logging.error(f"Failed to fetch event options for event {event_id}")
+             return
+        if not 0 <= choice_index < len(options_data):
+            await callback.answer("Ошибка: Неверный формат кнопки.", show_alert=True)
+            logging.error(f"Choice index out of range for player {player_id}: {callback.data}")
+            return
+
+        chosen_option = options_data[choice_index]
+        # Эффект скомпилирован при загрузке каталога; без каталога - компилируем здесь
+        if event_catalog is not None:
+            effect = event_catalog.get_effect(chosen_option)
+        else:
+            effect = compile_effects(chosen_option.get('effects'), source=f"option {chosen_option.get('id')}")
+        # outcome_text = chosen_option.get('outcome_text') # TODO
+        # next_event_name = chosen_option.get('next_event_name') # TODO
+
+        # --- Применяем эффекты! --- 
+        player.country = country_from_state(player_state_data.country_state)
+        player.country.apply_effect(effect)
+        player.country.current_year += 1
+        # Проверяем условия конца игры
+        game_over_reason = check_game_over_conditions(player.country)
+    logging.info(f"Player {player_id} chose option {choice_index} for event {event_id}{' (speculated)' if branch is not None else ''}. Year: {player.country.current_year}")
     logging.info(f"New state for player {player_id}: {player.country.get_state()}")
 
     # --- Подготовка состояния для сохранения (промежуточного или финального) --- 
-    state_to_save = PlayerState(
+    # Значения уже проверены при загрузке, поэтому состояние собирается без валидации
+    state_to_save = build_player_state(
         telegram_id=player.telegram_id,
-        country_state=CountryState.model_validate(player.country.get_state()),
+        country=player.country,
         playthrough_count=player.playthrough_count,
         completed_narrative_block_ids=player.completed_narrative_block_ids,
         message_ids=[], # Сохраняем пустой список ID перед отправкой нового сообщения
@@ -400,33 +476,35 @@ async def handle_event_choice(callback: types.CallbackQuery, bot: Bot, db_client
     )
     # ------------------------------------------------------------------------
 
-    # Проверяем условия конца игры
-    game_over_reason = check_game_over_conditions(player.country)
     if game_over_reason:
         logging.info(f"Game over for player {player_id}. Reason: {game_over_reason}")
 
         # --- Обновляем состояние для начала новой игры --- 
         new_playthrough_count = state_to_save.playthrough_count + 1
         new_country = Country()
-        state_to_save.country_state = CountryState.model_validate(new_country.get_state())
+        state_to_save.country_state = country_to_state(new_country)
         state_to_save.playthrough_count = new_playthrough_count
         state_to_save.completed_narrative_block_ids = []
         state_to_save.message_ids = [] # ID сообщений остаются пустыми
         # --------------------------------------------------
 
-        await save_player_state(db_client, state_to_save) # Сохраняем состояние для СЛЕДУЮЩЕЙ игры
-        logging.info(f"Player {player_id} state reset for new playthrough {new_playthrough_count}.")
-
         # Отправляем сообщение о конце игры (это будет единственное сообщение)
-        game_over_message = await bot.send_message(
-            chat_id=chat_id,
-            text=f"Игра окончена! {game_over_reason}\n\nНачать новое правление (прохождение #{new_playthrough_count})? /start",
-            reply_markup=None
-        )
-        # Сохраняем ID сообщения о конце игры, чтобы при следующем /start оно удалилось
+        game_over_message = None
+        try:
+            game_over_message = await render_message(
+                bot,
+                chat_id,
+                f"Игра окончена! {game_over_reason}\n\nНачать новое правление (прохождение #{new_playthrough_count})? /start",
+                edit_message=edit_message
+            )
+        except Exception as e:
+            logging.exception(f"Failed to send game over message for player {player_id}: {e}")
+        # Сохраняем ID сообщения о конце игры, чтобы при следующем /start оно удалилось.
+        # Состояние для СЛЕДУЮЩЕЙ игры сохраняется одной записью (раньше - двумя подряд)
         if game_over_message:
             state_to_save.message_ids = [game_over_message.message_id]
-            await save_player_state(db_client, state_to_save)
+        await store_state(db_client, state_to_save, session_cache, save_queue)
+        logging.info(f"Player {player_id} state reset for new playthrough {new_playthrough_count}.")
 
         await callback.answer() # Отвечаем на коллбек
         return
@@ -436,18 +514,25 @@ async def handle_event_choice(callback: types.CallbackQuery, bot: Bot, db_client
 
     # TODO: Показать outcome_text? (Можно отправить отдельным сообщением, которое не удалится?)
 
-    # Используем импортированную функцию get_next_event
-    next_event_data = await get_next_event(db_client, player.country) 
+    # Следующее событие уже выбрано в просчитанной ветке; иначе выбираем сейчас
+    if branch is not None:
+        next_event_data = branch.next_event
+    else:
+        next_event_data = await get_next_event(db_client, player.country, event_catalog)
 
     if next_event_data:
         # Отправляем новое сообщение через обновленную функцию
-        sent_message = await send_event_to_player(callback, player, next_event_data)
+        sent_message = await send_event_to_player(callback, player, next_event_data, edit_message=edit_message, event_catalog=event_catalog)
         if sent_message:
             # Сохраняем состояние с ID нового события И ID нового сообщения
+            player.country.history.record(next_event_data.id)
+            state_to_save.country_state = country_to_state(player.country)
             state_to_save.message_ids = [sent_message.message_id]
             state_to_save.current_event_id = next_event_data.id
-            await save_player_state(db_client, state_to_save)
+            await store_state(db_client, state_to_save, session_cache, save_queue)
             logging.info(f"Saved state for player {player_id} with new event {next_event_data.id} and message {sent_message.message_id}")
+            if speculator is not None:
+                speculator.schedule(player_id, next_event_data, player.country, db_client, event_catalog)
         else:
             logging.error(f"Failed to send next event message for player {player_id}")
             await callback.answer("Ошибка при отправке следующего события.", show_alert=True)
@@ -458,10 +543,12 @@ async def handle_event_choice(callback: types.CallbackQuery, bot: Bot, db_client
         await callback.answer("Не найдено следующее событие.", show_alert=True)
         # Возможно, стоит отправить сообщение об окончании и сохранить состояние?
         await bot.send_message(chat_id, "Похоже, история вашего правления подошла к концу.")
+        if edit_message is not None:
+            await delete_player_messages(bot, chat_id, [edit_message.message_id], background=config.DELETE_MESSAGES_IN_BACKGROUND)
         # Сохраним последнее состояние без current_event_id и без message_ids
         state_to_save.current_event_id = None
         state_to_save.message_ids = []
-        await save_player_state(db_client, state_to_save)
+        await store_state(db_client, state_to_save, session_cache, save_queue)
 
     # Отвечать на callback уже не нужно, т.к. send_event_to_player это делает
     # await callback.answer()
@@ -472,22 +559,66 @@ async def handle_event_choice(callback: types.CallbackQuery, bot: Bot, db_client
 # - Реализовать отправку картинок.
 # - Реализовать показ outcome_text.
 # - Добавить обработку next_event_name.
-# - Улучшить get_next_event (is_unique, max_year).
 # - Удаление сообщений.
 
 # --- Вспомогательная функция для удаления --- 
 
-async def delete_player_messages(bot: Bot, chat_id: int, message_ids: List[int]):
-    """Пытается удалить список сообщений для игрока."""
+# Максимум сообщений в одном вызове deleteMessages (ограничение Bot API)
+DELETE_MESSAGES_LIMIT = 100
+
+# Ссылки на фоновые задачи удаления, чтобы их не собрал сборщик мусора
+_background_cleanup_tasks: set[asyncio.Task] = set()
+
+@traced("delete_messages")
+async def delete_player_messages(bot: Bot, chat_id: int, message_ids: List[int], background: bool = False):
+    """Пытается удалить список сообщений для игрока.
+
+    Использует bulk-метод deleteMessages (пачками по DELETE_MESSAGES_LIMIT),
+    а при ошибке - одиночные удаления с ограниченной параллельностью.
+    При background=True удаление запускается фоновой задачей и не задерживает
+    отправку следующего события.
+    """
+    if not message_ids:
+        return
+    if background:
+        task = asyncio.create_task(_delete_player_messages(bot, chat_id, list(message_ids)))
+        _background_cleanup_tasks.add(task)
+        task.add_done_callback(_background_cleanup_tasks.discard)
+        return
+    await _delete_player_messages(bot, chat_id, message_ids)
+
+async def _delete_player_messages(bot: Bot, chat_id: int, message_ids: List[int]):
     logging.info(f"Attempting to delete {len(message_ids)} messages for chat {chat_id}")
     deleted_count = 0
-    for msg_id in message_ids:
+    for start in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+        chunk = message_ids[start:start + DELETE_MESSAGES_LIMIT]
         try:
-            await bot.delete_message(chat_id=chat_id, message_id=msg_id)
-            deleted_count += 1
+            # Ненайденные сообщения Telegram пропускает сам
+            await bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+            deleted_count += len(chunk)
         except TelegramBadRequest as e:
-            # Частая ошибка: сообщение уже удалено или не найдено
-            logging.warning(f"Failed to delete message {msg_id} for chat {chat_id}: {e}")
+            logging.warning(f"Bulk delete of {len(chunk)} messages failed for chat {chat_id}: {e}. Falling back to single deletes.")
+            deleted_count += await _delete_messages_one_by_one(bot, chat_id, chunk)
         except Exception as e:
-            logging.exception(f"Unexpected error deleting message {msg_id} for chat {chat_id}: {e}")
+            logging.exception(f"Unexpected error bulk deleting messages for chat {chat_id}: {e}")
+            deleted_count += await _delete_messages_one_by_one(bot, chat_id, chunk)
     logging.info(f"Deleted {deleted_count}/{len(message_ids)} messages for chat {chat_id}")
+
+async def _delete_messages_one_by_one(bot: Bot, chat_id: int, message_ids: List[int]) -> int:
+    """Удаляет сообщения по одному, не более DELETE_MESSAGES_CONCURRENCY одновременно."""
+    semaphore = asyncio.Semaphore(config.DELETE_MESSAGES_CONCURRENCY)
+
+    async def delete_one(msg_id: int) -> bool:
+        async with semaphore:
+            try:
+                await bot.delete_message(chat_id=chat_id, message_id=msg_id)
+                return True
+            except TelegramBadRequest as e:
+                # Частая ошибка: сообщение уже удалено или не найдено
+                logging.warning(f"Failed to delete message {msg_id} for chat {chat_id}: {e}")
+            except Exception as e:
+                logging.exception(f"Unexpected error deleting message {msg_id} for chat {chat_id}: {e}")
+            return False
+
+    results = await asyncio.gather(*(delete_one(msg_id) for msg_id in message_ids))
+    return sum(results)
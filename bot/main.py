@@ -1,44 +1,197 @@
 import asyncio
 import logging
+from typing import Optional, Tuple
 
 from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart
 
 import config
 from bot.handlers import router as main_router # Импортируем роутер из handlers.py
-from data.database import init_supabase_client # Импортируем только функцию инициализации
+from bot.middlewares import (
+    ApiMetricsMiddleware,
+    ApiTracingMiddleware,
+    ConcurrencyLimitMiddleware,
+    HandlerMetricsMiddleware,
+    TracingMiddleware,
+)
+from bot.outbound import OutboundScheduler
+from bot.sharding import run_sharded
+from bot.startup import StartupTimer, load_content, warm_game_paths, warm_telegram
+from bot.webhook import run_webhook
+from data.database import init_storage # Импортируем только функцию инициализации
+from data.session_cache import PlayerSessionCache
+from data.storage import Storage
+from data.save_queue import SaveCoalescer
+from game.catalog import EventCatalog
+from game.narrative import NarrativeCatalog
+from game.speculation import TurnSpeculator
+from utils.metrics import OUTBOUND_QUEUE_DEPTH, set_ready, start_metrics_server
+from utils.tracing import TraceRecorder
 
-async def main():
-    """Основная функция для запуска бота."""
-    # Настройка логирования (изменено на INFO)
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+def create_bot() -> Bot:
+    """Создает бота; при заданном config.TELEGRAM_API_URL запросы идут на этот адрес."""
+    if config.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+        return Bot(token=config.TELEGRAM_TOKEN, session=session)
+    return Bot(token=config.TELEGRAM_TOKEN)
+
+async def setup_runtime(global_rate: float = config.TELEGRAM_GLOBAL_RATE, metrics_port: int = config.METRICS_PORT) -> Optional[Tuple[Bot, Dispatcher]]:
+    """Создает хранилище, каталоги, кэши, бота и диспетчер с роутерами и middleware.
 
-    # --- Инициализация клиента Supabase --- 
-    db_client = await init_supabase_client()
-    if not db_client:
-        logging.critical("Failed to initialize Supabase client. Bot cannot start.")
-        return # Не запускаем бота, если нет подключения к БД
-    # --------------------------------------
+    Хранилище с контентом и Telegram API инициализируются параллельно, затем
+    горячий путь хода прогревается вхолостую (bot/startup.py); готовность
+    (/ready и запись в логе) объявляется только после этого.
+    Все созданные компоненты лежат в данных диспетчера (dp["..."]) - по ним
+    shutdown_runtime() закрывает их. Возвращает None, если хранилище или токен недоступны.
+    """
+    timer = StartupTimer()
+    # Эндпоинт поднимается первым: пока идет прогрев, /ready отвечает 503.
+    # Если порт занят, start_metrics_server вернет None и бот запустится без эндпоинта
+    metrics_runner = await timer.run("metrics", start_metrics_server(port=metrics_port)) if config.METRICS_ENABLED else None
 
     # Создание объектов бота и диспетчера
-    bot = Bot(token=config.TELEGRAM_TOKEN)
+    bot = create_bot()
+    # Метрики вызовов API регистрируются первыми, чтобы учитывать и ожидание в планировщике
+    if config.METRICS_ENABLED:
+        bot.session.middleware(ApiMetricsMiddleware())
+    trace_recorder = TraceRecorder() if config.TRACING_ENABLED else None
+    if trace_recorder is not None:
+        bot.session.middleware(ApiTracingMiddleware())
+    # Все исходящие запросы к API проходят через планировщик (лимиты и приоритеты)
+    outbound_scheduler = OutboundScheduler(global_rate=global_rate) if config.OUTBOUND_SCHEDULER_ENABLED else None
+    if outbound_scheduler is not None:
+        bot.session.middleware(outbound_scheduler)
+        OUTBOUND_QUEUE_DEPTH.set_function(
+            lambda: {(priority,): depth for priority, depth in outbound_scheduler.stats()["queued"].items()})
+
+    event_catalog = EventCatalog()
+    narrative_catalog = NarrativeCatalog()
+
+    async def init_storage_and_content() -> Optional[Storage]:
+        # --- Инициализация хранилища (Supabase или SQLite) и загрузка каталогов в память ---
+        storage = await timer.run("storage", init_storage())
+        if storage:
+            await load_content(storage, event_catalog, narrative_catalog, timer)
+        return storage
+
+    db_client, telegram_ok = await asyncio.gather(
+        init_storage_and_content(),
+        timer.run("telegram", warm_telegram(bot)),
+    )
+    if not db_client or not telegram_ok:
+        if not db_client:
+            logging.critical(f"Failed to initialize storage '{config.STORAGE_BACKEND}'. Bot cannot start.")
+        # Не запускаем бота без подключения к БД или с отклоненным токеном
+        if outbound_scheduler is not None:
+            OUTBOUND_QUEUE_DEPTH.remove_function()
+            await outbound_scheduler.close()
+        if trace_recorder is not None:
+            await trace_recorder.close()
+        await bot.session.close()
+        if db_client:
+            await db_client.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        return None
+
+    # --- Кэш сессий игроков с отложенной записью ---
+    session_cache = PlayerSessionCache(db_client) if config.SESSION_CACHE_ENABLED else None
+    # Без кэша сессий записи игроков склеиваются очередью сохранения
+    save_queue = SaveCoalescer(db_client) if session_cache is None and config.SAVE_QUEUE_ENABLED else None
+    # -----------------------------------------------
+
+    # Спекулятивный просчет следующего хода, пока игрок читает событие
+    speculator = TurnSpeculator() if config.SPECULATION_ENABLED else None
+
     dp = Dispatcher()
 
-    # --- Передаем клиент Supabase в контекст --- 
+    # --- Передаем хранилище в контекст --- 
     # Это стандартный способ aiogram передавать данные в хендлеры
     dp["db_client"] = db_client
+    dp["event_catalog"] = event_catalog
+    dp["narrative_catalog"] = narrative_catalog
+    dp["session_cache"] = session_cache
+    dp["save_queue"] = save_queue
+    dp["speculator"] = speculator
+    dp["outbound_scheduler"] = outbound_scheduler
+    dp["trace_recorder"] = trace_recorder
+    dp["metrics_runner"] = metrics_runner
     # Передаем и объект bot, если он нужен в хендлерах не через аргумент
     # dp["bot"] = bot # <- Кажется, это было сделано ранее, проверим, нужно ли
 
     # Подключаем роутер
     dp.include_router(main_router)
+    if config.METRICS_ENABLED:
+        # Inner-middleware: здесь уже известен выбранный хендлер. Регистрируется на диспетчере
+        # (aiogram применяет его и к вложенным роутерам), а не на общем для процесса main_router,
+        # чтобы повторный setup_runtime() не добавлял дубликаты
+        dp.message.middleware(HandlerMetricsMiddleware())
+        dp.callback_query.middleware(HandlerMetricsMiddleware())
+    # Трасса открывается до лимита параллельности, чтобы учитывать и ожидание слота
+    if trace_recorder is not None:
+        dp.update.outer_middleware(TracingMiddleware(trace_recorder))
+    # Ограничиваем число одновременно обрабатываемых апдейтов
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(config.MAX_CONCURRENT_UPDATES))
 
-    # Запуск polling
-    logging.info("Starting bot...")
+    with timer.phase("warmup"):
+        warm_game_paths(event_catalog)
+    if session_cache is not None:
+        session_cache.start()
+    set_ready(True)
+    logging.info(f"Bot is ready: startup took {timer.summary()}.")
+    return bot, dp
+
+
+async def shutdown_runtime(bot: Bot, dp: Dispatcher) -> None:
+    """Закрывает компоненты, созданные setup_runtime()."""
+    set_ready(False)
+    if dp["speculator"] is not None:
+        dp["speculator"].close()
+    if dp["session_cache"] is not None:
+        # Сбрасываем в БД все несохраненные состояния игроков
+        await dp["session_cache"].close()
+    if dp["save_queue"] is not None:
+        await dp["save_queue"].close()
+    if dp["outbound_scheduler"] is not None:
+        OUTBOUND_QUEUE_DEPTH.remove_function()
+        await dp["outbound_scheduler"].close()
+    if dp["metrics_runner"] is not None:
+        await dp["metrics_runner"].cleanup()
+    if dp["trace_recorder"] is not None:
+        await dp["trace_recorder"].close()
+    await bot.session.close()
+    await dp["db_client"].close()
+
+
+async def main():
+    """Основная функция для запуска бота."""
+    # Настройка логирования (изменено на INFO)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    if config.WORKER_PROCESSES > 1:
+        # Входной процесс раздает апдейты рабочим процессам по telegram_id
+        await run_sharded(config.WORKER_PROCESSES)
+        return
+
+    runtime = await setup_runtime()
+    if runtime is None:
+        return
+    bot, dp = runtime
+    allowed_updates = config.ALLOWED_UPDATES or dp.resolve_used_update_types()
+
+    # Запуск polling или webhook
+    logging.info(f"Starting bot in {config.BOT_MODE} mode...")
     try:
-        await dp.start_polling(bot)
+        if config.BOT_MODE == "webhook":
+            await run_webhook(bot, dp, allowed_updates)
+        else:
+            # Вебхук, оставшийся от webhook-режима, мешает getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=allowed_updates)
     finally:
-        await bot.session.close()
+        await shutdown_runtime(bot, dp)
         logging.info("Bot stopped.")
 
 if __name__ == "__main__":
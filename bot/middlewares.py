@@ -0,0 +1,101 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject
+
+from utils.metrics import HANDLER_ERRORS, HANDLER_LATENCY, TELEGRAM_API_LATENCY
+from utils.tracing import TraceRecorder, span
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Ограничивает число одновременно обрабатываемых апдейтов.
+
+    Подключается как outer-middleware на dp.update и работает одинаково
+    в режимах polling и webhook: лишние апдейты ждут свободного слота,
+    не нагружая хранилище и Telegram API сверх лимита.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.in_flight -= 1
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает трассу на каждый апдейт (outer-middleware на dp.update).
+
+    Дочерние спаны пишут функции, помеченные utils.tracing.traced.
+    """
+    def __init__(self, recorder: TraceRecorder):
+        self.recorder = recorder
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_type = getattr(event, "event_type", None) or type(event).__name__
+        with self.recorder.trace(f"update:{update_type}", update_id=getattr(event, "update_id", None)):
+            return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Пишет длительность хендлера в гистограмму с меткой handler (имя функции).
+
+    Подключается как inner-middleware (dp.message.middleware(...)),
+    где в data["handler"] уже известен выбранный хендлер.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Пишет длительность каждого вызова Bot API (bot.session.middleware(...)) с меткой метода."""
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            TELEGRAM_API_LATENCY.observe(time.perf_counter() - start, type(method).__name__, status)
+
+
+class ApiTracingMiddleware(BaseRequestMiddleware):
+    """Записывает каждый вызов Bot API спаном api:<метод> в трассу текущего апдейта."""
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        with span(f"api:{type(method).__name__}"):
+            return await make_request(bot, method)
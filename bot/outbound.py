@@ -0,0 +1,384 @@
+"""Планировщик исходящих запросов к Telegram Bot API.
+
+Подключается как request-middleware сессии бота (bot.session.middleware) и
+пропускает через себя все вызовы API из хендлеров, не меняя их код:
+
+* глобальный token bucket (TELEGRAM_GLOBAL_RATE сообщений в секунду) для
+  методов, создающих/меняющих сообщения, и bucket на каждый чат для отправки
+  новых сообщений (выключается TELEGRAM_CHAT_RATE=0); ответы на коллбеки и
+  удаление сообщений в лимит сообщений не входят и не ждут его;
+* классы приоритетов: показ событий идет раньше массовых рассылок, а запрос,
+  ждущий дольше TELEGRAM_PRIORITY_AGING_SECONDS, поднимается на класс выше
+  (низкие классы не голодают);
+* склейка избыточных операций: повторное удаление того же сообщения и
+  более новое редактирование того же сообщения заменяют ожидающие в очереди;
+* при 429 (TelegramRetryAfter) чат (или весь бот) ставится на паузу
+  на retry_after, а запрос повторяется не более TELEGRAM_MAX_RETRIES раз;
+* статистика очереди - stats().
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    DeleteMessage,
+    DeleteMessages,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    Response,
+    SendMessage,
+    SendPhoto,
+    TelegramMethod,
+)
+
+import config
+
+# Классы приоритетов (меньше - раньше)
+PRIORITY_CALLBACK = 0 # Ответ на нажатие кнопки: игрок ждет, "часики" на кнопке
+PRIORITY_INTERACTIVE = 1 # Показ события/блока в ответ на действие игрока
+PRIORITY_CLEANUP = 2 # Фоновое удаление старых сообщений
+PRIORITY_BULK = 3 # Массовые рассылки (задается через outbound_priority)
+
+PRIORITY_NAMES = {
+    PRIORITY_CALLBACK: "callback",
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_CLEANUP: "cleanup",
+    PRIORITY_BULK: "bulk",
+}
+
+# Методы, которые проходят через планировщик, и их приоритет по умолчанию.
+# Остальные (getUpdates, setWebhook, getMe и т.п.) выполняются сразу.
+METHOD_PRIORITIES = {
+    AnswerCallbackQuery: PRIORITY_CALLBACK,
+    SendMessage: PRIORITY_INTERACTIVE,
+    SendPhoto: PRIORITY_INTERACTIVE,
+    EditMessageText: PRIORITY_INTERACTIVE,
+    EditMessageReplyMarkup: PRIORITY_INTERACTIVE,
+    EditMessageCaption: PRIORITY_INTERACTIVE,
+    DeleteMessage: PRIORITY_CLEANUP,
+    DeleteMessages: PRIORITY_CLEANUP,
+}
+
+# Методы, создающие или меняющие сообщения: на них распространяется глобальный лимит
+MESSAGE_METHODS = (SendMessage, SendPhoto, EditMessageText, EditMessageReplyMarkup, EditMessageCaption)
+# Методы, на которые распространяется лимит сообщений в чат. Редактирования
+# в него не входят: игрок нажимает кнопки быстрее раза в секунду, а правка
+# одного и того же сообщения не засоряет чат
+CHAT_LIMITED_METHODS = (SendMessage, SendPhoto)
+
+# Явно заданный приоритет для запросов текущего контекста (например, рассылки)
+_priority_override: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("outbound_priority", default=None)
+
+
+@contextlib.contextmanager
+def outbound_priority(priority: int) -> Iterator[None]:
+    """Задает приоритет всем запросам к API внутри блока with (например, PRIORITY_BULK для рассылки)."""
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+class TokenBucket:
+    """Token bucket в форме "виртуального расписания" (GCRA).
+
+    reserve() сразу резервирует следующий слот и возвращает, сколько ждать,
+    поэтому одновременные вызовы не требуют блокировок и не обгоняют друг друга.
+    """
+    __slots__ = ("interval", "burst_window", "_next_free")
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.interval = 1.0 / rate
+        self.burst_window = self.interval * max(burst - 1, 0)
+        self._next_free = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Резервирует один токен и возвращает задержку до его появления."""
+        start = max(self._next_free, now - self.burst_window)
+        self._next_free = start + self.interval
+        return max(start - now, 0.0)
+
+    def pause_until(self, moment: float) -> None:
+        """Не выдавать токены раньше moment (после ответа 429)."""
+        self._next_free = max(self._next_free, moment)
+
+    def is_idle(self, now: float) -> bool:
+        return self._next_free + self.burst_window <= now
+
+
+class _Ticket:
+    """Запрос, ожидающий допуска глобальным bucket'ом."""
+    __slots__ = ("priority", "enqueued_at", "admitted", "replacement")
+
+    def __init__(self, priority: int, admitted: asyncio.Future):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.admitted = admitted # True - можно выполнять, False - заменен более новым запросом
+        self.replacement: Optional[asyncio.Future] = None # Результат запроса, который заменил этот
+
+
+def _coalesce_key(method: TelegramMethod) -> Optional[Tuple[Any, ...]]:
+    """Ключ склейки: запросы с одинаковым ключом в очереди заменяют друг друга."""
+    if isinstance(method, DeleteMessage):
+        return ("delete", method.chat_id, method.message_id)
+    if isinstance(method, (EditMessageText, EditMessageReplyMarkup, EditMessageCaption)) and method.message_id:
+        # Новое редактирование того же сообщения тем же методом делает предыдущее ненужным
+        # (правка текста и правка клавиатуры меняют разное и друг друга не заменяют)
+        return ("edit", type(method), method.chat_id, method.message_id)
+    return None
+
+
+def _chain(source: asyncio.Future, target: asyncio.Future) -> None:
+    """Передает результат target в source, когда target завершится."""
+    def relay(done: asyncio.Future) -> None:
+        if source.done():
+            return
+        if done.cancelled():
+            source.cancel()
+        elif done.exception() is not None:
+            source.set_exception(done.exception())
+        else:
+            source.set_result(done.result())
+    target.add_done_callback(relay)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Планировщик исходящих запросов: лимиты, приоритеты, склейка и повтор после 429."""
+
+    # Сколько bucket'ов чатов держать до очистки неактивных
+    MAX_IDLE_CHAT_BUCKETS = 10000
+
+    def __init__(
+        self,
+        global_rate: float = config.TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = config.TELEGRAM_CHAT_RATE,
+        chat_burst: int = config.TELEGRAM_CHAT_BURST,
+        max_retries: int = config.TELEGRAM_MAX_RETRIES,
+        aging_seconds: float = config.TELEGRAM_PRIORITY_AGING_SECONDS,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.aging_seconds = aging_seconds
+        self._global = TokenBucket(global_rate, burst=global_rate)
+        self._chats: Dict[Any, TokenBucket] = {}
+        # Очереди запросов, ждущих глобального bucket'а: FIFO на каждый класс приоритета
+        self._queues: Dict[int, Deque[_Ticket]] = {priority: deque() for priority in PRIORITY_NAMES}
+        self._wakeup = asyncio.Event()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._pending: Dict[Tuple[Any, ...], _Ticket] = {}
+        # Статистика
+        self._queued: Dict[int, int] = {priority: 0 for priority in PRIORITY_NAMES}
+        self.in_flight = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failed_429 = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина очереди по приоритетам и счетчики запросов."""
+        return {
+            "queued": {PRIORITY_NAMES[p]: n for p, n in self._queued.items()},
+            "queued_total": sum(self._queued.values()),
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failed_429": self.failed_429,
+            "chat_buckets": len(self._chats),
+        }
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        priority = METHOD_PRIORITIES.get(type(method))
+        if priority is None:
+            return await make_request(bot, method)
+        override = _priority_override.get()
+        if override is not None:
+            priority = override
+
+        chat_id = getattr(method, "chat_id", None)
+        chat_bucket = None
+        if self.chat_rate > 0 and chat_id is not None and isinstance(method, CHAT_LIMITED_METHODS):
+            chat_bucket = self._chat_bucket(chat_id)
+        # Глобальный лимит расходуют только сообщения (и все запросы рассылок)
+        metered = isinstance(method, MESSAGE_METHODS) or priority == PRIORITY_BULK
+        key = _coalesce_key(method)
+
+        attempt = 0
+        carried: Optional[asyncio.Future] = None # Результат для замененных запросов переносится между попытками
+        while True:
+            if chat_bucket is not None:
+                delay = chat_bucket.reserve(time.monotonic())
+                if delay:
+                    await asyncio.sleep(delay)
+
+            ticket = self._enqueue(priority, key, carried, metered)
+            try:
+                admitted = await ticket.admitted
+            except asyncio.CancelledError:
+                # Вызывающий отменен, пока запрос ждал в очереди: запросы, которые
+                # заменил этот, тоже отменяются (как при отмене выполняющегося запроса)
+                self._finish(key, ticket, exception=asyncio.CancelledError())
+                raise
+            if not admitted:
+                # Запрос заменен более новым такой же операции - отдаем его результат
+                self.coalesced += 1
+                return await ticket.replacement
+
+            self.in_flight += 1
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed_429 += 1
+                    self._finish(key, ticket, exception=e)
+                    raise
+                carried = ticket.replacement
+                if key is not None and self._pending.get(key) is ticket:
+                    del self._pending[key]
+                resume_at = time.monotonic() + e.retry_after
+                if chat_bucket is not None:
+                    chat_bucket.pause_until(resume_at)
+                elif chat_id is None and metered:
+                    self._global.pause_until(resume_at)
+                else:
+                    await asyncio.sleep(e.retry_after)
+                self.retries += 1
+                logging.warning(f"Telegram flood control for {type(method).__name__} (chat {chat_id}): retry in {e.retry_after}s (attempt {attempt}).")
+                continue
+            except BaseException as e:
+                self._finish(key, ticket, exception=e)
+                raise
+            finally:
+                self.in_flight -= 1
+            self.sent += 1
+            self._finish(key, ticket, response=response)
+            return response
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_IDLE_CHAT_BUCKETS:
+                now = time.monotonic()
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.is_idle(now)}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, burst=self.chat_burst)
+        return bucket
+
+    def _enqueue(self, priority: int, key: Optional[Tuple[Any, ...]], carried: Optional[asyncio.Future] = None,
+                 metered: bool = True) -> _Ticket:
+        loop = asyncio.get_running_loop()
+        ticket = _Ticket(priority, loop.create_future())
+        ticket.replacement = carried
+        self._queued[priority] += 1
+        # Запрос покидает очередь, когда его future завершается любым путем: допуск,
+        # замена более новым, отмена вызывающего или остановка планировщика
+        ticket.admitted.add_done_callback(lambda _: self._dequeued(priority))
+        if key is not None:
+            previous = self._pending.get(key)
+            if previous is not None and not previous.admitted.done():
+                # Предыдущий такой же запрос еще не допущен: он (и те, кого заменил он)
+                # получит результат нового
+                shared = previous.replacement or carried or loop.create_future()
+                if carried is not None and previous.replacement is not None and previous.replacement is not carried:
+                    _chain(previous.replacement, carried)
+                    shared = carried
+                previous.replacement = shared
+                previous.admitted.set_result(False)
+                ticket.replacement = shared
+            self._pending[key] = ticket
+        if not metered:
+            # Без глобального лимита: допуск на следующей итерации цикла событий,
+            # чтобы одинаковые запросы из одного прохода успели склеиться
+            loop.call_soon(self._admit, ticket)
+            return ticket
+        self._queues[priority].append(ticket)
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        self._wakeup.set()
+        return ticket
+
+    @staticmethod
+    def _admit(ticket: _Ticket) -> None:
+        if not ticket.admitted.done():
+            ticket.admitted.set_result(True)
+
+    def _dequeued(self, priority: int) -> None:
+        self._queued[priority] -= 1
+
+    def _next_ticket(self, now: float) -> Optional[_Ticket]:
+        """Выбирает следующий запрос: наивысший класс с учетом старения.
+
+        Эффективный приоритет = класс - время ожидания / aging_seconds, поэтому
+        запрос низкого класса, ждущий достаточно долго, обгоняет новые запросы
+        более высоких. Внутри класса очередь FIFO, так что сравниваются только головы.
+        """
+        best: Optional[_Ticket] = None
+        best_rank = 0.0
+        for priority, queue in self._queues.items():
+            # Замененные и отмененные запросы убираем из головы, чтобы не тратить на них токены
+            while queue and queue[0].admitted.done():
+                queue.popleft()
+            if not queue:
+                continue
+            rank = priority
+            if self.aging_seconds > 0:
+                rank -= (now - queue[0].enqueued_at) / self.aging_seconds
+            if best is None or rank < best_rank:
+                best, best_rank = queue[0], rank
+        return best
+
+    def _finish(self, key: Optional[Tuple[Any, ...]], ticket: _Ticket, response: Any = None,
+                exception: Optional[BaseException] = None) -> None:
+        if key is not None and self._pending.get(key) is ticket:
+            del self._pending[key]
+        replaced = ticket.replacement
+        if replaced is not None and not replaced.done():
+            # Передаем результат запросам, которые заменил этот
+            ticket.replacement = None
+            if isinstance(exception, asyncio.CancelledError):
+                replaced.cancel()
+            elif exception is not None:
+                replaced.set_exception(exception)
+                replaced.exception() # Помечаем исключение полученным, если его никто не ждет
+            else:
+                replaced.set_result(response)
+
+    async def _pump(self) -> None:
+        """Выдает допуск запросам в порядке приоритета со скоростью глобального bucket'а."""
+        while True:
+            if self._next_ticket(time.monotonic()) is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            # Задержку берем до выбора запроса, чтобы за время ожидания
+            # в очередь успели попасть более приоритетные
+            delay = self._global.reserve(time.monotonic())
+            if delay:
+                await asyncio.sleep(delay)
+            ticket = self._next_ticket(time.monotonic())
+            if ticket is not None:
+                self._queues[ticket.priority].popleft()
+                ticket.admitted.set_result(True)
+
+    async def close(self) -> None:
+        """Останавливает выдачу допусков (вызывать при остановке бота)."""
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._pump_task
+        for queue in self._queues.values():
+            for ticket in queue:
+                if not ticket.admitted.done():
+                    ticket.admitted.cancel()
+            queue.clear()
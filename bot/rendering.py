@@ -0,0 +1,92 @@
+"""Готовые сообщения событий: текст без статус-блока и клавиатура вариантов.
+
+Для каждого события текущего снимка каталога текст (описание с репликой персонажа)
+и InlineKeyboardMarkup строятся один раз; объекты aiogram неизменяемы, поэтому
+одна клавиатура разделяется всеми игроками. На каждом ходу подставляется только
+статус-блок страны. При смене снимка каталога кэш сбрасывается: при запуске он
+заполняется целиком (rebuild), после горячего обновления - по мере показа событий.
+"""
+from typing import Any, Dict, List, Optional
+
+from aiogram import types
+
+from game.catalog import CatalogSnapshot, EventCatalog, option_order
+from game.core import Country
+from game.events import EventData
+
+
+class RenderedEvent:
+    __slots__ = ("body", "keyboard")
+
+    def __init__(self, body: str, keyboard: types.InlineKeyboardMarkup):
+        self.body = body # Описание с репликой персонажа, без статус-блока
+        self.keyboard = keyboard
+
+
+def render_event_body(description: str, character_name: Optional[str]) -> str:
+    if character_name:
+        return f"**{character_name}:**\n{description}"
+    return description
+
+
+def build_event_keyboard(options: List[Dict[str, Any]]) -> types.InlineKeyboardMarkup:
+    """Клавиатура вариантов по одному в ряд, в порядке display_order (как в game/speculation.py)."""
+    ordered = sorted(options, key=option_order)
+    return types.InlineKeyboardMarkup(inline_keyboard=[
+        [types.InlineKeyboardButton(text=opt.get('button_text', '???'), callback_data=f"choice_{i}")]
+        for i, opt in enumerate(ordered)
+    ])
+
+
+def render_event(event_data: EventData) -> RenderedEvent:
+    return RenderedEvent(render_event_body(event_data.description, event_data.character_name),
+                         build_event_keyboard(event_data.options))
+
+
+def render_status(country: Country) -> str:
+    """Статус-блок страны - единственная часть сообщения, которая строится на каждом ходу."""
+    return (f"\n\n*Год:* {country.current_year}"
+            f"\n*Поддержка:* {country.support}"
+            f"\n*Казна:* {country.treasury}"
+            f"\n*Армия:* {country.army.capitalize()}" # low -> Low
+            f"\n*Крестьяне:* {country.peasants.capitalize()}")
+
+
+class EventRenderCache:
+    """Готовые сообщения событий для текущего снимка каталога."""
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._events: Dict[int, RenderedEvent] = {}
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def rebuild(self, event_catalog: EventCatalog) -> None:
+        """Строит сообщения всех событий с вариантами ответа (при запуске, после загрузки контента)."""
+        snapshot = event_catalog.snapshot
+        events: Dict[int, RenderedEvent] = {}
+        if snapshot is not None:
+            for event_id, options in snapshot.options_by_event.items():
+                row = snapshot.events_by_id.get(event_id)
+                if row is not None and options:
+                    events[event_id] = RenderedEvent(render_event_body(row['description'], row.get('character_name')),
+                                                     build_event_keyboard(options))
+        self._snapshot, self._events = snapshot, events
+
+    def get(self, event_data: EventData, event_catalog: Optional[EventCatalog] = None) -> RenderedEvent:
+        """Возвращает готовое сообщение события; события не из каталога рендерятся без кэша."""
+        snapshot = event_catalog.snapshot if event_catalog is not None else None
+        if snapshot is None or snapshot.events_by_id.get(event_data.id) is None:
+            return render_event(event_data)
+        if snapshot is not self._snapshot:
+            # Новая версия контента: старые сообщения могли измениться
+            self._snapshot, self._events = snapshot, {}
+        rendered = self._events.get(event_data.id)
+        if rendered is None:
+            rendered = self._events[event_data.id] = render_event(event_data)
+        return rendered
+
+
+# Один кэш на процесс: как и каталог, он общий для всех игроков
+EVENT_RENDERS = EventRenderCache()
@@ -0,0 +1,270 @@
+"""Многопроцессный режим: входной процесс раздает апдейты рабочим процессам.
+
+Входной процесс только получает апдейты (long polling getUpdates или webhook),
+находит в каждом id пользователя и пересылает "сырой" JSON рабочему процессу
+shard_for(update). Все ходы одного игрока попадают в один и тот же процесс,
+поэтому кэш сессий, спекулятивный просчет и лимиты чата остаются локальными
+и согласованными. Каждый рабочий процесс - обычный бот (setup_runtime из
+bot/main.py) без собственного получения апдейтов.
+
+Апдейты передаются по socketpair строками JSON (по одному апдейту на строку).
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import signal
+import socket
+from typing import Any, Dict, List, Optional, Set
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.types import Update
+from aiohttp import web
+
+import config
+
+# Ключи объектов апдейта, в которых лежит пользователь (message -> "from", poll_answer -> "user")
+_USER_KEYS = ("from", "user")
+
+
+def shard_key(update: Dict[str, Any]) -> int:
+    """Ключ шардирования апдейта: id пользователя, иначе id чата, иначе update_id."""
+    for name, value in update.items():
+        if name == "update_id" or not isinstance(value, dict):
+            continue
+        for key in _USER_KEYS:
+            user = value.get(key)
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return update.get("update_id", 0)
+
+
+def shard_for(update: Dict[str, Any], workers: int) -> int:
+    """Номер рабочего процесса для апдейта (стабилен между перезапусками)."""
+    return shard_key(update) % workers
+
+
+# --- Рабочий процесс ---
+
+def _worker_entry(index: int, workers: int, sock: socket.socket) -> None:
+    # Ctrl+C получает вся группа процессов; рабочий завершается, когда входной процесс закроет канал
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - %(levelname)s - worker-{index} - %(name)s - %(message)s')
+    asyncio.run(_run_worker(index, workers, sock))
+
+
+async def _feed(dp: Dispatcher, bot: Bot, update: Update) -> None:
+    try:
+        await dp.feed_update(bot, update)
+    except Exception:
+        logging.exception(f"Failed to process update {update.update_id}")
+
+
+async def _run_worker(index: int, workers: int, sock: socket.socket) -> None:
+    from bot.main import setup_runtime, shutdown_runtime # bot.main импортирует этот модуль
+
+    runtime = await setup_runtime(
+        global_rate=config.TELEGRAM_GLOBAL_RATE / workers,
+        metrics_port=config.METRICS_PORT + 1 + index,
+    )
+    if runtime is None:
+        sock.close() # Входной процесс увидит закрытый канал и остановится
+        return
+    bot, dp = runtime
+    reader, writer = await asyncio.open_connection(sock=sock)
+    logging.info(f"Worker {index}/{workers} is ready.")
+    tasks: Set[asyncio.Task] = set()
+    try:
+        while line := await reader.readline():
+            update = Update.model_validate_json(line, context={"bot": bot})
+            task = asyncio.create_task(_feed(dp, bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            logging.info(f"Waiting for {len(tasks)} in-flight updates...")
+            await asyncio.gather(*tasks, return_exceptions=True)
+        writer.close()
+        await shutdown_runtime(bot, dp)
+        logging.info(f"Worker {index} stopped.")
+
+
+# --- Входной процесс ---
+
+class ShardRouter:
+    """Запускает рабочие процессы и пересылает им апдейты по ключу шардирования."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.failed = asyncio.Event() # Рабочий процесс завершился раньше времени
+        self.routed = [0] * workers
+        self._processes: List[multiprocessing.Process] = []
+        self._writers: List[asyncio.StreamWriter] = []
+        self._watchers: List[asyncio.Task] = []
+        self._closing = False
+
+    async def start(self) -> None:
+        # spawn: рабочему не нужны копии event loop и соединений входного процесса
+        context = multiprocessing.get_context("spawn")
+        for index in range(self.workers):
+            parent_sock, child_sock = socket.socketpair()
+            process = context.Process(target=_worker_entry, args=(index, self.workers, child_sock),
+                                      name=f"bot-worker-{index}", daemon=False)
+            process.start()
+            child_sock.close()
+            reader, writer = await asyncio.open_connection(sock=parent_sock)
+            self._processes.append(process)
+            self._writers.append(writer)
+            self._watchers.append(asyncio.create_task(self._watch(index, reader)))
+        logging.info(f"Started {self.workers} worker processes.")
+
+    async def _watch(self, index: int, reader: asyncio.StreamReader) -> None:
+        # Рабочий ничего не пишет в канал: EOF означает, что процесс завершился
+        await reader.read()
+        if not self._closing:
+            logging.critical(f"Worker {index} exited unexpectedly (exit code {self._processes[index].exitcode}).")
+            self.failed.set()
+
+    def route(self, update: Dict[str, Any], raw: Optional[bytes] = None) -> None:
+        """Ставит апдейт в канал его рабочего процесса (raw - исходное тело, если есть)."""
+        index = shard_for(update, self.workers)
+        if raw is None:
+            raw = json.dumps(update, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        else:
+            # Перевод строки в JSON вне строк - пробельный символ, внутри строк он экранирован
+            raw = raw.replace(b"\n", b" ")
+        self._writers[index].write(raw + b"\n")
+        self.routed[index] += 1
+
+    async def drain(self) -> None:
+        """Ждет, пока каналы рабочих примут накопленные данные (обратное давление)."""
+        for writer in self._writers:
+            await writer.drain()
+
+    async def close(self, timeout: float = 60.0) -> None:
+        """Закрывает каналы и ждет, пока рабочие доработают начатые апдейты."""
+        self._closing = True
+        for writer in self._writers:
+            writer.close()
+        for process in self._processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logging.warning(f"Worker {process.name} did not stop in {timeout}s, terminating.")
+                process.terminate()
+        for watcher in self._watchers:
+            watcher.cancel()
+        await asyncio.gather(*self._watchers, return_exceptions=True)
+        logging.info(f"Workers stopped. Routed updates per worker: {self.routed}")
+
+
+def _used_update_types() -> List[str]:
+    from bot.handlers import router as main_router
+
+    dp = Dispatcher()
+    dp.include_router(main_router)
+    return dp.resolve_used_update_types()
+
+
+def _api_server() -> TelegramAPIServer:
+    return TelegramAPIServer.from_base(config.TELEGRAM_API_URL) if config.TELEGRAM_API_URL else PRODUCTION
+
+
+async def _poll_updates(router: ShardRouter, allowed_updates: List[str]) -> None:
+    """Long polling getUpdates без разбора апдейтов в модели aiogram."""
+    server = _api_server()
+    backoff = 1.0
+    offset: Optional[int] = None
+    async with aiohttp.ClientSession() as session:
+        # Вебхук, оставшийся от webhook-режима, мешает getUpdates
+        async with session.post(server.api_url(config.TELEGRAM_TOKEN, "deleteWebhook")) as response:
+            await response.read()
+        logging.info("Polling updates for sharded workers...")
+        url = server.api_url(config.TELEGRAM_TOKEN, "getUpdates")
+        while True:
+            payload = {"timeout": config.POLLING_TIMEOUT, "allowed_updates": allowed_updates}
+            if offset is not None:
+                payload["offset"] = offset
+            try:
+                async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=config.POLLING_TIMEOUT + 10)) as response:
+                    result = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.warning(f"getUpdates failed: {e}. Retrying in {backoff:.0f}s.")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            if not result.get("ok"):
+                retry_after = (result.get("parameters") or {}).get("retry_after") or backoff
+                logging.warning(f"getUpdates error: {result.get('description')}. Retrying in {retry_after}s.")
+                await asyncio.sleep(retry_after)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            for update in result["result"]:
+                offset = update["update_id"] + 1
+                router.route(update)
+            await router.drain()
+
+
+async def _serve_webhook(router: ShardRouter, allowed_updates: List[str]) -> None:
+    """Принимает вебхук и пересылает тело запроса рабочему процессу без повторной сериализации."""
+    from bot.main import create_bot
+    from bot.webhook import register_webhook
+
+    allowed = frozenset(allowed_updates)
+
+    async def handle(request: web.Request) -> web.Response:
+        if config.WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != config.WEBHOOK_SECRET:
+            return web.Response(status=401)
+        body = await request.read()
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        if allowed.intersection(update):
+            router.route(update, raw=body)
+            await router.drain()
+        else:
+            logging.debug(f"Skipping update {update.get('update_id')}: type is not allowed.")
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(config.WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT).start()
+    logging.info(f"Webhook ingress listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+    bot = create_bot()
+    try:
+        await register_webhook(bot, allowed_updates)
+        await asyncio.Event().wait() # Работаем, пока задачу не отменят
+    finally:
+        await bot.session.close()
+        await runner.cleanup()
+
+
+async def run_sharded(workers: int) -> None:
+    """Запускает рабочие процессы и входной процесс в режиме config.BOT_MODE."""
+    router = ShardRouter(workers)
+    await router.start()
+    allowed_updates = config.ALLOWED_UPDATES or _used_update_types()
+    if config.BOT_MODE == "webhook":
+        ingress = asyncio.create_task(_serve_webhook(router, allowed_updates))
+    else:
+        ingress = asyncio.create_task(_poll_updates(router, allowed_updates))
+    failed = asyncio.create_task(router.failed.wait())
+    logging.info(f"Starting sharded bot in {config.BOT_MODE} mode with {workers} workers...")
+    try:
+        done, _ = await asyncio.wait({ingress, failed}, return_when=asyncio.FIRST_COMPLETED)
+        if ingress in done:
+            ingress.result() # Пробрасываем ошибку входного процесса
+    finally:
+        for task in (ingress, failed):
+            task.cancel()
+        await asyncio.gather(ingress, failed, return_exceptions=True)
+        await router.close()
+        logging.info("Bot stopped.")
@@ -0,0 +1,147 @@
+"""Параллельный прогретый запуск бота.
+
+Независимые фазы запуска (хранилище и контент, Telegram API) выполняются
+одновременно. До приема апдейтов заранее открываются соединения и вхолостую
+проходится горячий путь хода, чтобы первые игроки после деплоя не платили за
+TLS-рукопожатия и холодные кэши. Длительность каждой фазы пишется в лог и в
+метрику bot_startup_phase_seconds; /ready отвечает 200 только после прогрева.
+"""
+import asyncio
+import contextlib
+import gc
+import logging
+import time
+from typing import Awaitable, Dict, Iterator, TypeVar
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramUnauthorizedError
+
+import config
+from bot.rendering import EVENT_RENDERS, render_status
+from data.codec import build_player_state, country_from_state, player_state_to_row
+from data.models import PlayerState
+from data.storage import Storage
+from game.catalog import EventCatalog
+from game.core import Country
+from game.events import select_event_from_catalog
+from game.narrative import NarrativeCatalog
+from utils.metrics import STARTUP_PHASE_SECONDS
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    """Замеряет фазы запуска (фазы могут идти параллельно)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        STARTUP_PHASE_SECONDS.set_function(lambda: {(name,): seconds for name, seconds in self.phases.items()})
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+            logging.info(f"Startup phase '{name}' took {self.phases[name] * 1000:.0f} ms.")
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        with self.phase(name):
+            return await awaitable
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items())
+        return f"{(time.perf_counter() - self.started) * 1000:.0f} ms ({phases})"
+
+
+async def warm_telegram(bot: Bot, connections: int = config.STARTUP_WARM_CONNECTIONS) -> bool:
+    """Проверяет токен (getMe) и открывает соединения с Telegram API.
+
+    Параллельные запросы открывают несколько соединений, которые остаются
+    в пуле сессии. Returns: False, если Telegram отклонил токен; сетевые ошибки
+    только логируются - polling и вебхук повторят попытку сами.
+    """
+    results = await asyncio.gather(*(bot.get_me() for _ in range(max(connections, 1))), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if any(isinstance(error, TelegramUnauthorizedError) for error in errors):
+        logging.critical("Telegram rejected the bot token. Bot cannot start.")
+        return False
+    if len(errors) == len(results):
+        logging.warning(f"Telegram API warm-up failed: {errors[0]}")
+    else:
+        me = next(result for result in results if not isinstance(result, BaseException))
+        logging.info(f"Connected to Telegram as @{me.username} ({len(results) - len(errors)} connections warmed).")
+    return True
+
+
+async def warm_storage(db_client: Storage, connections: int = config.STARTUP_WARM_CONNECTIONS) -> None:
+    """Открывает соединения с хранилищем пустыми чтениями (игрока с ID 0 нет)."""
+    results = await asyncio.gather(*(db_client.fetch_player_row(0) for _ in range(max(connections, 1))), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        logging.warning(f"Storage warm-up failed for {len(errors)} of {len(results)} connections: {errors[0]}")
+
+
+@contextlib.contextmanager
+def paused_gc() -> Iterator[None]:
+    """Выключает GC на время блока и восстанавливает прежнее состояние."""
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+async def load_content(db_client: Storage, event_catalog: EventCatalog, narrative_catalog: NarrativeCatalog, timer: StartupTimer) -> None:
+    """Загружает каталоги и прогревает соединения с хранилищем одновременно."""
+    # Снимки - сотни тысяч контейнеров: без паузы GC распаковка в разы медленнее.
+    # Апдейты еще не принимаются, так что пауза касается только загрузки; горячие
+    # перезагрузки каталогов во время игры идут с включенным GC
+    with paused_gc():
+        event_loaded, narrative_loaded, _ = await asyncio.gather(
+            timer.run("event_catalog", event_catalog.load(db_client)),
+            timer.run("narrative_catalog", narrative_catalog.load(db_client)),
+            timer.run("storage_warmup", warm_storage(db_client)),
+        )
+    if not event_loaded:
+        # Бот может работать и без каталога (события будут читаться из БД), но медленнее
+        logging.warning("Event catalog was not loaded. Falling back to per-turn database queries.")
+    if not narrative_loaded:
+        logging.warning("Narrative catalog was not loaded. Falling back to per-click database queries.")
+
+
+def warm_game_paths(event_catalog: EventCatalog) -> None:
+    """Готовит сообщения всех событий и проходит горячий путь хода вхолостую:
+    выбор события, текст, эффект, сборка и разбор состояния."""
+    try:
+        EVENT_RENDERS.rebuild(event_catalog)
+        logging.info(f"Pre-rendered {len(EVENT_RENDERS)} event messages.")
+        country = Country()
+        event_data = select_event_from_catalog(event_catalog, country) if event_catalog.is_loaded else None
+        if event_data is not None:
+            EVENT_RENDERS.get(event_data, event_catalog).body + render_status(country)
+            if event_data.options:
+                country.apply_effect(event_catalog.get_effect(event_data.options[0]))
+            country.history.record(event_data.id)
+        row = player_state_to_row(build_player_state(1, country, 1, []))
+        player_state = PlayerState.model_validate({
+            "telegram_id": row["telegram_id"],
+            "country_state": row["state"],
+            "current_event_id": row["current_event_id"],
+            "playthrough_count": row["playthrough_count"],
+            "completed_narrative_block_ids": row["completed_narrative_block_ids"],
+            "message_ids": row["message_ids"],
+        })
+        country_from_state(player_state.country_state)
+    except Exception as e:
+        # Ошибка здесь повторится у игроков, но запуск она не блокирует
+        logging.exception(f"Warm-up turn failed: {e}")
+
+    # Снимки каталогов - сотни тысяч долгоживущих объектов: после freeze полные
+    # сборки мусора во время игры их больше не обходят
+    gc.collect()
+    gc.freeze()
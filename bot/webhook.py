@@ -0,0 +1,99 @@
+"""Режим webhook: aiohttp-сервер, принимающий апдейты от Telegram.
+
+Запрос подтверждается ответом 200 сразу после чтения тела, а апдейт
+обрабатывается в фоне (число одновременно обрабатываемых апдейтов
+ограничивает ConcurrencyLimitMiddleware из bot/middlewares.py).
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+import config
+
+
+class BackgroundRequestHandler(SimpleRequestHandler):
+    """SimpleRequestHandler с обработкой в фоне, фильтрацией типов апдейтов и ожиданием фоновых задач при остановке.
+
+    Фоновая обработка реализована здесь через публичный handle(), а не через
+    внутренние методы aiogram: фоновые задачи хранятся в собственном множестве.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, allowed_updates: Optional[List[str]] = None, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self.allowed_updates = frozenset(allowed_updates) if allowed_updates else None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        # Telegram сам фильтрует апдейты по allowed_updates из setWebhook;
+        # локальная проверка защищает от старых настроек вебхука и посторонних запросов
+        if self.allowed_updates is not None and not self.allowed_updates.intersection(update):
+            logging.debug(f"Skipping update {update.get('update_id')}: type is not allowed.")
+        else:
+            task = asyncio.create_task(self._feed_update(bot, update))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # Отвечаем сразу, не дожидаясь обработки
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def _feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        if isinstance(result, TelegramMethod):
+            # Ответ хендлера в виде метода API выполняется отдельным запросом
+            await self.dispatcher.silent_call_request(bot=bot, result=result)
+
+    async def close(self) -> None:
+        """Дожидается апдейтов, которые еще обрабатываются, и закрывает сессию бота."""
+        if self._tasks:
+            logging.info(f"Waiting for {len(self._tasks)} in-flight updates...")
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await super().close()
+
+
+async def register_webhook(bot: Bot, allowed_updates: List[str]) -> None:
+    """Регистрирует вебхук WEBHOOK_BASE_URL + WEBHOOK_PATH в Telegram."""
+    webhook_url = config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+    await bot.set_webhook(
+        url=webhook_url,
+        secret_token=config.WEBHOOK_SECRET or None,
+        allowed_updates=allowed_updates,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=config.WEBHOOK_DROP_PENDING_UPDATES,
+    )
+    logging.info(f"Webhook set to {webhook_url} (allowed updates: {allowed_updates})")
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, allowed_updates: List[str]) -> None:
+    """Запускает aiohttp-сервер, регистрирует вебхук в Telegram и работает до отмены."""
+    app = web.Application()
+    handler = BackgroundRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        allowed_updates=allowed_updates,
+        secret_token=config.WEBHOOK_SECRET or None,
+    )
+    handler.register(app, path=config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT)
+    await site.start()
+    logging.info(f"Webhook server listening on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+
+    try:
+        await register_webhook(bot, allowed_updates)
+        await asyncio.Event().wait() # Работаем, пока задачу не отменят
+    finally:
+        # Закрытие приложения вызывает handler.close() и хуки остановки диспетчера
+        await runner.cleanup()
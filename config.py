@@ -6,6 +6,82 @@ load_dotenv() # Загружает переменные из .env файла
 # Токен Telegram бота
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "YOUR_TELEGRAM_TOKEN_HERE")
 
+# Базовый URL Bot API. Пустое значение - https://api.telegram.org;
+# можно указать локальный Bot API сервер или фейковый endpoint для тестов
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# --- Режим получения апдейтов ---
+# "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Максимум апдейтов, обрабатываемых одновременно (в обоих режимах)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "100"))
+# Типы апдейтов через запятую (например, "message,callback_query").
+# Пустое значение - только типы, для которых зарегистрированы хендлеры
+ALLOWED_UPDATES = [t.strip() for t in os.getenv("ALLOWED_UPDATES", "").split(",") if t.strip()]
+
+# --- Шардирование по процессам ---
+# Число рабочих процессов. При значении > 1 входной процесс (polling/webhook)
+# раздает апдейты рабочим по telegram_id игрока; лимиты MAX_CONCURRENT_UPDATES и
+# кэши действуют в каждом рабочем процессе, TELEGRAM_GLOBAL_RATE делится между ними,
+# метрики рабочего i отдаются на порту METRICS_PORT + 1 + i
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+# Таймаут long polling getUpdates во входном процессе, секунды
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+
+# --- Параметры webhook (если BOT_MODE=webhook) ---
+# Публичный адрес, по которому Telegram доступен бот (https://example.com)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Адрес и порт локального aiohttp-сервера
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Максимум одновременных HTTPS-соединений Telegram к вебхуку (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_DROP_PENDING_UPDATES = os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "false").lower() == "true"
+
+# --- Планировщик исходящих запросов к Telegram ---
+OUTBOUND_SCHEDULER_ENABLED = os.getenv("OUTBOUND_SCHEDULER_ENABLED", "true").lower() == "true"
+# Общий лимит запросов бота в секунду (Telegram: около 30 сообщений в секунду)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+# Лимит новых сообщений в один чат в секунду и допустимый всплеск (редактирования не ограничиваются).
+# Telegram советует не чаще 1 сообщения в секунду в чат, но короткие всплески терпит:
+# большой всплеск не задерживает обычную игру (1-2 сообщения на ход), а при длинной
+# серии быстрых нажатий ответы растягиваются до TELEGRAM_CHAT_RATE в секунду.
+# Меньший всплеск снижает риск 429 ценой задержки ответов; 0 в TELEGRAM_CHAT_RATE
+# выключает лимит (остаются глобальный лимит и повтор после 429).
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "10"))
+# Через сколько секунд ожидания запрос поднимается на один класс приоритета (0 - без старения)
+TELEGRAM_PRIORITY_AGING_SECONDS = float(os.getenv("TELEGRAM_PRIORITY_AGING_SECONDS", "2"))
+# Сколько раз повторять запрос после ответа 429 (Too Many Requests)
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+
+# --- Метрики (Prometheus) ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Эндпоинт http://METRICS_HOST:METRICS_PORT/metrics (по умолчанию только локально)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# --- Запуск ---
+# Сколько соединений с Telegram API и хранилищем открыть заранее, до приема апдейтов
+STARTUP_WARM_CONNECTIONS = int(os.getenv("STARTUP_WARM_CONNECTIONS", "4"))
+
+# --- Трассировка апдейтов ---
+# По умолчанию выключена: включается для разбора задержек на время расследования
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+# Доля апдейтов, трассы которых сохраняются (0.01 = 1%)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# Апдейты дольше этого порога сохраняются всегда, мс
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+# Каталог для файлов трасс (формат Chrome Trace Event); относительный путь - от корня проекта
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv("TRACE_DIR", "traces"))
+# Сколько последних файлов трасс хранить (более старые удаляются); 0 - без ограничения
+TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", "200"))
+# Сколько трасс накапливать перед записью файла
+TRACE_FLUSH_EVERY = int(os.getenv("TRACE_FLUSH_EVERY", "50"))
+
 # Параметры подключения к Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL", "YOUR_SUPABASE_URL_HERE")
 # Ключ ANON (может понадобиться для других целей, но НЕ для основного бота)
@@ -13,8 +89,89 @@ SUPABASE_ANON_KEY = os.getenv("SUPABASE_KEY", "YOUR_SUPABASE_ANON_KEY_HERE")
 # Ключ SERVICE_ROLE (для серверных операций бота)
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "YOUR_SUPABASE_SERVICE_KEY_HERE")
 
+# --- HTTP-клиент Supabase ---
+# HTTP/2 мультиплексирует запросы в одном соединении (нужен пакет h2: pip install httpx[http2])
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+# Размер пула соединений и сколько из них держать открытыми между запросами
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY_SECONDS", "60"))
+# Таймауты: установка соединения и ожидание свободного соединения из пула
+SUPABASE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_CONNECT_TIMEOUT_SECONDS", "3"))
+SUPABASE_POOL_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_POOL_TIMEOUT_SECONDS", "2"))
+# Предельное время одной попытки: запросы игроков и выгрузка контента (каталоги)
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "5"))
+SUPABASE_CONTENT_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_CONTENT_TIMEOUT_SECONDS", "30"))
+# Повторы при сетевых ошибках, таймаутах и 5xx (все запросы бота идемпотентны)
+SUPABASE_RETRY_ATTEMPTS = int(os.getenv("SUPABASE_RETRY_ATTEMPTS", "3"))
+SUPABASE_RETRY_BASE_DELAY_SECONDS = float(os.getenv("SUPABASE_RETRY_BASE_DELAY_SECONDS", "0.1"))
+SUPABASE_RETRY_MAX_DELAY_SECONDS = float(os.getenv("SUPABASE_RETRY_MAX_DELAY_SECONDS", "2"))
+# Предохранитель: после стольких ошибок подряд запросы отклоняются сразу на BREAKER_RESET секунд
+SUPABASE_BREAKER_FAILURES = int(os.getenv("SUPABASE_BREAKER_FAILURES", "10"))
+SUPABASE_BREAKER_RESET_SECONDS = float(os.getenv("SUPABASE_BREAKER_RESET_SECONDS", "15"))
+# Сколько запросов к Supabase может выполняться одновременно; остальные отклоняются сразу
+SUPABASE_MAX_PENDING = int(os.getenv("SUPABASE_MAX_PENDING", "200"))
+
+# --- Кэш каталога событий ---
+# Как часто (в секундах) перечитывать события и варианты ответов из БД
+EVENT_CATALOG_TTL_SECONDS = int(os.getenv("EVENT_CATALOG_TTL_SECONDS", "300"))
+# Загружать варианты ответов вместе с событиями одним запросом (встраивание PostgREST).
+# Требует внешнего ключа event_options.event_id -> events.id
+EVENTS_EMBED_OPTIONS = os.getenv("EVENTS_EMBED_OPTIONS", "true").lower() == "true"
+
+# --- Пакет контента ---
+# Путь к скомпилированному пакету (python -m game.bundle). Если задан, каталоги
+# загружаются из файла, а не из БД; новая версия файла подхватывается без перезапуска
+CONTENT_BUNDLE_PATH = os.getenv("CONTENT_BUNDLE_PATH", "")
+# Как часто (в секундах) проверять, не заменен ли файл пакета
+CONTENT_BUNDLE_CHECK_SECONDS = float(os.getenv("CONTENT_BUNDLE_CHECK_SECONDS", "10"))
+
+# --- История событий игрока ---
+# Сколько последних показанных событий не может выпасть снова (0 - без ограничения)
+EVENT_REPEAT_COOLDOWN = int(os.getenv("EVENT_REPEAT_COOLDOWN", "5"))
+
+# --- Кэш сессий игроков (write-behind) ---
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"
+# Максимум игроков в памяти одного процесса (дальше - вытеснение LRU)
+SESSION_CACHE_MAX_PLAYERS = int(os.getenv("SESSION_CACHE_MAX_PLAYERS", "10000"))
+# Через сколько секунд простоя игрок вытесняется из памяти
+SESSION_CACHE_IDLE_SECONDS = int(os.getenv("SESSION_CACHE_IDLE_SECONDS", "900"))
+# Как часто изменения сбрасываются в БД
+SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "5"))
+
+# --- Очередь сохранения (склейка upsert'ов разных игроков) ---
+# Используется, когда кэш сессий выключен
+SAVE_QUEUE_ENABLED = os.getenv("SAVE_QUEUE_ENABLED", "true").lower() == "true"
+# Окно накопления записей перед bulk upsert, мс
+SAVE_QUEUE_WINDOW_MS = int(os.getenv("SAVE_QUEUE_WINDOW_MS", "50"))
+# Максимум строк в одном upsert
+SAVE_QUEUE_MAX_BATCH = int(os.getenv("SAVE_QUEUE_MAX_BATCH", "500"))
+
+# --- Спекулятивный просчет следующего хода ---
+# Пока игрок читает событие, для каждого варианта заранее считаются новое состояние,
+# конец игры и следующее событие; по нажатию кнопки остается только отправить сообщение.
+# Работает только с загруженным каталогом событий (без него ходы не просчитываются)
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "true").lower() == "true"
+# Максимум игроков с просчитанными ветками в памяти одного процесса
+SPECULATION_MAX_PLAYERS = int(os.getenv("SPECULATION_MAX_PLAYERS", "10000"))
+
+# --- Отображение ходов ---
+# "edit" - сообщение с событием редактируется в следующее (один вызов API на ход),
+# "send" - каждый ход отправляется новое сообщение, а старое удаляется
+RENDER_MODE = os.getenv("RENDER_MODE", "edit").lower()
+
+# --- Удаление старых сообщений ---
+# Удалять сообщения фоновой задачей, не задерживая отправку следующего события
+DELETE_MESSAGES_IN_BACKGROUND = os.getenv("DELETE_MESSAGES_IN_BACKGROUND", "true").lower() == "true"
+# Сколько одиночных deleteMessage выполнять параллельно (если bulk-удаление не сработало)
+DELETE_MESSAGES_CONCURRENCY = int(os.getenv("DELETE_MESSAGES_CONCURRENCY", "5"))
+
+# --- Хранилище данных ---
+# "supabase" (по умолчанию) или "sqlite" для небольших развертываний без сети
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase").lower()
+
 # --- Параметры SQLite (если используется) ---
-# SQLITE_DB_NAME = "game_data.db"
+SQLITE_DB_NAME = os.getenv("SQLITE_DB_NAME", "game_data.db")
 
 # Параметры игры (можно добавить позже)
 # Например, начальные значения ресурсов
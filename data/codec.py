@@ -0,0 +1,121 @@
+"""Быстрое преобразование состояния игрока: строка БД <-> PlayerState <-> Country.
+
+Валидация Pydantic выполняется только на границах доверия: при загрузке строки
+из БД (load_player_state) и при загрузке контента (компиляция эффектов).
+Внутри хода состояние собирается из уже проверенных значений через
+_construct (аналог model_construct), без повторных проходов model_dump/model_validate.
+"""
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+from game.core import Country
+from game.history import EventHistory
+from .models import CountryState, PlayerState
+
+ModelT = TypeVar("ModelT")
+
+_new = object.__new__
+_set = object.__setattr__
+
+
+def _construct(model_cls: Type[ModelT], values: Dict[str, Any]) -> ModelT:
+    """Создает модель Pydantic из полного набора уже проверенных значений.
+
+    То же, что model_construct, но без обработки значений по умолчанию и алиасов
+    (в несколько раз быстрее). values должен содержать все поля модели.
+    """
+    obj = _new(model_cls)
+    _set(obj, "__dict__", values)
+    _set(obj, "__pydantic_fields_set__", set(values))
+    _set(obj, "__pydantic_extra__", None)
+    _set(obj, "__pydantic_private__", None)
+    return obj
+
+
+def country_from_state(country_state: CountryState) -> Country:
+    """Создает Country из проверенного CountryState без промежуточного словаря."""
+    country = Country()
+    country.support = country_state.support
+    country.treasury = country_state.treasury
+    country.army = country_state.army
+    country.peasants = country_state.peasants
+    country.current_year = country_state.current_year
+    country.history = EventHistory.decode(country_state.seen_events, country_state.recent_events)
+    return country
+
+
+def country_to_state(country: Country) -> CountryState:
+    """Собирает CountryState из Country без валидации (значения уже проверены).
+
+    Эффекты могут вывести support и current_year за ограничения CountryState
+    (ge=0 и gt=0): такие значения прижимаются к границе, иначе строка, записанная
+    без валидации, не прошла бы ее при следующей загрузке.
+    """
+    return _construct(CountryState, {
+        "support": max(country.support, 0),
+        "treasury": country.treasury,
+        "army": country.army,
+        "peasants": country.peasants,
+        "current_year": max(country.current_year, 1),
+        "seen_events": country.history.encode(),
+        "recent_events": list(country.history.recent),
+    })
+
+
+def build_player_state(
+    telegram_id: int,
+    country: Country,
+    playthrough_count: int,
+    completed_narrative_block_ids: List[int],
+    message_ids: Optional[List[int]] = None,
+    current_event_id: Optional[int] = None,
+) -> PlayerState:
+    """Собирает PlayerState из объектов хода без валидации."""
+    return _construct(PlayerState, {
+        "telegram_id": telegram_id,
+        "country_state": country_to_state(country),
+        "current_event_id": current_event_id,
+        "playthrough_count": playthrough_count,
+        "completed_narrative_block_ids": list(completed_narrative_block_ids),
+        "message_ids": list(message_ids or []),
+    })
+
+
+def copy_player_state(player_state: PlayerState) -> PlayerState:
+    """Копия PlayerState с собственными списками: изменения копии не затрагивают оригинал."""
+    country_state = player_state.country_state
+    return _construct(PlayerState, {
+        "telegram_id": player_state.telegram_id,
+        "country_state": _construct(CountryState, {
+            **country_state_to_dict(country_state),
+            "recent_events": list(country_state.recent_events),
+        }),
+        "current_event_id": player_state.current_event_id,
+        "playthrough_count": player_state.playthrough_count,
+        "completed_narrative_block_ids": list(player_state.completed_narrative_block_ids),
+        "message_ids": list(player_state.message_ids),
+    })
+
+
+def country_state_to_dict(country_state: CountryState) -> Dict[str, Any]:
+    """Сериализует CountryState в JSON-поле state без model_dump."""
+    return {
+        "support": country_state.support,
+        "treasury": country_state.treasury,
+        "army": country_state.army,
+        "peasants": country_state.peasants,
+        "current_year": country_state.current_year,
+        "seen_events": country_state.seen_events,
+        "recent_events": country_state.recent_events,
+    }
+
+
+def player_state_to_row(player_state: PlayerState) -> Dict[str, Any]:
+    """Преобразует PlayerState в строку таблицы players."""
+    return {
+        "telegram_id": player_state.telegram_id,
+        "state": country_state_to_dict(player_state.country_state),
+        "current_event_id": player_state.current_event_id,
+        "playthrough_count": player_state.playthrough_count,
+        "completed_narrative_block_ids": player_state.completed_narrative_block_ids,
+        "message_ids": player_state.message_ids
+    }
@@ -1,20 +1,55 @@
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
+import httpx
 # Импортируем асинхронные Client и create_client из _async
 from supabase._async.client import AsyncClient, create_client
+from supabase.lib.client_options import AsyncClientOptions
 from pydantic import ValidationError
 
 import config
+from utils.metrics import STORAGE_ERRORS, STORAGE_LATENCY, timed
+from utils.resilience import CircuitBreaker, CircuitOpenError
 from .models import PlayerState, CountryState
+from .codec import player_state_to_row
+from .storage import Storage, SupabaseStorage
+from .sqlite_storage import SQLiteStorage
 
 # УБИРАЕМ ГЛОБАЛЬНУЮ ПЕРЕМЕННУЮ
 # supabase: Optional[AsyncClient] = None
 
+def create_supabase_http_client() -> httpx.AsyncClient:
+    """HTTP-клиент для запросов к Supabase с явными лимитами пула, keep-alive и таймаутами.
+
+    Один клиент (и его пул соединений) разделяется всеми запросами процесса.
+    Общее время попытки ограничивает SupabaseStorage; здесь - таймауты транспорта.
+    """
+    http2 = config.SUPABASE_HTTP2
+    if http2:
+        try:
+            import h2 # noqa: F401 - нужен httpx для HTTP/2
+        except ImportError:
+            logging.warning("SUPABASE_HTTP2 requires the 'h2' package (pip install httpx[http2]). Using HTTP/1.1.")
+            http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config.SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=config.SUPABASE_MAX_KEEPALIVE,
+            keepalive_expiry=config.SUPABASE_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            config.SUPABASE_CONTENT_TIMEOUT_SECONDS,
+            connect=config.SUPABASE_CONNECT_TIMEOUT_SECONDS,
+            pool=config.SUPABASE_POOL_TIMEOUT_SECONDS, # Пул исчерпан - ошибка, а не бесконечная очередь
+        ),
+        follow_redirects=True,
+    )
+
 # Функция инициализации теперь только возвращает клиент
-async def init_supabase_client() -> Optional[AsyncClient]:
+async def init_supabase_client(http_client: Optional[httpx.AsyncClient] = None) -> Optional[AsyncClient]:
     """Асинхронно инициализирует и ВОЗВРАЩАЕТ асинхронный клиент Supabase.
-       Использует SERVICE_ROLE ключ.
+       Использует SERVICE_ROLE ключ и, если передан, общий HTTP-клиент http_client.
        Возвращает созданный клиент или None в случае ошибки.
     """
     # Убираем global supabase
@@ -27,7 +62,8 @@ async def init_supabase_client() -> Optional[AsyncClient]:
         return None
 
     try:
-        client = await create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_ROLE_KEY)
+        client = await create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_ROLE_KEY,
+                                     options=AsyncClientOptions(httpx_client=http_client))
         # Убираем присваивание глобальной переменной
         # supabase = client
         logging.info("Supabase async client initialized successfully using SERVICE_ROLE key.")
@@ -38,12 +74,35 @@ async def init_supabase_client() -> Optional[AsyncClient]:
         # supabase = None
         return None
 
-# Функции теперь принимают db_client как первый аргумент
-async def load_player_state(db_client: AsyncClient, telegram_id: int) -> Optional[PlayerState]:
-    """Загружает состояние игрока из Supabase по его telegram_id.
+async def init_storage() -> Optional[Storage]:
+    """Создает хранилище, выбранное в config.STORAGE_BACKEND ("supabase" или "sqlite").
+
+    Возвращает хранилище или None в случае ошибки. Именно оно передается
+    в хендлеры как db_client.
+    """
+    if config.STORAGE_BACKEND == "sqlite":
+        try:
+            return await SQLiteStorage(config.SQLITE_DB_NAME).open()
+        except Exception as e:
+            logging.exception(f"Failed to open SQLite storage {config.SQLITE_DB_NAME}: {e}")
+            return None
+
+    http_client = create_supabase_http_client()
+    client = await init_supabase_client(http_client)
+    if not client:
+        await http_client.aclose()
+        return None
+    breaker = CircuitBreaker("supabase", config.SUPABASE_BREAKER_FAILURES, config.SUPABASE_BREAKER_RESET_SECONDS,
+                             max_pending=config.SUPABASE_MAX_PENDING)
+    return SupabaseStorage(client, http_client, breaker)
+
+# Функции теперь принимают db_client (хранилище) как первый аргумент
+@timed(STORAGE_LATENCY, "load_player_state")
+async def load_player_state(db_client: Storage, telegram_id: int) -> Optional[PlayerState]:
+    """Загружает состояние игрока из хранилища по его telegram_id.
 
     Args:
-        db_client: Инициализированный клиент Supabase.
+        db_client: Инициализированное хранилище (Supabase или SQLite).
         telegram_id: ID игрока в Telegram.
 
     Returns:
@@ -55,20 +114,12 @@ async def load_player_state(db_client: AsyncClient, telegram_id: int) -> Optiona
         return None
 
     try:
-        query = (
-            db_client.table("players") # Используем db_client
-            .select("telegram_id", "state", "current_event_id", "playthrough_count", "completed_narrative_block_ids", "message_ids")
-            .eq("telegram_id", telegram_id)
-            .maybe_single() # Ожидаем одну строку или None
-        )
-        response = await query.execute()
-        # logging.debug(f"Supabase load response for {telegram_id}: {response}") # Отключаем debug лог
-
-        if not response.data:
+        player_data_raw = await db_client.fetch_player_row(telegram_id)
+
+        if not player_data_raw:
             logging.info(f"No state found for player {telegram_id}. Creating new state.")
             return None
-        
-        player_data_raw = response.data
+
         full_player_data = {
             "telegram_id": player_data_raw.get("telegram_id"),
             "country_state": player_data_raw.get("state"),
@@ -86,15 +137,22 @@ async def load_player_state(db_client: AsyncClient, telegram_id: int) -> Optiona
             logging.error(f"Data validation error for player {telegram_id}: {e}")
             return None
 
+    except CircuitOpenError as e:
+        STORAGE_ERRORS.inc("load_player_state")
+        logging.warning(f"Player state for {telegram_id} not loaded: {e}")
+        return None
     except Exception as e:
-        logging.exception(f"Error loading player state for {telegram_id} from Supabase: {e}")
+        # Ошибки перехватываются здесь, поэтому считаются явно (timed их не видит)
+        STORAGE_ERRORS.inc("load_player_state")
+        logging.exception(f"Error loading player state for {telegram_id} from storage: {e}")
         return None
 
-async def save_player_state(db_client: AsyncClient, player_state: PlayerState) -> bool:
-    """Сохраняет или обновляет состояние игрока в Supabase.
+@timed(STORAGE_LATENCY, "save_player_state")
+async def save_player_state(db_client: Storage, player_state: PlayerState) -> bool:
+    """Сохраняет или обновляет состояние игрока в хранилище.
 
     Args:
-        db_client: Инициализированный клиент Supabase.
+        db_client: Инициализированное хранилище (Supabase или SQLite).
         player_state: Pydantic модель с данными игрока.
 
     Returns:
@@ -105,33 +163,61 @@ async def save_player_state(db_client: AsyncClient, player_state: PlayerState) -
         return False
 
     try:
-        data_to_upsert = {
-            "telegram_id": player_state.telegram_id,
-            "state": player_state.country_state.model_dump(),
-            "current_event_id": player_state.current_event_id,
-            "playthrough_count": player_state.playthrough_count,
-            "completed_narrative_block_ids": player_state.completed_narrative_block_ids,
-            "message_ids": player_state.message_ids
-        }
+        data_to_upsert = player_state_to_row(player_state)
+        saved_rows = await db_client.upsert_player_rows([data_to_upsert])
 
-        query = (
-            db_client.table("players") # Используем db_client
-            .upsert(data_to_upsert)
-        )
-        response = await query.execute()
-        # logging.debug(f"Supabase save response for {player_state.telegram_id}: {response}") # Отключаем debug лог
-        
-        if not hasattr(response, 'data') or not response.data:
+        if not saved_rows:
             logging.warning(f"Save operation for player {player_state.telegram_id} might not have been successful, response data is empty or missing.")
             return False
 
-        if response.data or (hasattr(response, 'error') and response.error is None):
-            logging.info(f"Successfully saved state for player {player_state.telegram_id} (Playthrough: {player_state.playthrough_count}, EventID: {player_state.current_event_id}, Msgs: {len(player_state.message_ids)}).")
-            return True
-        else:
-            logging.error(f"Failed to save player state for {player_state.telegram_id}. Response: {response}")
-            return False
+        logging.info(f"Successfully saved state for player {player_state.telegram_id} (Playthrough: {player_state.playthrough_count}, EventID: {player_state.current_event_id}, Msgs: {len(player_state.message_ids)}).")
+        return True
 
+    except CircuitOpenError as e:
+        STORAGE_ERRORS.inc("save_player_state")
+        logging.warning(f"Player state for {player_state.telegram_id} not saved: {e}")
+        return False
     except Exception as e:
-        logging.exception(f"Error saving player state for {player_state.telegram_id} to Supabase: {e}")
+        STORAGE_ERRORS.inc("save_player_state")
+        logging.exception(f"Error saving player state for {player_state.telegram_id} to storage: {e}")
         return False
+
+@timed(STORAGE_LATENCY, "save_player_rows")
+async def save_player_rows(db_client: Storage, rows: List[Dict[str, Any]]) -> bool:
+    """Сохраняет несколько строк таблицы players одним bulk upsert.
+
+    Строки должны иметь уникальные telegram_id (Postgres не позволяет обновить
+    одну строку дважды в рамках одного upsert).
+
+    Returns:
+        True если все строки сохранены, иначе False.
+    """
+    if not db_client:
+        logging.error("Invalid db_client provided to save_player_rows.")
+        return False
+    if not rows:
+        return True
+
+    try:
+        saved_rows = await db_client.upsert_player_rows(rows)
+        if not saved_rows:
+            logging.warning(f"Bulk save of {len(rows)} players might not have been successful, response data is empty or missing.")
+            return False
+        logging.info(f"Successfully saved {len(rows)} player states in one upsert.")
+        return True
+    except CircuitOpenError as e:
+        STORAGE_ERRORS.inc("save_player_rows")
+        logging.warning(f"{len(rows)} player states not saved: {e}")
+        return False
+    except Exception as e:
+        STORAGE_ERRORS.inc("save_player_rows")
+        logging.exception(f"Error saving {len(rows)} player states to storage: {e}")
+        return False
+
+async def save_player_states(db_client: Storage, player_states: List[PlayerState]) -> bool:
+    """Сохраняет состояния нескольких игроков одним запросом.
+
+    Если в списке несколько состояний одного игрока, сохраняется последнее.
+    """
+    rows_by_id = {state.telegram_id: player_state_to_row(state) for state in player_states}
+    return await save_player_rows(db_client, list(rows_by_id.values()))
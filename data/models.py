@@ -13,6 +13,10 @@ class CountryState(BaseModel):
     army: StatusLevel = "medium" # Начальный статус армии
     peasants: StatusLevel = "medium" # Начальный статус крестьян
     current_year: int = Field(1, gt=0) # Начинаем с 1-го года
+    # История событий правления (game.history.EventHistory):
+    # битовая карта показанных событий в base64 и ID последних показанных
+    seen_events: str = ""
+    recent_events: List[int] = []
 
     class Config:
         # Позволяет использовать модель как со словарями, так и с атрибутами объекта
@@ -31,6 +35,9 @@ class PlayerState(BaseModel):
     # Можно добавить другие поля, например, время последнего обновления
     # last_updated: datetime = Field(default_factory=datetime.utcnow)
     playthrough_count: int = 1
+    # Пройденные блоки текущего прохождения (сбрасывается при game over, так что
+    # не длиннее одной последовательности). Следующий блок из каталога ищется от
+    # курсора after_block_id, а список нужен запросу NOT IN без каталога
     completed_narrative_block_ids: List[int] = []
     message_ids: List[int] = [] # Добавляем поле для ID сообщений
 
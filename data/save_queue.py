@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import config
+from .codec import player_state_to_row
+from .database import save_player_rows
+from .models import PlayerState
+from .storage import Storage
+
+
+class SaveCoalescer:
+    """Очередь сохранения, объединяющая записи игроков в bulk upsert.
+
+    submit() кладет строку игрока в очередь и возвращает future с результатом.
+    Повторные записи одного telegram_id в пределах окна склеиваются (побеждает
+    последняя), а строки всех игроков уходят в БД одним upsert([...])
+    не чаще, чем раз в window_seconds.
+    """
+    def __init__(
+        self,
+        db_client: Storage,
+        window_seconds: float = config.SAVE_QUEUE_WINDOW_MS / 1000,
+        max_batch: int = config.SAVE_QUEUE_MAX_BATCH,
+    ):
+        self.db_client = db_client
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        # telegram_id -> последняя строка; порядок вставки сохраняется
+        self._pending_rows: Dict[int, Dict[str, Any]] = {}
+        self._pending_futures: Dict[int, List[asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending_rows)
+
+    def submit(self, player_state: PlayerState) -> "asyncio.Future[bool]":
+        """Ставит состояние игрока в очередь на сохранение.
+
+        Returns:
+            Future, который завершится True/False после записи пачки с этим игроком.
+        """
+        loop = asyncio.get_running_loop()
+        telegram_id = player_state.telegram_id
+        future: asyncio.Future = loop.create_future()
+
+        self._pending_rows[telegram_id] = player_state_to_row(player_state)
+        self._pending_futures.setdefault(telegram_id, []).append(future)
+
+        if len(self._pending_rows) >= self.max_batch:
+            self._schedule_flush(loop, delay=0)
+        elif self._flush_handle is None:
+            self._schedule_flush(loop, delay=self.window_seconds)
+        return future
+
+    async def save(self, player_state: PlayerState) -> bool:
+        """То же, что submit(), но ожидает результат (замена save_player_state)."""
+        return await self.submit(player_state)
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        task = asyncio.create_task(self.flush())
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def flush(self) -> None:
+        """Отправляет все накопленные строки (пачками по max_batch) и завершает futures."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending_rows:
+            return
+
+        rows, futures = self._pending_rows, self._pending_futures
+        self._pending_rows, self._pending_futures = {}, {}
+
+        ids = list(rows.keys())
+        for start in range(0, len(ids), self.max_batch):
+            batch_ids = ids[start:start + self.max_batch]
+            ok = await save_player_rows(self.db_client, [rows[telegram_id] for telegram_id in batch_ids])
+            if not ok:
+                logging.error(f"Coalesced save failed for {len(batch_ids)} players.")
+            for telegram_id in batch_ids:
+                for future in futures[telegram_id]:
+                    if not future.done():
+                        future.set_result(ok)
+
+    async def close(self) -> None:
+        """Сбрасывает очередь и дожидается всех текущих записей (вызывать при остановке)."""
+        await self.flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import config
+from .codec import copy_player_state
+from .database import load_player_state, save_player_states
+from .models import PlayerState
+from .storage import Storage
+
+
+class PlayerSessionCache:
+    """Кэш сессий игроков в памяти процесса с отложенной записью (write-behind).
+
+    - Активные игроки обслуживаются из памяти: load_player_state вызывается только при промахе.
+    - put() лишь помечает состояние "грязным"; в БД оно попадает фоновым сбросом
+      раз в flush_interval секунд (и при остановке бота), а не на каждое нажатие.
+    - Вытеснение: LRU при превышении max_size и по простою дольше idle_seconds.
+      Грязные записи перед вытеснением обязательно сбрасываются в БД; пока идет
+      их запись, они по-прежнему читаются из памяти, а не устаревшей строкой из БД.
+    - get() возвращает копию: хендлеры меняют состояние на месте, а в кэш
+      изменения попадают только через put().
+    """
+    def __init__(
+        self,
+        db_client: Storage,
+        max_size: int = config.SESSION_CACHE_MAX_PLAYERS,
+        idle_seconds: float = config.SESSION_CACHE_IDLE_SECONDS,
+        flush_interval: float = config.SESSION_FLUSH_INTERVAL_SECONDS,
+    ):
+        self.db_client = db_client
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.flush_interval = flush_interval
+        # telegram_id -> (состояние, время последнего обращения); порядок = LRU
+        self._entries: "OrderedDict[int, tuple[PlayerState, float]]" = OrderedDict()
+        self._dirty: set[int] = set()
+        # Вытесненные, но еще не записанные состояния (читаются как обычные записи)
+        self._evicted_dirty: Dict[int, PlayerState] = {}
+        # Состояния, которые сейчас записываются в БД (читаются, пока запись не завершится)
+        self._inflight: Dict[int, PlayerState] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, telegram_id: int) -> Optional[PlayerState]:
+        """Возвращает копию состояния игрока из памяти или загружает его из БД."""
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            self._touch(telegram_id, entry[0])
+            return copy_player_state(entry[0])
+
+        pending = self._evicted_dirty.pop(telegram_id, None)
+        if pending is not None:
+            self._dirty.add(telegram_id)
+            self._touch(telegram_id, pending)
+            return copy_player_state(pending)
+
+        inflight = self._inflight.get(telegram_id)
+        if inflight is not None:
+            # Запись еще идет: при неудаче _requeue снова пометит это состояние грязным
+            self._touch(telegram_id, inflight)
+            return copy_player_state(inflight)
+
+        player_state = await load_player_state(self.db_client, telegram_id)
+        if player_state is not None and telegram_id not in self._entries:
+            self._touch(telegram_id, player_state)
+        if telegram_id in self._entries:
+            return copy_player_state(self._entries[telegram_id][0])
+        return player_state
+
+    def put(self, player_state: PlayerState) -> None:
+        """Обновляет состояние в кэше и помечает его для отложенной записи в БД."""
+        telegram_id = player_state.telegram_id
+        self._evicted_dirty.pop(telegram_id, None)
+        self._touch(telegram_id, player_state)
+        self._dirty.add(telegram_id)
+
+    def _touch(self, telegram_id: int, player_state: PlayerState) -> None:
+        self._entries[telegram_id] = (player_state, time.monotonic())
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            oldest_id, (oldest_state, _) = self._entries.popitem(last=False)
+            self._evict(oldest_id, oldest_state)
+
+    def _evict(self, telegram_id: int, player_state: PlayerState) -> None:
+        if telegram_id in self._dirty:
+            self._dirty.discard(telegram_id)
+            self._evicted_dirty[telegram_id] = player_state
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_seconds
+        # Записи упорядочены по времени обращения, поэтому идем с начала до первой "свежей"
+        while self._entries:
+            telegram_id, (player_state, last_access) = next(iter(self._entries.items()))
+            if last_access > deadline:
+                break
+            del self._entries[telegram_id]
+            self._evict(telegram_id, player_state)
+
+    async def flush(self) -> int:
+        """Записывает в БД все грязные и вытесненные состояния.
+
+        Returns:
+            Количество успешно сохраненных состояний.
+        """
+        async with self._flush_lock:
+            self._evict_idle()
+            to_save: Dict[int, PlayerState] = dict(self._evicted_dirty)
+            self._evicted_dirty.clear()
+            for telegram_id in self._dirty:
+                to_save[telegram_id] = self._entries[telegram_id][0]
+            self._dirty.clear()
+            if not to_save:
+                return 0
+
+            # Все накопленные состояния уходят в БД одним bulk upsert
+            states = list(to_save.values())
+            self._inflight.update(to_save)
+            ok = False
+            try:
+                ok = await save_player_states(self.db_client, states)
+            finally:
+                if not ok:
+                    self._requeue(states)
+                for player_state in states:
+                    if self._inflight.get(player_state.telegram_id) is player_state:
+                        del self._inflight[player_state.telegram_id]
+            saved = len(states) if ok else 0
+            logging.info(f"Session cache flushed {saved}/{len(states)} player states ({len(self._entries)} cached).")
+            return saved
+
+    def _requeue(self, states: List[PlayerState]) -> None:
+        """Возвращает несохраненные состояния в очередь, если за это время не пришло более новое.
+
+        Если в кэше уже другое состояние игрока (записано через put() или загружено
+        заново), старое не возвращается: оно перезаписало бы более новое.
+        """
+        for player_state in states:
+            telegram_id = player_state.telegram_id
+            entry = self._entries.get(telegram_id)
+            if entry is not None:
+                if entry[0] is player_state:
+                    self._dirty.add(telegram_id)
+            elif telegram_id not in self._evicted_dirty:
+                self._evicted_dirty[telegram_id] = player_state
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.exception(f"Error flushing player session cache: {e}")
+
+    def start(self) -> None:
+        """Запускает фоновый периодический сброс."""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Останавливает фоновый сброс и записывает все оставшиеся изменения."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
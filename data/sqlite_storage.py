@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar
+
+from .storage import EVENT_COLUMNS, NARRATIVE_BLOCK_COLUMNS, OPTION_COLUMNS, PLAYER_COLUMNS
+
+T = TypeVar("T")
+
+# Схема локальной БД. Повторяет таблицы Supabase; JSON и массивы хранятся как TEXT.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    telegram_id INTEGER PRIMARY KEY, -- PRIMARY KEY = уникальный индекс по telegram_id
+    state TEXT NOT NULL,
+    current_event_id INTEGER,
+    playthrough_count INTEGER NOT NULL DEFAULT 1,
+    completed_narrative_block_ids TEXT NOT NULL DEFAULT '[]',
+    message_ids TEXT NOT NULL DEFAULT '[]'
+);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    description TEXT NOT NULL,
+    image_url_prompt TEXT,
+    character_name TEXT,
+    trigger_conditions TEXT,
+    frequency_weight INTEGER NOT NULL DEFAULT 1,
+    event_type TEXT NOT NULL DEFAULT 'random',
+    min_year INTEGER NOT NULL DEFAULT 1,
+    max_year INTEGER, -- NULL - событие не ограничено сверху
+    is_unique INTEGER NOT NULL DEFAULT 0 -- 1 - не больше одного раза за правление
+);
+CREATE INDEX IF NOT EXISTS idx_events_type_min_year ON events (event_type, min_year);
+
+CREATE TABLE IF NOT EXISTS event_options (
+    id INTEGER PRIMARY KEY,
+    event_id INTEGER NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+    button_text TEXT NOT NULL,
+    effects TEXT,
+    outcome_text TEXT,
+    image_url_result TEXT,
+    next_event_name TEXT,
+    display_order INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_event_options_event_id ON event_options (event_id, display_order);
+
+CREATE TABLE IF NOT EXISTS narrative_blocks (
+    id INTEGER PRIMARY KEY,
+    block_type TEXT NOT NULL,
+    text TEXT NOT NULL,
+    image_url TEXT,
+    button_text TEXT NOT NULL,
+    is_final_in_sequence INTEGER NOT NULL DEFAULT 0,
+    required_playthrough INTEGER,
+    sequence_order INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_narrative_blocks_type_order ON narrative_blocks (block_type, sequence_order);
+"""
+
+# Колонки, добавленные после первой версии схемы: таблица -> (колонка, определение).
+# В существующих БД они добавляются через ALTER TABLE при открытии
+_MIGRATIONS = {
+    "events": (("max_year", "INTEGER"), ("is_unique", "INTEGER NOT NULL DEFAULT 0")),
+}
+
+# Поля, которые хранятся в SQLite как JSON-текст
+_PLAYER_JSON_FIELDS = ("state", "completed_narrative_block_ids", "message_ids")
+_EVENT_JSON_FIELDS = ("trigger_conditions",)
+_OPTION_JSON_FIELDS = ("effects",)
+
+# Запросы - константы: sqlite3 кэширует подготовленные выражения по тексту SQL
+_SELECT_PLAYER = f"SELECT {', '.join(PLAYER_COLUMNS)} FROM players WHERE telegram_id = ?"
+_UPSERT_PLAYER = (
+    f"INSERT INTO players ({', '.join(PLAYER_COLUMNS)}) VALUES ({', '.join('?' * len(PLAYER_COLUMNS))}) "
+    "ON CONFLICT (telegram_id) DO UPDATE SET "
+    + ", ".join(f"{col} = excluded.{col}" for col in PLAYER_COLUMNS if col != "telegram_id")
+)
+_SELECT_EVENTS = f"SELECT {', '.join(EVENT_COLUMNS)} FROM events"
+_SELECT_OPTIONS = f"SELECT {', '.join(OPTION_COLUMNS)} FROM event_options"
+_SELECT_BLOCKS = f"SELECT {', '.join(NARRATIVE_BLOCK_COLUMNS)} FROM narrative_blocks"
+
+
+def _decode(row: sqlite3.Row, json_fields: Sequence[str]) -> Dict[str, Any]:
+    data = dict(row)
+    for field in json_fields:
+        if data.get(field) is not None:
+            data[field] = json.loads(data[field])
+    return data
+
+
+def _block(row: sqlite3.Row) -> Dict[str, Any]:
+    data = dict(row)
+    data["is_final_in_sequence"] = bool(data["is_final_in_sequence"])
+    return data
+
+
+class SQLiteStorage:
+    """Локальное хранилище на SQLite (для небольших развертываний без сетевых запросов).
+
+    Все обращения к sqlite3 выполняются в одном выделенном потоке, поэтому
+    event loop не блокируется, а соединение используется последовательно.
+    БД работает в режиме WAL: чтения не блокируются записью.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def open(self) -> "SQLiteStorage":
+        """Открывает соединение, включает WAL и создает схему."""
+        await self._run(self._open_sync)
+        logging.info(f"SQLite storage opened at {self.path} (WAL mode).")
+        return self
+
+    def _open_sync(self) -> None:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # В WAL безопасно и заметно быстрее FULL
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(SCHEMA)
+        # Блокировка записи берется до чтения схемы: рабочие процессы (WORKER_PROCESSES)
+        # открывают одну БД одновременно, и колонку должен добавить только один из них
+        conn.execute("BEGIN IMMEDIATE")
+        for table, columns in _MIGRATIONS.items():
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    logging.info(f"SQLite storage: added column {table}.{column}.")
+        conn.commit()
+        self._conn = conn
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    # --- Игроки ---
+
+    async def fetch_player_row(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        def query() -> Optional[Dict[str, Any]]:
+            row = self._conn.execute(_SELECT_PLAYER, (telegram_id,)).fetchone()
+            return _decode(row, _PLAYER_JSON_FIELDS) if row else None
+        return await self._run(query)
+
+    async def upsert_player_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        params = [
+            tuple(json.dumps(row.get(col)) if col in _PLAYER_JSON_FIELDS else row.get(col) for col in PLAYER_COLUMNS)
+            for row in rows
+        ]
+
+        def query() -> None:
+            with self._conn: # Транзакция: все строки или ни одной
+                self._conn.executemany(_UPSERT_PLAYER, params)
+        await self._run(query)
+        return rows
+
+    # --- События ---
+
+    async def fetch_events(self, event_types: Optional[Sequence[str]] = None, max_min_year: Optional[int] = None,
+                           with_options: bool = True) -> List[Dict[str, Any]]:
+        sql = _SELECT_EVENTS
+        conditions: List[str] = []
+        params: List[Any] = []
+        if event_types is not None:
+            conditions.append(f"event_type IN ({', '.join('?' * len(event_types))})")
+            params.extend(event_types)
+        if max_min_year is not None:
+            conditions.append("min_year <= ?")
+            params.append(max_min_year)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+
+        def query() -> List[Dict[str, Any]]:
+            events = [_decode(row, _EVENT_JSON_FIELDS) for row in self._conn.execute(sql, params)]
+            if with_options and events:
+                options_by_event: Dict[int, List[Dict[str, Any]]] = {}
+                for opt in self._select_options([event["id"] for event in events]):
+                    options_by_event.setdefault(opt["event_id"], []).append(opt)
+                for event in events:
+                    event["event_options"] = options_by_event.get(event["id"], [])
+            return events
+        return await self._run(query)
+
+    def _select_options(self, event_ids: Sequence[int]) -> List[Dict[str, Any]]:
+        sql = f"{_SELECT_OPTIONS} WHERE event_id IN ({', '.join('?' * len(event_ids))}) ORDER BY event_id, display_order"
+        return [_decode(row, _OPTION_JSON_FIELDS) for row in self._conn.execute(sql, list(event_ids))]
+
+    async def fetch_event_options(self, event_ids: Sequence[int]) -> List[Dict[str, Any]]:
+        if not event_ids:
+            return []
+        return await self._run(self._select_options, list(event_ids))
+
+    # --- Нарративные блоки ---
+
+    async def fetch_narrative_blocks(self) -> List[Dict[str, Any]]:
+        def query() -> List[Dict[str, Any]]:
+            return [_block(row) for row in self._conn.execute(f"{_SELECT_BLOCKS} ORDER BY sequence_order")]
+        return await self._run(query)
+
+    async def fetch_narrative_block(self, block_id: int) -> Optional[Dict[str, Any]]:
+        def query() -> Optional[Dict[str, Any]]:
+            row = self._conn.execute(f"{_SELECT_BLOCKS} WHERE id = ?", (block_id,)).fetchone()
+            return _block(row) if row else None
+        return await self._run(query)
+
+    async def fetch_next_narrative_block(self, block_type: str, playthrough: int,
+                                         exclude_ids: Sequence[int]) -> Optional[Dict[str, Any]]:
+        sql = (
+            f"{_SELECT_BLOCKS} WHERE block_type = ? "
+            "AND (required_playthrough IS NULL OR required_playthrough = 0 OR required_playthrough = ?) "
+        )
+        params: List[Any] = [block_type, playthrough]
+        if exclude_ids:
+            sql += f"AND id NOT IN ({', '.join('?' * len(exclude_ids))}) "
+            params.extend(exclude_ids)
+        sql += "ORDER BY sequence_order LIMIT 1"
+
+        def query() -> Optional[Dict[str, Any]]:
+            row = self._conn.execute(sql, params).fetchone()
+            return _block(row) if row else None
+        return await self._run(query)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,204 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+import httpx
+from postgrest.exceptions import APIError
+# Импортируем асинхронный клиент Supabase для реализации хранилища
+from supabase._async.client import AsyncClient
+
+import config
+from utils.resilience import CircuitBreaker, call_with_retries
+
+# Колонки таблицы players
+PLAYER_COLUMNS = ("telegram_id", "state", "current_event_id", "playthrough_count",
+                  "completed_narrative_block_ids", "message_ids")
+# Колонки событий, которые нужны для выбора и показа события
+EVENT_COLUMNS = ("id", "name", "description", "image_url_prompt", "character_name",
+                 "trigger_conditions", "frequency_weight", "event_type", "min_year", "max_year", "is_unique")
+# Колонки вариантов ответов (event_id нужен для группировки по событиям)
+OPTION_COLUMNS = ("id", "event_id", "button_text", "effects", "outcome_text",
+                  "image_url_result", "next_event_name", "display_order")
+# Колонки нарративных блоков
+NARRATIVE_BLOCK_COLUMNS = ("id", "block_type", "text", "image_url", "button_text",
+                           "is_final_in_sequence", "required_playthrough", "sequence_order")
+
+# Размер страницы при выгрузке таблиц (ограничение PostgREST по умолчанию - 1000 строк)
+PAGE_SIZE = 1000
+
+
+class Storage(Protocol):
+    """Интерфейс хранилища, через который игра работает с данными.
+
+    Реализации: SupabaseStorage (PostgREST) и SQLiteStorage (локальный файл).
+    Методы возвращают "сырые" строки в виде словарей (JSON-поля уже разобраны)
+    и пробрасывают исключения - логирование и обработка ошибок остаются
+    в функциях data/database.py, game/events.py и т.д.
+    """
+
+    async def fetch_player_row(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Возвращает строку players или None."""
+        ...
+
+    async def upsert_player_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Вставляет/обновляет строки players. Возвращает сохраненные строки."""
+        ...
+
+    async def fetch_events(self, event_types: Optional[Sequence[str]] = None, max_min_year: Optional[int] = None,
+                           with_options: bool = True) -> List[Dict[str, Any]]:
+        """Возвращает события (с min_year <= max_min_year, если задан).
+
+        При with_options=True у каждой строки есть ключ "event_options" со списком вариантов.
+        """
+        ...
+
+    async def fetch_event_options(self, event_ids: Sequence[int]) -> List[Dict[str, Any]]:
+        """Возвращает варианты ответов для указанных событий, отсортированные по display_order."""
+        ...
+
+    async def fetch_narrative_blocks(self) -> List[Dict[str, Any]]:
+        """Возвращает все нарративные блоки."""
+        ...
+
+    async def fetch_narrative_block(self, block_id: int) -> Optional[Dict[str, Any]]:
+        """Возвращает нарративный блок по ID или None."""
+        ...
+
+    async def fetch_next_narrative_block(self, block_type: str, playthrough: int,
+                                         exclude_ids: Sequence[int]) -> Optional[Dict[str, Any]]:
+        """Возвращает первый (по sequence_order) блок типа block_type, не входящий в exclude_ids."""
+        ...
+
+    async def close(self) -> None:
+        """Освобождает ресурсы хранилища."""
+        ...
+
+
+# Коды ошибок Postgres/PostgREST, после которых запрос имеет смысл повторить:
+# нет соединения с БД, нехватка ресурсов, отмена по таймауту/остановке, конфликт сериализации
+_TRANSIENT_PG_CODES = ("08", "53", "57", "40001", "40P01", "PGRST000", "PGRST001", "PGRST002", "PGRST003")
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Сетевые ошибки, таймауты, 429/5xx и временные ошибки Postgres - транзиентные."""
+    # В Python 3.10 asyncio.TimeoutError (из wait_for) - отдельный от TimeoutError класс
+    if isinstance(error, (httpx.TransportError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIError):
+        code = error.code
+        # Для ответов без JSON (например, 502 от прокси) в code - статус HTTP (число или строка из 3 цифр)
+        if isinstance(code, str) and len(code) == 3 and code.isdigit():
+            code = int(code)
+        if isinstance(code, int):
+            return code == 429 or code >= 500
+        return isinstance(code, str) and code.startswith(_TRANSIENT_PG_CODES)
+    return False
+
+
+class SupabaseStorage:
+    """Хранилище на базе Supabase (PostgREST) поверх асинхронного клиента.
+
+    Каждый запрос выполняется через _execute: с ограничением времени попытки,
+    повторами транзиентных ошибок и предохранителем breaker. Все запросы бота -
+    чтения и upsert по первичному ключу, поэтому повтор безопасен.
+    """
+
+    def __init__(self, client: AsyncClient, http_client: Optional[httpx.AsyncClient] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.client = client
+        self.http_client = http_client # Общий пул соединений; закрывается в close()
+        self.breaker = breaker
+
+    async def _execute(self, operation: str, query: Any, timeout: float = config.SUPABASE_TIMEOUT_SECONDS) -> Any:
+        # Встроенные повторы postgrest (GET при 503/520) отключены, чтобы не умножать наши
+        return await call_with_retries(
+            query.retry(False).execute,
+            operation=operation,
+            is_transient=is_transient_error,
+            attempts=config.SUPABASE_RETRY_ATTEMPTS,
+            base_delay=config.SUPABASE_RETRY_BASE_DELAY_SECONDS,
+            max_delay=config.SUPABASE_RETRY_MAX_DELAY_SECONDS,
+            timeout=timeout,
+            breaker=self.breaker,
+        )
+
+    async def fetch_player_row(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        query = (
+            self.client.table("players")
+            .select(*PLAYER_COLUMNS)
+            .eq("telegram_id", telegram_id)
+            .maybe_single() # Ожидаем одну строку или None
+        )
+        response = await self._execute("fetch_player_row", query)
+        # maybe_single() в некоторых версиях клиента возвращает None вместо пустого ответа
+        return response.data if response else None
+
+    async def upsert_player_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        response = await self._execute("upsert_player_rows", self.client.table("players").upsert(rows))
+        return response.data or []
+
+    async def fetch_events(self, event_types: Optional[Sequence[str]] = None, max_min_year: Optional[int] = None,
+                           with_options: bool = True) -> List[Dict[str, Any]]:
+        columns = EVENT_COLUMNS
+        if with_options:
+            # Встраивание PostgREST: варианты приходят в том же ответе.
+            # Требует внешнего ключа event_options.event_id -> events.id
+            columns = columns + (f"event_options({','.join(OPTION_COLUMNS)})",)
+
+        rows: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            query = self.client.table("events").select(*columns)
+            if event_types is not None:
+                query = query.in_("event_type", list(event_types))
+            if max_min_year is not None:
+                query = query.lte("min_year", max_min_year)
+            response = await self._execute("fetch_events", query.order("id").range(start, start + PAGE_SIZE - 1),
+                                           timeout=config.SUPABASE_CONTENT_TIMEOUT_SECONDS)
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    async def fetch_event_options(self, event_ids: Sequence[int]) -> List[Dict[str, Any]]:
+        if not event_ids:
+            return []
+        query = (
+            self.client.table("event_options")
+            .select(*OPTION_COLUMNS)
+            .in_("event_id", list(event_ids))
+            .order("display_order") # Запрашиваем сортировку сразу
+        )
+        response = await self._execute("fetch_event_options", query, timeout=config.SUPABASE_CONTENT_TIMEOUT_SECONDS)
+        return response.data or []
+
+    async def fetch_narrative_blocks(self) -> List[Dict[str, Any]]:
+        query = self.client.table("narrative_blocks").select(*NARRATIVE_BLOCK_COLUMNS).order("sequence_order")
+        response = await self._execute("fetch_narrative_blocks", query, timeout=config.SUPABASE_CONTENT_TIMEOUT_SECONDS)
+        return response.data or []
+
+    async def fetch_narrative_block(self, block_id: int) -> Optional[Dict[str, Any]]:
+        query = self.client.table("narrative_blocks").select(*NARRATIVE_BLOCK_COLUMNS).eq("id", block_id).limit(1)
+        response = await self._execute("fetch_narrative_block", query)
+        return response.data[0] if response.data else None
+
+    async def fetch_next_narrative_block(self, block_type: str, playthrough: int,
+                                         exclude_ids: Sequence[int]) -> Optional[Dict[str, Any]]:
+        query = (
+            self.client.table("narrative_blocks")
+            .select(*NARRATIVE_BLOCK_COLUMNS)
+            .eq("block_type", block_type)
+            .or_(f"required_playthrough.eq.0,required_playthrough.is.null,required_playthrough.eq.{playthrough}")
+            # Используем not_.in_ для исключения уже просмотренных
+            .not_.in_("id", list(exclude_ids) if exclude_ids else [-1]) # -1 если список пуст
+            .order("sequence_order", desc=False) # Сортируем по порядку
+            .limit(1) # Берем первый не просмотренный
+        )
+        response = await self._execute("fetch_next_narrative_block", query)
+        return response.data[0] if response.data else None
+
+    async def close(self) -> None:
+        if self.breaker is not None:
+            self.breaker.close()
+        if self.http_client is not None:
+            await self.http_client.aclose()
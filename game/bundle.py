@@ -0,0 +1,199 @@
+"""Скомпилированный пакет контента: каталог событий и нарративные блоки в одном файле.
+
+Команда компиляции выгружает контент из хранилища (или JSON-файла), строит те же
+снимки, что и при загрузке из БД (CatalogSnapshot с компилированными условиями,
+эффектами и alias-таблицами, NarrativeSequences), и сериализует их в файл.
+Бот читает файл через mmap и восстанавливает готовые снимки без запросов к БД
+и без повторной компиляции.
+
+Формат файла (little-endian):
+    заголовок: magic, версия формата, число секций, время сборки, отпечаток контента
+    таблица секций: имя, смещение, длина, SHA-1 содержимого
+    секции: pickle снимков ("events", "narrative")
+
+Пакет загружается через pickle, поэтому файл должен быть получен из доверенной
+сборки (как и код бота). Файл записывается во временный и атомарно заменяется
+(os.replace): читатели видят либо старую, либо новую версию целиком.
+
+Запуск:
+    python -m game.bundle --from-storage --out content.bundle
+    python -m game.bundle --content content.json --out content.bundle
+    python -m game.bundle --info content.bundle
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import sys
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+BUNDLE_MAGIC = b"KINGBNDL"
+# Увеличивать при изменении формата файла или структуры сериализуемых снимков
+BUNDLE_FORMAT = 1
+
+_HEADER = struct.Struct("<8sHHQ40s") # magic, формат, число секций, время сборки, отпечаток
+_SECTION = struct.Struct("<16sQQ20s") # имя, смещение, длина, sha1
+
+SECTION_EVENTS = "events"
+SECTION_NARRATIVE = "narrative"
+
+
+class BundleError(Exception):
+    """Файл пакета отсутствует, поврежден или собран в другом формате."""
+
+
+class BundleInfo(NamedTuple):
+    path: str
+    format: int
+    built_at: int
+    fingerprint: str
+    sections: Dict[str, Tuple[int, int]] # имя -> (смещение, длина)
+
+
+def _intern(value: Any) -> Any:
+    """Интернирует строки в строках контента: повторы хранятся в пакете один раз."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {sys.intern(k) if isinstance(k, str) else k: _intern(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_intern(v) for v in value]
+    return value
+
+
+def build_bundle(event_rows: List[Dict[str, Any]], option_rows: List[Dict[str, Any]],
+                 block_rows: List[Dict[str, Any]]) -> bytes:
+    """Строит снимки из строк контента и возвращает содержимое файла пакета."""
+    # Каталоги сами читают пакет (game.catalog импортирует этот модуль)
+    from game.catalog import CatalogSnapshot
+    from game.narrative import NarrativeSequences
+
+    snapshot = CatalogSnapshot(_intern(event_rows), _intern(option_rows))
+    sequences = NarrativeSequences(_intern(block_rows))
+    sections = [
+        (SECTION_EVENTS, pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)),
+        (SECTION_NARRATIVE, pickle.dumps(sequences, protocol=pickle.HIGHEST_PROTOCOL)),
+    ]
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    for name, payload in sections:
+        table.append(_SECTION.pack(name.encode("ascii"), offset, len(payload), hashlib.sha1(payload).digest()))
+        offset += len(payload)
+    header = _HEADER.pack(BUNDLE_MAGIC, BUNDLE_FORMAT, len(sections), int(time.time()), snapshot.fingerprint.encode("ascii"))
+    return b"".join([header, *table, *(payload for _, payload in sections)])
+
+
+def write_bundle(path: str, data: bytes) -> None:
+    """Атомарно записывает пакет: временный файл, fsync, os.replace."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_info(path: str, buf: Any) -> BundleInfo:
+    if len(buf) < _HEADER.size:
+        raise BundleError(f"{path}: file is too short")
+    magic, fmt, count, built_at, fingerprint = _HEADER.unpack_from(buf, 0)
+    if magic != BUNDLE_MAGIC:
+        raise BundleError(f"{path}: not a content bundle")
+    if fmt != BUNDLE_FORMAT:
+        raise BundleError(f"{path}: bundle format {fmt}, expected {BUNDLE_FORMAT}; recompile the bundle")
+    sections = {}
+    for i in range(count):
+        name, offset, length, _ = _SECTION.unpack_from(buf, _HEADER.size + i * _SECTION.size)
+        sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+    return BundleInfo(path, fmt, built_at, fingerprint.decode("ascii"), sections)
+
+
+def read_section(path: str, name: str) -> Tuple[Any, BundleInfo]:
+    """Читает секцию пакета через mmap: проверяет заголовок и контрольную сумму, восстанавливает снимок."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            info = _read_info(path, mm)
+            for i in range(len(info.sections)):
+                section_name, offset, length, digest = _SECTION.unpack_from(mm, _HEADER.size + i * _SECTION.size)
+                if section_name.rstrip(b"\0").decode("ascii") == name:
+                    break
+            else:
+                raise BundleError(f"{path}: no section '{name}'")
+            if offset + length > len(mm):
+                raise BundleError(f"{path}: section '{name}' is truncated")
+            with memoryview(mm) as view, view[offset:offset + length] as payload:
+                if hashlib.sha1(payload).digest() != digest:
+                    raise BundleError(f"{path}: section '{name}' checksum mismatch")
+                # GC здесь не выключается: функция работает в потоке (asyncio.to_thread),
+                # а gc.disable() действует на весь процесс. Паузу GC на время загрузки
+                # при запуске делает bot.startup.load_content из потока цикла событий
+                return pickle.loads(payload), info
+    except (OSError, ValueError, pickle.UnpicklingError, AttributeError, EOFError) as e:
+        raise BundleError(f"{path}: {e}") from e
+
+
+def bundle_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    """Признак версии файла (inode, размер, mtime) - меняется при замене пакета. None, если файла нет."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+async def _rows_from_storage() -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    from data.database import init_storage
+
+    storage = await init_storage()
+    if storage is None:
+        raise SystemExit("Storage is not configured.")
+    try:
+        event_rows = await storage.fetch_events(with_options=False)
+        option_rows = await storage.fetch_event_options([row['id'] for row in event_rows]) if event_rows else []
+        block_rows = await storage.fetch_narrative_blocks()
+        return event_rows, option_rows, block_rows
+    finally:
+        await storage.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compile game content into a bundle file loaded by the bot at startup.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--content", help="JSON file with 'events', 'event_options' and optional 'narrative_blocks'")
+    source.add_argument("--from-storage", action="store_true", help="read content from the configured storage")
+    source.add_argument("--info", metavar="BUNDLE", help="print the header of an existing bundle")
+    parser.add_argument("--out", default="content.bundle")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(name)s - %(message)s')
+
+    if args.info:
+        with open(args.info, "rb") as f:
+            info = _read_info(args.info, f.read(_HEADER.size + _SECTION.size * 16))
+        print(f"{info.path}: format {info.format}, built {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info.built_at))}, "
+              f"fingerprint {info.fingerprint}")
+        for name, (offset, length) in info.sections.items():
+            print(f"  {name}: {length} bytes at {offset}")
+        return
+
+    if args.content:
+        with open(args.content, encoding="utf-8") as f:
+            content = json.load(f)
+        rows = content["events"], content["event_options"], content.get("narrative_blocks", [])
+    else:
+        rows = asyncio.run(_rows_from_storage())
+
+    started = time.perf_counter()
+    data = build_bundle(*rows)
+    write_bundle(args.out, data)
+    print(f"Wrote {args.out}: {len(rows[0])} events, {len(rows[1])} options, {len(rows[2])} narrative blocks, "
+          f"{len(data)} bytes in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
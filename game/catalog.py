@@ -0,0 +1,273 @@
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from data.storage import Storage
+from game.conditions import CompiledCondition, ConditionIndex, compile_conditions
+from game.bundle import SECTION_EVENTS, BundleError, bundle_stamp, read_section
+from game.effects import CompiledEffect, compile_effects
+from game.history import EventHistory
+from game.sampling import AliasSampler
+
+# Типы событий, которые выбираются, когда нет подходящих условных
+FALLBACK_EVENT_TYPES = ("random", "character")
+# Сколько раз повторять выборку, если выпало событие, запрещенное историей игрока
+FALLBACK_SAMPLE_ATTEMPTS = 8
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок контента событий, проиндексированный по event_type и min_year.
+
+    После построения снимок не меняется: при обновлении каталога создается новый
+    снимок и атомарно подменяет старый, поэтому хендлеры читают его без блокировок.
+    """
+    def __init__(self, event_rows: List[Dict[str, Any]], option_rows: List[Dict[str, Any]]):
+        self.events_by_id: Dict[int, Dict[str, Any]] = {row['id']: row for row in event_rows}
+
+        # Варианты ответов группируем по событию и сразу сортируем по display_order
+        self.options_by_event: Dict[int, List[Dict[str, Any]]] = group_options(option_rows)
+        # Эффекты вариантов проверяются и компилируются в дельты один раз при загрузке
+        self.option_effects: Dict[int, CompiledEffect] = {
+            opt['id']: compile_effects(opt.get('effects'), source=f"option {opt['id']}") for opt in option_rows
+        }
+
+        # Индекс: event_type -> события, отсортированные по min_year.
+        # Параллельный список min_year позволяет через bisect найти все события с min_year <= года.
+        self._by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for row in event_rows:
+            self._by_type.setdefault(row.get('event_type') or "random", []).append(row)
+        self._min_years: Dict[str, List[int]] = {}
+        for event_type, rows in self._by_type.items():
+            rows.sort(key=lambda r: r.get('min_year') or 0)
+            self._min_years[event_type] = [r.get('min_year') or 0 for r in rows]
+
+        # Условия компилируются один раз при загрузке контента.
+        # Условные события без вариантов ответа в индекс не попадают.
+        self.conditions: Dict[int, CompiledCondition] = {
+            row['id']: compile_conditions(row.get('trigger_conditions')) for row in event_rows
+        }
+        conditional_rows = [row for row in self._by_type.get("conditional", []) if self.options_by_event.get(row['id'])]
+        self.conditional_index = ConditionIndex(
+            conditional_rows,
+            [self.conditions[row['id']] for row in conditional_rows],
+            extra_ranges={"current_year": [_year_range(row) for row in conditional_rows]},
+        )
+
+        # Сэмплеры случайных/персонажных событий по "полосам" лет: полоса i покрывает
+        # годы [_fallback_bands[i], _fallback_bands[i + 1]) и содержит все события,
+        # активные в эти годы (min_year <= год <= max_year).
+        # Таблицы строятся только при загрузке новой версии каталога.
+        fallback_rows = sorted(
+            (row for event_type in FALLBACK_EVENT_TYPES for row in self._by_type.get(event_type, [])
+             if self.options_by_event.get(row['id'])),
+            key=lambda r: r.get('min_year') or 0,
+        )
+        self._fallback_bands: List[int] = sorted(
+            {row.get('min_year') or 0 for row in fallback_rows}
+            | {row['max_year'] + 1 for row in fallback_rows if row.get('max_year') is not None}
+        )
+        self._fallback_samplers: List[Tuple[List[Dict[str, Any]], AliasSampler]] = []
+        for band_start in self._fallback_bands:
+            rows = [row for row in fallback_rows if _year_range(row)[0] <= band_start <= _year_range(row)[1]]
+            self._fallback_samplers.append((rows, AliasSampler([row.get('frequency_weight', 1) for row in rows])))
+
+        self.fingerprint: str = _fingerprint(event_rows, option_rows)
+
+    def events_for_year(self, event_type: str, year: int) -> List[Dict[str, Any]]:
+        """Возвращает события заданного типа, у которых min_year <= year."""
+        rows = self._by_type.get(event_type)
+        if not rows:
+            return []
+        return rows[:bisect.bisect_right(self._min_years[event_type], year)]
+
+    def sample_fallback(self, year: int, rng: random.Random, history: Optional[EventHistory] = None,
+                        ignore_cooldown: bool = False) -> Optional[Dict[str, Any]]:
+        """Выбирает случайное/персонажное событие для года за O(log полос) + O(1).
+
+        События, которые history не разрешает (уже показанные уникальные и недавние,
+        если не задан ignore_cooldown), отбрасываются повторной выборкой; если
+        несколько попыток подряд неудачны, выбор идет по отфильтрованному списку полосы.
+        """
+        band = bisect.bisect_right(self._fallback_bands, year) - 1
+        if band < 0:
+            return None
+        rows, sampler = self._fallback_samplers[band]
+        for _ in range(FALLBACK_SAMPLE_ATTEMPTS if history is not None else 1):
+            idx = sampler.sample(rng)
+            if idx is None:
+                return None
+            if history is None or history.allows(rows[idx], ignore_cooldown):
+                return rows[idx]
+        allowed = [row for row in rows if history.allows(row, ignore_cooldown)]
+        cum_weights = list(itertools.accumulate(max(row.get('frequency_weight', 1) or 0, 0) for row in allowed))
+        if not cum_weights or cum_weights[-1] <= 0:
+            return None
+        return allowed[bisect.bisect_right(cum_weights, rng.random() * cum_weights[-1])]
+
+    def __len__(self) -> int:
+        return len(self.events_by_id)
+
+
+def _year_range(row: Dict[str, Any]) -> Tuple[float, float]:
+    """Годы, в которые событие может выпасть: [min_year, max_year] (max_year пустой - без ограничения)."""
+    max_year = row.get('max_year')
+    return (row.get('min_year') or 0, max_year if max_year is not None else float("inf"))
+
+
+def option_order(option: Dict[str, Any]) -> int:
+    """Ключ сортировки вариантов по display_order (NULL в БД считается нулем).
+
+    Один ключ для каталога, кнопок и спекуляции: индекс кнопки choice_N должен
+    указывать на тот же вариант, что и при расчете хода.
+    """
+    return option.get('display_order') or 0
+
+
+def group_options(option_rows: Iterable[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+    """Группирует варианты по event_id, сортируя каждую группу по display_order."""
+    options_by_event: Dict[int, List[Dict[str, Any]]] = {}
+    for opt in option_rows:
+        options_by_event.setdefault(opt['event_id'], []).append(opt)
+    for opts in options_by_event.values():
+        opts.sort(key=option_order)
+    return options_by_event
+
+
+def _fingerprint(event_rows: List[Dict[str, Any]], option_rows: List[Dict[str, Any]]) -> str:
+    """Считает отпечаток контента, чтобы не менять версию каталога, если данные не изменились."""
+    payload = json.dumps([event_rows, option_rows], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class EventCatalog:
+    """In-memory каталог событий и вариантов ответов.
+
+    Загружается при старте бота и передается в хендлеры через диспетчер
+    (так же, как db_client). Обновляется по TTL в фоне: пока идет перезагрузка,
+    хендлеры продолжают работать со старым снимком без обращений к БД.
+    Если задан bundle_path, снимок читается из скомпилированного пакета
+    (game/bundle.py), а по TTL проверяется только, не заменен ли файл.
+    """
+    def __init__(self, ttl_seconds: Optional[float] = None, bundle_path: Optional[str] = None):
+        self.bundle_path = bundle_path if bundle_path is not None else config.CONTENT_BUNDLE_PATH
+        if ttl_seconds is None:
+            ttl_seconds = config.CONTENT_BUNDLE_CHECK_SECONDS if self.bundle_path else config.EVENT_CATALOG_TTL_SECONDS
+        self.ttl_seconds = ttl_seconds
+        self.version: int = 0 # Увеличивается только при реальном изменении контента
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._loaded_at: float = 0.0
+        self._bundle_stamp: Optional[Tuple[int, int, int]] = None
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        return self._snapshot
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    async def load(self, db_client: Storage) -> bool:
+        """Загружает (или перезагружает) весь каталог из пакета контента или из БД.
+
+        Returns:
+            True если каталог успешно загружен, иначе False (старый снимок сохраняется).
+        """
+        async with self._refresh_lock:
+            if self.bundle_path:
+                loaded = await self._load_bundle()
+                if loaded is not None:
+                    return loaded
+
+            if not db_client:
+                logging.error("Invalid db_client provided to EventCatalog.load.")
+                return False
+            try:
+                if config.EVENTS_EMBED_OPTIONS:
+                    # События и их варианты - одним (постраничным) запросом
+                    event_rows = await db_client.fetch_events(with_options=True)
+                    option_rows = [opt for row in event_rows for opt in (row.pop("event_options", None) or [])]
+                else:
+                    event_rows = await db_client.fetch_events(with_options=False)
+                    option_rows = await db_client.fetch_event_options([row['id'] for row in event_rows])
+            except Exception as e:
+                logging.exception(f"Error loading event catalog: {e}")
+                return False
+
+            self._install(CatalogSnapshot(event_rows, option_rows))
+            return True
+
+    async def _load_bundle(self) -> Optional[bool]:
+        """Читает снимок из пакета, если файл изменился с прошлой загрузки.
+
+        Returns:
+            True/False как load(); None, если пакет недоступен и снимка еще нет (нужна загрузка из БД).
+        """
+        stamp = bundle_stamp(self.bundle_path)
+        if stamp is not None and stamp == self._bundle_stamp:
+            self._loaded_at = time.monotonic()
+            return True
+        started = time.perf_counter()
+        try:
+            # Чтение и распаковка - в потоке, чтобы не блокировать цикл событий при горячей замене
+            snapshot, info = await asyncio.to_thread(read_section, self.bundle_path, SECTION_EVENTS)
+        except BundleError as e:
+            logging.warning(f"Content bundle not loaded: {e}")
+            if self._snapshot is not None:
+                self._loaded_at = time.monotonic() # Старый снимок остается, повторим после TTL
+                return False
+            return None
+        self._bundle_stamp = stamp
+        logging.info(f"Event catalog read from bundle {self.bundle_path} (fingerprint {info.fingerprint[:12]}) "
+                     f"in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        self._install(snapshot)
+        return True
+
+    def _install(self, snapshot: CatalogSnapshot) -> None:
+        self._loaded_at = time.monotonic()
+        if self._snapshot is not None and self._snapshot.fingerprint == snapshot.fingerprint:
+            logging.info(f"Event catalog unchanged (version {self.version}, {len(snapshot)} events).")
+            return
+
+        self._snapshot = snapshot # Атомарная подмена снимка
+        self.version += 1
+        logging.info(f"Event catalog loaded: version {self.version}, {len(snapshot)} events, "
+                     f"{sum(len(options) for options in snapshot.options_by_event.values())} options.")
+
+    def schedule_refresh(self, db_client: Storage) -> None:
+        """Запускает фоновое обновление каталога, если истек TTL и обновление еще не идет."""
+        if not self.is_stale():
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self.load(db_client))
+
+    def get_event(self, event_id: int) -> Optional[Dict[str, Any]]:
+        if self._snapshot is None:
+            return None
+        return self._snapshot.events_by_id.get(event_id)
+
+    def get_options(self, event_id: int) -> List[Dict[str, Any]]:
+        """Возвращает варианты ответов события, отсортированные по display_order."""
+        if self._snapshot is None:
+            return []
+        return self._snapshot.options_by_event.get(event_id, [])
+
+    def get_effect(self, option: Dict[str, Any]) -> CompiledEffect:
+        """Возвращает скомпилированный эффект варианта (компилирует на лету, если его нет в снимке)."""
+        if self._snapshot is not None:
+            effect = self._snapshot.option_effects.get(option.get('id'))
+            if effect is not None:
+                return effect
+        return compile_effects(option.get('effects'), source=f"option {option.get('id')}")
@@ -0,0 +1,145 @@
+import bisect
+import operator
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Поддерживаемые операторы условий trigger_conditions
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "<=": operator.le,
+    ">=": operator.ge,
+    "<": operator.lt,
+    ">": operator.gt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Параметры страны, которые можно использовать в условиях
+CONDITION_KEYS = ("support", "treasury", "army", "peasants", "current_year")
+# Числовые параметры, по диапазонам которых строится индекс условных событий
+RANGE_KEYS = ("support", "treasury", "current_year")
+
+INF = float("inf")
+
+
+class CompiledCondition:
+    """Условие события, один раз разобранное из JSON trigger_conditions.
+
+    Вызов с объектом Country проверяет условие без разбора словаря:
+    список (атрибут, оператор, значение) проходится одним циклом.
+    Дополнительно хранит диапазоны [lo, hi] по RANGE_KEYS для индекса.
+    """
+    __slots__ = ("checks", "ranges")
+
+    def __init__(self, conditions: Optional[Dict[str, Any]]):
+        self.checks: Tuple[Tuple[str, Callable[[Any, Any], bool], Any], ...] = ()
+        self.ranges: Dict[str, Tuple[float, float]] = {}
+
+        checks = []
+        for key, condition in (conditions or {}).items():
+            if key not in CONDITION_KEYS or not isinstance(condition, dict):
+                continue # Неизвестный параметр в условиях
+            lo, hi = -INF, INF
+            for op_name, value in condition.items():
+                op = OPERATORS.get(op_name)
+                if op is None:
+                    continue # Неизвестный оператор игнорируется, как и раньше
+                checks.append((key, op, value))
+                if key in RANGE_KEYS and isinstance(value, (int, float)):
+                    # Строгие неравенства в индексе расширяем до нестрогих -
+                    # точную проверку все равно выполняет сам предикат
+                    if op_name in ("<=", "<", "=="):
+                        hi = min(hi, value)
+                    if op_name in (">=", ">", "=="):
+                        lo = max(lo, value)
+            if key in RANGE_KEYS and (lo, hi) != (-INF, INF):
+                self.ranges[key] = (lo, hi)
+        self.checks = tuple(checks)
+
+    def __call__(self, country: Any) -> bool:
+        for key, op, value in self.checks:
+            if not op(getattr(country, key), value):
+                return False
+        return True
+
+
+def compile_conditions(conditions: Optional[Dict[str, Any]]) -> CompiledCondition:
+    """Компилирует JSON trigger_conditions в предикат."""
+    return CompiledCondition(conditions)
+
+
+class _SegmentTable:
+    """Разбиение оси одного параметра на отрезки между границами диапазонов.
+
+    Для каждого отрезка заранее посчитано множество событий, чей диапазон его
+    покрывает, поэтому запрос - это bisect и готовое множество.
+    """
+    __slots__ = ("bounds", "members")
+
+    def __init__(self, ranges: Sequence[Tuple[float, float]]):
+        # Отрезок i: [bounds[i-1], bounds[i]); концы диапазонов включительные, поэтому hi + eps
+        points = sorted({lo for lo, _ in ranges if lo != -INF} | {_after(hi) for _, hi in ranges if hi != INF})
+        self.bounds: List[float] = points
+        self.members: List[frozenset] = []
+        for i in range(len(points) + 1):
+            probe = points[i - 1] if i > 0 else (points[0] - 1 if points else 0)
+            self.members.append(frozenset(
+                idx for idx, (lo, hi) in enumerate(ranges) if lo <= probe <= hi
+            ))
+
+    def lookup(self, value: float) -> frozenset:
+        return self.members[bisect.bisect_right(self.bounds, value)]
+
+
+def _after(value: float) -> float:
+    """Ближайшая точка справа от включительной верхней границы."""
+    return value + 1 if isinstance(value, int) else value + 1e-9
+
+
+class ConditionIndex:
+    """Индекс условных событий по диапазонам support/treasury/current_year.
+
+    Вместо перебора всего каталога находит кандидатов пересечением заранее
+    посчитанных множеств (начиная с самого маленького), а затем проверяет
+    только их скомпилированными предикатами.
+    """
+
+    def __init__(self, items: Sequence[Any], conditions: Sequence[CompiledCondition],
+                 extra_ranges: Optional[Dict[str, Sequence[Tuple[float, float]]]] = None):
+        """
+        Args:
+            items: Индексируемые объекты (например, строки событий).
+            conditions: Скомпилированные условия, по одному на объект.
+            extra_ranges: Дополнительные ограничения по RANGE_KEYS (например, min_year для current_year).
+        """
+        self.items = list(items)
+        self.conditions = list(conditions)
+        self._tables: Dict[str, _SegmentTable] = {}
+        for key in RANGE_KEYS:
+            ranges = []
+            for idx, condition in enumerate(self.conditions):
+                lo, hi = condition.ranges.get(key, (-INF, INF))
+                if extra_ranges and key in extra_ranges:
+                    extra_lo, extra_hi = extra_ranges[key][idx]
+                    lo, hi = max(lo, extra_lo), min(hi, extra_hi)
+                ranges.append((lo, hi))
+            if any(r != (-INF, INF) for r in ranges):
+                self._tables[key] = _SegmentTable(ranges)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def candidates(self, country: Any) -> List[Any]:
+        """Возвращает объекты, условия которых выполняются для country (в исходном порядке)."""
+        if not self.items:
+            return []
+        sets = sorted((table.lookup(getattr(country, key)) for key, table in self._tables.items()), key=len)
+        if sets:
+            selected = set(sets[0])
+            for other in sets[1:]:
+                selected &= other
+                if not selected:
+                    return []
+            indices = sorted(selected)
+        else:
+            indices = range(len(self.items))
+        conditions = self.conditions
+        return [self.items[idx] for idx in indices if conditions[idx](country)]
@@ -1,30 +1,80 @@
 from typing import Dict, Any
 import config
+from game.effects import CompiledEffect, compile_effects
+from game.history import EventHistory
+from game.mechanics import ARMY_LEVELS, PEASANT_LEVELS
+
+# Обратные таблицы: код уровня -> название
+ARMY_LEVEL_NAMES = {code: name for name, code in ARMY_LEVELS.items()}
+PEASANT_LEVEL_NAMES = {code: name for name, code in PEASANT_LEVELS.items()}
+
 
 class Country:
-    """Класс, представляющий состояние страны игрока."""
+    """Класс, представляющий состояние страны игрока.
+
+    Уровни армии и крестьян хранятся целочисленными кодами (ARMY_LEVELS, PEASANT_LEVELS);
+    свойства army/peasants по-прежнему возвращают и принимают названия уровней.
+    history - показанные в этом правлении события (см. game.history).
+    """
+    __slots__ = ("support", "treasury", "army_level", "peasants_level", "current_year", "history")
+
     def __init__(self):
         self.support: int = config.INITIAL_SUPPORT
         self.treasury: int = config.INITIAL_TREASURY
-        self.army: str = config.INITIAL_ARMY # Возможные значения: low, medium, high
-        self.peasants: str = config.INITIAL_PEASANTS # Возможные значения: low, medium, high
+        self.army_level: int = ARMY_LEVELS[config.INITIAL_ARMY]
+        self.peasants_level: int = PEASANT_LEVELS[config.INITIAL_PEASANTS]
         # Дополнительные параметры можно добавить позже (например, год правления)
         self.current_year: int = 1
+        self.history: EventHistory = EventHistory()
+
+    @property
+    def army(self) -> str:
+        return ARMY_LEVEL_NAMES[self.army_level]
+
+    @army.setter
+    def army(self, value: str) -> None:
+        if value not in ARMY_LEVELS:
+            raise ValueError(f"Unknown army level: {value!r}")
+        self.army_level = ARMY_LEVELS[value]
+
+    @property
+    def peasants(self) -> str:
+        return PEASANT_LEVEL_NAMES[self.peasants_level]
+
+    @peasants.setter
+    def peasants(self, value: str) -> None:
+        if value not in PEASANT_LEVELS:
+            raise ValueError(f"Unknown peasants level: {value!r}")
+        self.peasants_level = PEASANT_LEVELS[value]
+
+    def copy(self) -> "Country":
+        """Возвращает независимую копию состояния страны."""
+        other = Country.__new__(Country)
+        other.support = self.support
+        other.treasury = self.treasury
+        other.army_level = self.army_level
+        other.peasants_level = self.peasants_level
+        other.current_year = self.current_year
+        other.history = self.history.copy()
+        return other
+
+    def apply_effect(self, effect: CompiledEffect):
+        """Применяет скомпилированный эффект варианта (см. game.effects)."""
+        self.support += effect.support
+        self.treasury += effect.treasury
+        self.current_year += effect.current_year
+        if effect.army:
+            self.army_level = effect.army
+        if effect.peasants:
+            self.peasants_level = effect.peasants
 
     def update(self, effects: Dict[str, Any]):
-        """Обновляет показатели страны на основе словаря эффектов события."""
-        for key, value in effects.items():
-            if hasattr(self, key):
-                current_value = getattr(self, key)
-                if isinstance(current_value, int):
-                    setattr(self, key, current_value + value)
-                elif isinstance(current_value, str):
-                    # Пока просто присваиваем новое строковое значение (для army, peasants)
-                    setattr(self, key, value)
-                # Добавить обработку других типов, если потребуется
-            else:
-                # Можно добавить логирование или обработку неизвестных ключей
-                print(f"Предупреждение: Неизвестный ключ '{key}' в эффектах события.")
+        """Обновляет показатели страны на основе словаря эффектов события.
+
+        Словарь компилируется на лету; в горячем пути используйте apply_effect
+        с эффектом, скомпилированным при загрузке контента.
+        """
+        self.apply_effect(compile_effects(effects))
 
     def get_state(self) -> Dict[str, Any]:
         """Возвращает текущее состояние страны в виде словаря."""
@@ -0,0 +1,75 @@
+import logging
+from typing import Any, Dict, Optional
+
+from game.mechanics import ARMY_LEVELS, PEASANT_LEVELS
+
+# Числовые параметры страны: эффект прибавляется к текущему значению
+NUMERIC_EFFECT_KEYS = ("support", "treasury", "current_year")
+# Уровневые параметры: эффект задает новый уровень (low/medium/high)
+LEVEL_EFFECT_KEYS = {"army": ARMY_LEVELS, "peasants": PEASANT_LEVELS}
+
+
+class CompiledEffect:
+    """Эффект варианта ответа, один раз разобранный из JSON effects.
+
+    Хранит дельты числовых параметров и коды новых уровней (0 - без изменений),
+    поэтому применение выбора - несколько целочисленных операций без обхода словаря.
+    """
+    __slots__ = ("support", "treasury", "current_year", "army", "peasants")
+
+    def __init__(self, support: int = 0, treasury: int = 0, current_year: int = 0, army: int = 0, peasants: int = 0):
+        self.support = support
+        self.treasury = treasury
+        self.current_year = current_year
+        self.army = army
+        self.peasants = peasants
+
+    def __reduce__(self):
+        # Компактная сериализация для пакета контента (game/bundle.py): кортеж вместо словаря слотов
+        return (CompiledEffect, (self.support, self.treasury, self.current_year, self.army, self.peasants))
+
+    def __bool__(self) -> bool:
+        return any((self.support, self.treasury, self.current_year, self.army, self.peasants))
+
+    def __repr__(self) -> str:
+        return (f"CompiledEffect(support={self.support}, treasury={self.treasury}, current_year={self.current_year}, "
+                f"army={self.army}, peasants={self.peasants})")
+
+
+NO_EFFECT = CompiledEffect()
+
+
+def compile_effects(effects: Optional[Dict[str, Any]], source: str = "") -> CompiledEffect:
+    """Проверяет и компилирует JSON effects варианта в CompiledEffect.
+
+    Неизвестные ключи и значения неверного типа пропускаются с предупреждением
+    (раньше Country.update печатал предупреждение на каждом ходу).
+
+    Args:
+        effects: Словарь эффектов из event_options.effects.
+        source: Описание источника для логов (например, "option 12").
+    """
+    if not effects:
+        return NO_EFFECT
+    if not isinstance(effects, dict):
+        logging.warning(f"Effects of {source or 'option'} must be an object, got {type(effects).__name__}. Ignored.")
+        return NO_EFFECT
+
+    compiled = CompiledEffect()
+    for key, value in effects.items():
+        if key in NUMERIC_EFFECT_KEYS:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            if not isinstance(value, int) or isinstance(value, bool):
+                logging.warning(f"Effect '{key}' of {source or 'option'} must be an integer, got {value!r}. Ignored.")
+                continue
+            setattr(compiled, key, getattr(compiled, key) + value)
+        elif key in LEVEL_EFFECT_KEYS:
+            code = LEVEL_EFFECT_KEYS[key].get(value) if isinstance(value, str) else None
+            if code is None:
+                logging.warning(f"Effect '{key}' of {source or 'option'} has unknown level {value!r}. Ignored.")
+                continue
+            setattr(compiled, key, code)
+        else:
+            logging.warning(f"Unknown effect key '{key}' in {source or 'option'}. Ignored.")
+    return compiled
@@ -1,12 +1,20 @@
+import bisect
+import itertools
 import logging
 from typing import List, Dict, Any, Optional, Tuple
 import random
 import json # Для работы с JSONB из БД
 
-# Импортируем AsyncClient для type hinting
-from supabase._async.client import AsyncClient
-
+from data.storage import Storage
 from game.core import Country # Нужен для проверки условий
+from game.catalog import EventCatalog, group_options, option_order
+from game.conditions import compile_conditions
+import config
+from utils.metrics import STORAGE_ERRORS, STORAGE_LATENCY, timed
+from utils.tracing import traced
+
+# Генератор по умолчанию; для воспроизводимости в функции выбора можно передать свой random.Random(seed)
+_default_rng = random.Random()
 
 # --- Классы событий и AVAILABLE_EVENTS теперь не нужны --- 
 
@@ -29,11 +37,12 @@ class EventData:
                 opt.get('outcome_text'), 
                 opt.get('image_url_result')
             ) 
-            for opt in sorted(self.options, key=lambda x: x.get('display_order', 0))
+            for opt in sorted(self.options, key=option_order)
         ]
 
 # Функция теперь принимает db_client
-async def fetch_event_options(db_client: AsyncClient, event_id: int) -> List[Dict[str, Any]]:
+@traced("fetch_options")
+async def fetch_event_options(db_client: Storage, event_id: int) -> List[Dict[str, Any]]:
     """Загружает варианты ответов для заданного ID события."""
     # Убираем импорт и проверку глобальной supabase
     # from data.database import supabase
@@ -42,114 +51,153 @@ async def fetch_event_options(db_client: AsyncClient, event_id: int) -> List[Dic
         return []
     try:
         # Используем db_client
-        query = (
-            db_client.table("event_options")
-            .select("id", "button_text", "effects", "outcome_text", "image_url_result", "next_event_name", "display_order")
-            .eq("event_id", event_id)
-            .order("display_order") # Запрашиваем сортировку сразу
-        )
-        response = await query.execute()
-        return response.data if response.data else []
+        return await db_client.fetch_event_options([event_id])
     except Exception as e:
         logging.exception(f"Error fetching options for event_id {event_id}: {e}")
         return []
 
 def check_trigger_conditions(conditions: Optional[Dict[str, Any]], country: Country) -> bool:
-    """Проверяет, выполняются ли условия события для текущего состояния страны."""
+    """Проверяет, выполняются ли условия события для текущего состояния страны.
+
+    Для событий из каталога условия компилируются один раз при загрузке
+    (см. game/conditions.py); эта функция нужна для строк, пришедших из БД напрямую.
+    """
     if not conditions: # Если условий нет, событие может сработать
         return True
-    
-    for key, condition in conditions.items():
-        if not hasattr(country, key):
-            continue # Неизвестный параметр в условиях
-            
-        country_value = getattr(country, key)
-        
-        for operator, value in condition.items():
-            if operator == "<=" and not (country_value <= value):
-                return False
-            if operator == ">=" and not (country_value >= value):
-                return False
-            if operator == "<" and not (country_value < value):
-                return False
-            if operator == ">" and not (country_value > value):
-                return False
-            if operator == "==" and not (country_value == value):
-                return False
-            if operator == "!=" and not (country_value != value):
-                 return False
-            # Можно добавить другие операторы при необходимости
-            
-    return True # Все условия выполнены
+    return compile_conditions(conditions)(country)
+
+def is_available(row: Dict[str, Any], country: Country, ignore_cooldown: bool = False) -> bool:
+    """Не истек ли max_year события и разрешает ли его история правления (is_unique, повторы)."""
+    max_year = row.get('max_year')
+    if max_year is not None and country.current_year > max_year:
+        return False
+    return country.history.allows(row, ignore_cooldown)
+
+def weighted_choice(rows: List[Dict[str, Any]], rng: random.Random) -> Optional[Dict[str, Any]]:
+    """Взвешенный выбор по frequency_weight (кумулятивные суммы + bisect).
+
+    Возвращает None, если у всех строк нулевой вес.
+    """
+    cum_weights = list(itertools.accumulate(max(row.get('frequency_weight', 1) or 0, 0) for row in rows))
+    if not cum_weights or cum_weights[-1] <= 0:
+        return None
+    return rows[bisect.bisect_right(cum_weights, rng.random() * cum_weights[-1])]
+
+def _event_data(chosen_event_row: Optional[Dict[str, Any]], options_by_event: Dict[int, List[Dict[str, Any]]], country: Country) -> Optional[EventData]:
+    if chosen_event_row is None:
+        logging.warning(f"No suitable events found for player state: {country.get_state()}")
+        return None # Или вернуть стандартное "ничего не происходит" событие?
+    event_id = chosen_event_row['id']
+    logging.info(f"Selected event: ID={event_id}, Name={chosen_event_row.get('name')}")
+    return EventData(chosen_event_row, options_by_event[event_id])
+
+def choose_event(
+    eligible_conditional_rows: List[Dict[str, Any]],
+    fallback_rows: List[Dict[str, Any]],
+    options_by_event: Dict[int, List[Dict[str, Any]]],
+    country: Country,
+    rng: Optional[random.Random] = None,
+) -> Optional[EventData]:
+    """Выбирает событие из уже загруженных кандидатов без обращений к БД.
+
+    1. Условные события, чьи условия уже проверены, иначе случайные/персонажные.
+    2. События без вариантов ответа, с истекшим max_year и запрещенные историей
+       правления (is_unique, недавние) отбрасываются ДО выбора, поэтому
+       повторные попытки (и лишние запросы) больше не нужны.
+    3. Взвешенный случайный выбор по frequency_weight.
+    4. Если без повторов выбрать нечего, выбор повторяется без учета недавних
+       событий: лучше повторить событие, чем оборвать правление.
+    """
+    rng = rng if rng is not None else _default_rng
+    chosen_event_row = None
+    for ignore_cooldown in (False, True):
+        possible_events = [event_row for event_row in eligible_conditional_rows
+                           if options_by_event.get(event_row['id']) and is_available(event_row, country, ignore_cooldown)]
+        chosen_event_row = weighted_choice(possible_events, rng)
+        if chosen_event_row is None:
+            possible_events = [event_row for event_row in fallback_rows
+                               if options_by_event.get(event_row['id']) and is_available(event_row, country, ignore_cooldown)]
+            chosen_event_row = weighted_choice(possible_events, rng)
+        if chosen_event_row is not None or not country.history.recent:
+            break
+    return _event_data(chosen_event_row, options_by_event, country)
+
+def select_event_from_catalog(catalog: EventCatalog, country: Country, rng: Optional[random.Random] = None) -> Optional[EventData]:
+    """Выбирает следующее событие из in-memory каталога без обращений к БД.
+
+    Условные события ищутся по индексу диапазонов, случайные/персонажные -
+    готовыми alias-таблицами полосы лет, поэтому стоимость выбора не растет
+    с размером каталога. События, запрещенные историей правления, отбрасываются;
+    если после этого выбрать нечего, недавние события разрешаются повторно (как в choose_event).
+    """
+    snapshot = catalog.snapshot
+    if snapshot is None:
+        return None
+    rng = rng if rng is not None else _default_rng
+    # min_year/max_year учтены в индексе; история проверяется по битовой карте за O(1) на кандидата
+    history = country.history
+    chosen_event_row = None
+    for ignore_cooldown in (False, True):
+        chosen_event_row = weighted_choice([row for row in snapshot.conditional_index.candidates(country)
+                                            if history.allows(row, ignore_cooldown)], rng)
+        if chosen_event_row is None:
+            chosen_event_row = snapshot.sample_fallback(country.current_year, rng, history, ignore_cooldown)
+        if chosen_event_row is not None or not history.recent:
+            break
+    return _event_data(chosen_event_row, snapshot.options_by_event, country)
+
+async def fetch_candidate_events(db_client: Storage, current_year: int) -> Tuple[List[Dict[str, Any]], Dict[int, List[Dict[str, Any]]]]:
+    """Загружает всех кандидатов на текущий год вместе с вариантами ответов.
+
+    В режиме EVENTS_EMBED_OPTIONS варианты встраиваются в ответ PostgREST
+    (один запрос). Иначе варианты всех кандидатов догружаются одним запросом in_.
+
+    Returns:
+        (строки событий, словарь event_id -> варианты, отсортированные по display_order)
+    """
+    # max_year и история игрока проверяются при выборе (choose_event)
+    event_rows = await db_client.fetch_events(
+        ["conditional", "random", "character"], max_min_year=current_year, with_options=config.EVENTS_EMBED_OPTIONS
+    )
+
+    if config.EVENTS_EMBED_OPTIONS:
+        options_by_event = group_options(
+            opt for row in event_rows for opt in (row.pop("event_options", None) or [])
+        )
+    else:
+        option_rows = await db_client.fetch_event_options([row['id'] for row in event_rows])
+        options_by_event = group_options(option_rows)
+    return event_rows, options_by_event
 
 # Функция теперь принимает db_client
-async def get_next_event(db_client: AsyncClient, country: Country) -> Optional[EventData]:
-    """Выбирает и возвращает следующее событие из базы данных.
-
-    Логика выбора (упрощенная):
-    1. Ищет подходящие условные события.
-    2. Если нет, ищет подходящие случайные/персонажные события.
-    3. Выбирает одно случайным образом с учетом веса.
-    4. Загружает варианты ответов для выбранного события.
+@timed(STORAGE_LATENCY, "get_next_event")
+@traced("select_event")
+async def get_next_event(db_client: Storage, country: Country, event_catalog: Optional[EventCatalog] = None, rng: Optional[random.Random] = None) -> Optional[EventData]:
+    """Выбирает и возвращает следующее событие.
+
+    Если передан загруженный event_catalog, событие выбирается из памяти
+    (каталог при необходимости обновляется в фоне) - без обращений к БД.
+    Иначе кандидаты вместе с вариантами ответов загружаются одним запросом.
+    rng позволяет передать генератор с известным зерном, чтобы воспроизвести выбор.
     """
-    # Убираем импорт и проверку глобальной supabase
-    # from data.database import supabase
+    if event_catalog is not None and event_catalog.is_loaded:
+        event_catalog.schedule_refresh(db_client)
+        return select_event_from_catalog(event_catalog, country, rng)
+
     if not db_client:
         logging.error("Invalid db_client provided to get_next_event.")
         return None
 
-    possible_events = []
     try:
-        # Используем db_client
-        query_conditional = (
-            db_client.table("events")
-            .select("id", "name", "description", "image_url_prompt", "character_name", "trigger_conditions", "frequency_weight")
-            .eq("event_type", "conditional")
-            .lte("min_year", country.current_year)
-            # TODO: Добавить проверку max_year, is_unique (по истории событий)
-        )
-        response_conditional = await query_conditional.execute()
-
-        if response_conditional.data:
-            for event_row in response_conditional.data:
-                conditions = event_row.get("trigger_conditions")
-                if check_trigger_conditions(conditions, country):
-                    possible_events.append(event_row)
-        
-        if not possible_events:
-            # Используем db_client
-            query_random = (
-                db_client.table("events")
-                .select("id", "name", "description", "image_url_prompt", "character_name", "trigger_conditions", "frequency_weight")
-                .in_("event_type", ["random", "character"]) # Ищем случайные и персонажные
-                .lte("min_year", country.current_year)
-                # TODO: Добавить проверку max_year, is_unique (по истории событий)
-            )
-            response_random = await query_random.execute()
-            if response_random.data:
-                possible_events.extend(response_random.data)
-
-        if not possible_events:
-            logging.warning(f"No suitable events found for player state: {country.get_state()}")
-            return None # Или вернуть стандартное "ничего не происходит" событие?
-
-        # Взвешенный случайный выбор
-        weights = [event.get('frequency_weight', 1) for event in possible_events]
-        chosen_event_row = random.choices(possible_events, weights=weights, k=1)[0]
-
-        # --- Шаг 4: Загрузка вариантов --- 
-        event_id = chosen_event_row['id']
-        # Передаем db_client в fetch_event_options
-        options = await fetch_event_options(db_client, event_id)
-
-        if not options:
-            logging.error(f"No options found for chosen event_id {event_id}! Skipping event.")
-            # Передаем db_client при рекурсивном вызове
-            return await get_next_event(db_client, country) # Рекурсивная попытка найти другое событие
-
-        logging.info(f"Selected event: ID={event_id}, Name={chosen_event_row.get('name')}")
-        return EventData(chosen_event_row, options)
-
+        event_rows, options_by_event = await fetch_candidate_events(db_client, country.current_year)
     except Exception as e:
+        STORAGE_ERRORS.inc("get_next_event")
         logging.exception(f"Error getting next event: {e}")
         return None
+
+    conditional_rows = [
+        row for row in event_rows
+        if row.get("event_type") == "conditional" and check_trigger_conditions(row.get("trigger_conditions"), country)
+    ]
+    fallback_rows = [row for row in event_rows if row.get("event_type") in ("random", "character")]
+    return choose_event(conditional_rows, fallback_rows, options_by_event, country, rng)
@@ -0,0 +1,75 @@
+import base64
+import binascii
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import config
+
+
+class EventHistory:
+    """История событий текущего правления: битовая карта показанных событий и последние показы.
+
+    Бит event_id в seen установлен, если событие уже показывалось в этом правлении
+    (проверка is_unique - одна операция с байтом, независимо от длины правления).
+    recent - ID последних cooldown показанных событий: они не повторяются подряд.
+    История хранится в JSON-поле state вместе с показателями страны и
+    сбрасывается вместе с ними в начале нового правления.
+    """
+    __slots__ = ("seen", "recent", "cooldown", "_encoded")
+
+    def __init__(self, seen: Optional[bytearray] = None, recent: Optional[List[int]] = None,
+                 cooldown: int = config.EVENT_REPEAT_COOLDOWN, encoded: Optional[str] = None):
+        self.seen: bytearray = seen if seen is not None else bytearray()
+        self.recent: List[int] = recent if recent is not None else []
+        self.cooldown = cooldown
+        # Последнее base64-представление seen; сбрасывается при record()
+        self._encoded: Optional[str] = encoded
+
+    def has_seen(self, event_id: int) -> bool:
+        byte = event_id >> 3
+        return byte < len(self.seen) and bool(self.seen[byte] & (1 << (event_id & 7)))
+
+    def allows(self, row: Dict[str, Any], ignore_cooldown: bool = False) -> bool:
+        """Можно ли показать событие: уникальное не показывалось, недавнее не повторяется.
+
+        ignore_cooldown снимает запрет на недавние события - для повторного выбора,
+        когда без повторов показать нечего (каталог меньше cooldown).
+        """
+        event_id = row['id']
+        if row.get('is_unique') and self.has_seen(event_id):
+            return False
+        return ignore_cooldown or event_id not in self.recent
+
+    def record(self, event_id: int) -> None:
+        """Отмечает событие как показанное."""
+        byte = event_id >> 3
+        if byte >= len(self.seen):
+            self.seen.extend(bytes(byte + 1 - len(self.seen)))
+        self.seen[byte] |= 1 << (event_id & 7)
+        self._encoded = None
+        if self.cooldown > 0:
+            self.recent.append(event_id)
+            del self.recent[:-self.cooldown]
+
+    def copy(self) -> "EventHistory":
+        return EventHistory(bytearray(self.seen), list(self.recent), self.cooldown, self._encoded)
+
+    def encode(self) -> str:
+        """Битовая карта в base64 (для JSON-поля state)."""
+        if self._encoded is None:
+            self._encoded = base64.b64encode(bytes(self.seen).rstrip(b"\0")).decode("ascii")
+        return self._encoded
+
+    @classmethod
+    def decode(cls, seen_events: str, recent_events: Sequence[int]) -> "EventHistory":
+        try:
+            seen = bytearray(base64.b64decode(seen_events, validate=True)) if seen_events else bytearray()
+        except (binascii.Error, ValueError) as e:
+            # Поврежденная история не должна ломать ход: уникальные события смогут повториться
+            logging.warning(f"Invalid seen_events bitmap, history reset: {e}")
+            return cls(bytearray(), list(recent_events))
+        return cls(seen, list(recent_events), encoded=seen_events)
+
+    def __len__(self) -> int:
+        """Число показанных событий (для логов и отладки)."""
+        return sum(bin(byte).count("1") for byte in self.seen)
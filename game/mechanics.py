@@ -7,6 +7,9 @@ if TYPE_CHECKING:
 ARMY_LEVELS = {"low": 1, "medium": 2, "high": 3}
 PEASANT_LEVELS = {"low": 1, "medium": 2, "high": 3}
 
+# Максимальная длительность правления (после этого правитель умирает от старости)
+MAX_REIGN_YEARS = 40
+
 # Примерные правила взаимосвязи (можно усложнить)
 # - Увеличение армии может уменьшать крестьян
 # - Уменьшение крестьян снижает доход (это будет в логике событий/годового отчета)
@@ -30,7 +33,7 @@ def check_game_over_conditions(country: 'Country') -> str | None:
     # Другие условия (старость, завоевание) можно добавить позже
 
     # Пример условия на старость (например, после 40 лет правления)
-    if country.current_year > 40: # Устанавливаем лимит в 40 лет правления
+    if country.current_year > MAX_REIGN_YEARS: # Устанавливаем лимит в 40 лет правления
        return "Вы правили долго и мудро, но годы берут свое. Вы покинули этот мир от старости."
 
     return None
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import config
+from data.storage import Storage
+from game.bundle import SECTION_NARRATIVE, BundleError, bundle_stamp, read_section
+
+
+class NarrativeSequences:
+    """Неизменяемый снимок нарративных блоков, разложенных по последовательностям.
+
+    Последовательность - блоки одного block_type, доступные в данном прохождении
+    (required_playthrough пустой/0 или равен номеру прохождения), по sequence_order.
+    Для каждой последовательности хранится позиция каждого блока, поэтому
+    переход к следующему блоку - поиск по словарю, а не запрос к БД.
+    """
+
+    def __init__(self, block_rows: List[Dict[str, Any]]):
+        self.blocks_by_id: Dict[int, Dict[str, Any]] = {row['id']: row for row in block_rows}
+        # block_type -> общие блоки; (block_type, playthrough) -> блоки конкретного прохождения
+        self._common: Dict[str, List[Dict[str, Any]]] = {}
+        self._specific: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+        for row in block_rows:
+            required = row.get('required_playthrough')
+            if not required:
+                self._common.setdefault(row['block_type'], []).append(row)
+            else:
+                self._specific.setdefault((row['block_type'], required), []).append(row)
+        # Готовые последовательности: (block_type, playthrough или 0) -> (блоки, block_id -> позиция)
+        self._sequences: Dict[Tuple[str, int], Tuple[List[Dict[str, Any]], Dict[int, int]]] = {}
+        for block_type in self._common:
+            self._build(block_type, 0)
+        for block_type, playthrough in self._specific:
+            self._build(block_type, playthrough)
+
+    def _build(self, block_type: str, playthrough: int) -> None:
+        rows = self._common.get(block_type, []) + self._specific.get((block_type, playthrough), [])
+        rows.sort(key=lambda r: (r.get('sequence_order') or 0, r['id']))
+        self._sequences[(block_type, playthrough)] = (rows, {row['id']: pos for pos, row in enumerate(rows)})
+
+    def sequence(self, block_type: str, playthrough: int) -> Tuple[List[Dict[str, Any]], Dict[int, int]]:
+        """Возвращает последовательность блоков типа для прохождения и карту позиций."""
+        found = self._sequences.get((block_type, playthrough))
+        if found is None:
+            # В этом прохождении нет своих блоков - используется общая последовательность
+            found = self._sequences.get((block_type, 0), ([], {}))
+        return found
+
+    def get(self, block_id: int) -> Optional[Dict[str, Any]]:
+        return self.blocks_by_id.get(block_id)
+
+    def next_pending(self, block_type: str, playthrough: int, completed_ids: Iterable[int],
+                     after_block_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Возвращает следующий непройденный блок последовательности.
+
+        after_block_id - курсор игрока (блок, на кнопку которого он нажал):
+        поиск начинается сразу после него, так что обычно это O(1).
+        Без курсора (например, на /start) поиск идет с начала последовательности.
+        completed_ids остается списком (а не курсором в строке игрока): он короткий
+        и нужен запасному пути через хранилище (fetch_next_narrative_block).
+        """
+        rows, positions = self.sequence(block_type, playthrough)
+        start = positions.get(after_block_id, -1) + 1 if after_block_id is not None else 0
+        completed = completed_ids if isinstance(completed_ids, (set, frozenset)) else set(completed_ids)
+        for row in rows[start:]:
+            if row['id'] not in completed:
+                return row
+        return None
+
+    def __len__(self) -> int:
+        return len(self.blocks_by_id)
+
+
+class NarrativeCatalog:
+    """In-memory каталог нарративных блоков (вступление и т.п.).
+
+    Загружается при старте и передается в хендлеры через диспетчер; обновляется
+    в фоне по тому же TTL, что и каталог событий (или из того же пакета контента).
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, bundle_path: Optional[str] = None):
+        self.bundle_path = bundle_path if bundle_path is not None else config.CONTENT_BUNDLE_PATH
+        if ttl_seconds is None:
+            ttl_seconds = config.CONTENT_BUNDLE_CHECK_SECONDS if self.bundle_path else config.EVENT_CATALOG_TTL_SECONDS
+        self.ttl_seconds = ttl_seconds
+        self._sequences: Optional[NarrativeSequences] = None
+        self._loaded_at: float = 0.0
+        self._bundle_stamp: Optional[Tuple[int, int, int]] = None
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def sequences(self) -> Optional[NarrativeSequences]:
+        return self._sequences
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._sequences is not None
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    async def load(self, db_client: Storage) -> bool:
+        """Загружает все нарративные блоки из пакета контента или из хранилища."""
+        async with self._refresh_lock:
+            if self.bundle_path:
+                loaded = await self._load_bundle()
+                if loaded is not None:
+                    return loaded
+
+            if not db_client:
+                logging.error("Invalid db_client provided to NarrativeCatalog.load.")
+                return False
+            try:
+                block_rows = await db_client.fetch_narrative_blocks()
+            except Exception as e:
+                logging.exception(f"Error loading narrative blocks: {e}")
+                return False
+            self._sequences = NarrativeSequences(block_rows) # Атомарная подмена снимка
+            self._loaded_at = time.monotonic()
+            logging.info(f"Narrative catalog loaded: {len(self._sequences)} blocks.")
+            return True
+
+    async def _load_bundle(self) -> Optional[bool]:
+        """Читает блоки из пакета, если файл изменился. None - пакет недоступен и снимка еще нет."""
+        stamp = bundle_stamp(self.bundle_path)
+        if stamp is not None and stamp == self._bundle_stamp:
+            self._loaded_at = time.monotonic()
+            return True
+        try:
+            sequences, _ = await asyncio.to_thread(read_section, self.bundle_path, SECTION_NARRATIVE)
+        except BundleError as e:
+            logging.warning(f"Narrative blocks not loaded from bundle: {e}")
+            if self._sequences is not None:
+                self._loaded_at = time.monotonic()
+                return False
+            return None
+        self._bundle_stamp = stamp
+        self._sequences = sequences # Атомарная подмена снимка
+        self._loaded_at = time.monotonic()
+        logging.info(f"Narrative catalog loaded from bundle: {len(sequences)} blocks.")
+        return True
+
+    def schedule_refresh(self, db_client: Storage) -> None:
+        """Запускает фоновое обновление, если истек TTL и обновление еще не идет."""
+        if not self.is_stale():
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self.load(db_client))
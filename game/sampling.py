@@ -0,0 +1,43 @@
+import random
+from typing import List, Optional, Sequence
+
+
+class AliasSampler:
+    """Взвешенная выборка за O(1) методом псевдонимов (алгоритм Воуза).
+
+    Таблицы строятся один раз за O(n); каждая выборка - одно случайное число
+    и одно сравнение, независимо от количества элементов.
+    """
+    __slots__ = ("_prob", "_alias", "total_weight")
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        self.total_weight: float = float(sum(w for w in weights if w > 0))
+        self._prob: List[float] = [1.0] * n
+        self._alias: List[int] = list(range(n))
+        if n == 0 or self.total_weight <= 0:
+            return
+
+        scaled = [max(w, 0) * n / self.total_weight for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Остатки из-за погрешности округления считаются "полными" ячейками
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def __len__(self) -> int:
+        return len(self._prob)
+
+    def sample(self, rng: random.Random) -> Optional[int]:
+        """Возвращает индекс элемента или None, если выбирать не из чего."""
+        if self.total_weight <= 0:
+            return None
+        u = rng.random() * len(self._prob)
+        i = int(u)
+        return i if u - i < self._prob[i] else self._alias[i]
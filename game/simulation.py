@@ -0,0 +1,531 @@
+"""Офлайн-симулятор правлений методом Монте-Карло для балансировки контента.
+
+Каталог событий переводится в массивы NumPy, а состояния стран миллионов
+игроков обрабатываются пачками: выбор события, выбор варианта политикой,
+применение эффектов и проверка конца игры выполняются векторно. Выбор события
+учитывает те же ограничения, что и бот: max_year, is_unique и запрет повторов
+(EVENT_REPEAT_COOLDOWN, см. game/history.py).
+
+Запуск:
+    python -m game.simulation --content content.json --players 1000000 --policy random
+    python -m game.simulation --from-storage --players 100000 --policy max_support
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+from game.catalog import FALLBACK_SAMPLE_ATTEMPTS, CatalogSnapshot
+from game.conditions import CompiledCondition
+from game.core import Country
+from game.mechanics import (
+    ARMY_LEVELS,
+    MAX_REIGN_YEARS,
+    PEASANT_LEVELS,
+    calculate_yearly_expenses,
+    calculate_yearly_income,
+)
+
+# Коды причин окончания правления (порядок проверок как в check_game_over_conditions)
+REASON_NONE = 0
+REASON_SUPPORT = 1
+REASON_TREASURY = 2
+REASON_OLD_AGE = 3
+REASON_NO_EVENT = 4 # В боте: "Не найдено следующее событие"
+REASON_NAMES = {
+    REASON_NONE: "still_reigning",
+    REASON_SUPPORT: "overthrown",
+    REASON_TREASURY: "bankrupt",
+    REASON_OLD_AGE: "old_age",
+    REASON_NO_EVENT: "no_event",
+}
+
+# Ограничение на размер временных матриц (игроки x события) в одной пачке
+MAX_CHUNK_CELLS = 20_000_000
+
+# Числовые и уровневые параметры страны
+_NUMERIC_KEYS = ("support", "treasury", "current_year")
+_LEVEL_KEYS = {"army": ARMY_LEVELS, "peasants": PEASANT_LEVELS}
+
+
+def _level_table(levels: Dict[str, int], key: str, func: Callable[[Country], int]) -> np.ndarray:
+    """Табулирует функцию из game.mechanics по кодам уровня (индекс 0 не используется)."""
+    table = np.zeros(max(levels.values()) + 1, dtype=np.int64)
+    for name, code in levels.items():
+        probe = Country()
+        setattr(probe, key, name)
+        table[code] = func(probe)
+    return table
+
+
+class _ConditionGroup:
+    """Проверки одного вида (параметр, оператор) для группы событий - одной операцией NumPy."""
+    __slots__ = ("key", "op", "columns", "values", "tables")
+
+    def __init__(self, key: str, op: Callable, columns: List[int], values: List[Any], levels: Optional[Dict[str, int]]):
+        self.key = key
+        self.op = op
+        self.columns = np.array(columns, dtype=np.int64)
+        self.values = None
+        self.tables = None
+        if levels is None:
+            self.values = np.array(values, dtype=np.float64)
+        else:
+            # Для army/peasants заранее считаем результат оператора для каждого уровня:
+            # строки сравниваются так же, как это делает Country (по значению строки)
+            tables = np.zeros((len(values), max(levels.values()) + 1), dtype=bool)
+            for row, value in enumerate(values):
+                for name, code in levels.items():
+                    try:
+                        tables[row, code] = bool(op(name, value))
+                    except TypeError:
+                        tables[row, code] = False
+            self.tables = tables
+
+    def apply(self, mask: np.ndarray, state: Dict[str, np.ndarray]) -> None:
+        arr = state[self.key]
+        if self.tables is None:
+            mask[:, self.columns] &= self.op(arr[:, None], self.values[None, :])
+        else:
+            mask[:, self.columns] &= self.tables[:, arr].T
+
+
+def _group_checks(conditions: Sequence[CompiledCondition]) -> List[_ConditionGroup]:
+    """Раскладывает скомпилированные условия по группам (параметр, оператор, слой)."""
+    buckets: Dict[Tuple[str, Any, int], Tuple[List[int], List[Any]]] = {}
+    for column, condition in enumerate(conditions):
+        seen: Dict[Tuple[str, Any], int] = {}
+        for key, op, value in condition.checks:
+            # Несколько проверок одного вида у события уходят в разные "слои"
+            layer = seen.get((key, op), 0)
+            seen[(key, op)] = layer + 1
+            columns, values = buckets.setdefault((key, op, layer), ([], []))
+            columns.append(column)
+            values.append(value)
+    return [
+        _ConditionGroup(key, op, columns, values, _LEVEL_KEYS.get(key))
+        for (key, op, _layer), (columns, values) in buckets.items()
+    ]
+
+
+class SimulationModel:
+    """Каталог событий в виде массивов NumPy.
+
+    События нумеруются подряд: сначала условные, затем случайные/персонажные.
+    Эффекты вариантов хранятся матрицами (событие x вариант). История правления
+    хранится в состоянии пачки: "seen" - показанные уникальные события
+    (игрок x уникальное событие), "recent" - кольцевой буфер последних cooldown событий.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot, economy: bool = False,
+                 cooldown: int = config.EVENT_REPEAT_COOLDOWN):
+        self.economy = economy
+        self.cooldown = max(cooldown, 0)
+
+        def playable(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            return [row for row in rows if snapshot.options_by_event.get(row['id'])]
+
+        far_year = 10 ** 9
+        conditional = playable(snapshot.events_for_year("conditional", far_year))
+        fallback = playable(snapshot.events_for_year("random", far_year) + snapshot.events_for_year("character", far_year))
+        fallback.sort(key=lambda row: row.get('min_year') or 0)
+        rows = conditional + fallback
+
+        self.n_conditional = len(conditional)
+        self.event_ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        self.min_year = np.array([row.get('min_year') or 0 for row in rows], dtype=np.int64)
+        max_year = [row.get('max_year') for row in rows]
+        self.max_year = np.array([year if year is not None else np.iinfo(np.int64).max for year in max_year], dtype=np.int64)
+        # Уникальные события получают свой столбец в матрице "seen" (остальные - -1)
+        unique = np.array([bool(row.get('is_unique')) for row in rows], dtype=bool)
+        self.unique_events = np.flatnonzero(unique)
+        self.unique_column = np.full(len(rows), -1, dtype=np.int64)
+        self.unique_column[self.unique_events] = np.arange(len(self.unique_events))
+        self.weight = np.array([row.get('frequency_weight', 1) or 0 for row in rows], dtype=np.float64)
+        self.condition_groups = _group_checks([snapshot.conditions[row['id']] for row in conditional])
+
+        # Эффекты вариантов: дельты чисел и новые уровни (0 = без изменений)
+        max_options = max((len(snapshot.options_by_event[row['id']]) for row in rows), default=1)
+        shape = (len(rows), max_options)
+        self.n_options = np.zeros(len(rows), dtype=np.int64)
+        self.d_support = np.zeros(shape, dtype=np.int64)
+        self.d_treasury = np.zeros(shape, dtype=np.int64)
+        self.d_year = np.zeros(shape, dtype=np.int64)
+        self.set_army = np.zeros(shape, dtype=np.int64)
+        self.set_peasants = np.zeros(shape, dtype=np.int64)
+        for e, row in enumerate(rows):
+            options = snapshot.options_by_event[row['id']]
+            self.n_options[e] = len(options)
+            for o, option in enumerate(options):
+                # Те же скомпилированные эффекты, что применяет Country.apply_effect
+                effect = snapshot.option_effects[option['id']]
+                self.d_support[e, o] = effect.support
+                self.d_treasury[e, o] = effect.treasury
+                self.d_year[e, o] = effect.current_year
+                self.set_army[e, o] = effect.army
+                self.set_peasants[e, o] = effect.peasants
+
+        # Годовые доход/расходы из game.mechanics, табулированные по уровням
+        self.income = _level_table(PEASANT_LEVELS, "peasants", calculate_yearly_income)
+        self.expenses = _level_table(ARMY_LEVELS, "army", calculate_yearly_expenses)
+
+        # Случайные/персонажные события без учета истории зависят только от года:
+        # кумулятивные веса для каждого порога min_year считаются один раз
+        self._fallback_years = self.min_year[self.n_conditional:]
+        self._fallback_cum = np.cumsum(self.weight[self.n_conditional:])
+
+    @property
+    def n_events(self) -> int:
+        return len(self.event_ids)
+
+    def initial_history(self, n: int) -> Dict[str, np.ndarray]:
+        """Пустая история правления для n игроков (добавляется в состояние пачки)."""
+        return {
+            "seen": np.zeros((n, len(self.unique_events)), dtype=bool),
+            "recent": np.full((n, self.cooldown), -1, dtype=np.int64),
+        }
+
+    def record_events(self, state: Dict[str, np.ndarray], events: np.ndarray, turn: int) -> None:
+        """Отмечает показанные события в истории (как EventHistory.record)."""
+        column = self.unique_column[events]
+        unique = column >= 0
+        state["seen"][np.flatnonzero(unique), column[unique]] = True
+        if self.cooldown:
+            state["recent"][:, turn % self.cooldown] = events
+
+    def _history_mask(self, players: np.ndarray, start: int, stop: int, state: Dict[str, np.ndarray],
+                      ignore_cooldown: bool) -> np.ndarray:
+        """Доступность событий [start, stop) для игроков: годы [min_year, max_year],
+        непоказанные уникальные и (без ignore_cooldown) не недавние."""
+        year = state["current_year"][players]
+        mask = (self.min_year[None, start:stop] <= year[:, None]) & (year[:, None] <= self.max_year[None, start:stop])
+        unique = self.unique_events[(self.unique_events >= start) & (self.unique_events < stop)]
+        if len(unique):
+            mask[:, unique - start] &= ~state["seen"][players][:, self.unique_column[unique]]
+        if not ignore_cooldown:
+            self._clear_recent(mask, players, start, state)
+        return mask
+
+    def _clear_recent(self, mask: np.ndarray, players: np.ndarray, start: int, state: Dict[str, np.ndarray]) -> None:
+        """Снимает в маске событий [start, start + ширина) недавние события игроков."""
+        if not self.cooldown:
+            return
+        recent = state["recent"][players]
+        shown = (recent >= start) & (recent < start + mask.shape[1])
+        rows = np.broadcast_to(np.arange(len(players))[:, None], recent.shape)
+        mask[rows[shown], recent[shown] - start] = False
+
+    def _allowed(self, players: np.ndarray, events: np.ndarray, state: Dict[str, np.ndarray]) -> np.ndarray:
+        """Поэлементная проверка: разрешено ли событие events[i] игроку players[i] (с учетом cooldown)."""
+        year = state["current_year"][players]
+        ok = (self.min_year[events] <= year) & (year <= self.max_year[events])
+        column = self.unique_column[events]
+        unique = column >= 0
+        ok[unique] &= ~state["seen"][players[unique], column[unique]]
+        if self.cooldown:
+            ok &= ~(state["recent"][players] == events[:, None]).any(axis=1)
+        return ok
+
+    def _sample_fallback(self, players: np.ndarray, state: Dict[str, np.ndarray], rng: np.random.Generator) -> np.ndarray:
+        """Случайное/персонажное событие для игроков (с учетом истории) или -1.
+
+        Как CatalogSnapshot.sample_fallback: выборка по кумулятивным весам событий
+        с min_year <= год, запрещенные события отбрасываются повторной выборкой,
+        а для оставшихся игроков выбор идет по полной маске доступности.
+        """
+        chosen = np.full(len(players), -1, dtype=np.int64)
+        pending = np.arange(len(players))
+        for _ in range(FALLBACK_SAMPLE_ATTEMPTS):
+            if not len(pending):
+                return chosen
+            k = np.searchsorted(self._fallback_years, state["current_year"][players[pending]], side="right")
+            total = np.where(k > 0, self._fallback_cum[np.maximum(k - 1, 0)], 0.0)
+            pending = pending[total > 0]
+            if not len(pending):
+                return chosen
+            r = rng.random(len(pending)) * total[total > 0]
+            pick = self.n_conditional + np.searchsorted(self._fallback_cum, r, side="right")
+            ok = self._allowed(players[pending], pick, state)
+            chosen[pending[ok]] = pick[ok]
+            pending = pending[~ok]
+        if len(pending):
+            mask = self._history_mask(players[pending], self.n_conditional, self.n_events, state, ignore_cooldown=False)
+            pick = _weighted_pick(mask, self.weight[self.n_conditional:], rng)
+            chosen[pending] = np.where(pick >= 0, self.n_conditional + pick, -1)
+        return chosen
+
+    def select_events(self, state: Dict[str, np.ndarray], rng: np.random.Generator) -> np.ndarray:
+        """Выбирает событие для каждого игрока (индекс события или -1, если событий нет).
+
+        Порядок как в game.events.select_event_from_catalog: условные события, затем
+        случайные/персонажные; если без недавних событий выбрать нечего, выбор
+        повторяется без учета cooldown.
+        """
+        n = len(state["support"])
+        players = np.arange(n)
+        chosen = np.full(n, -1, dtype=np.int64)
+
+        conditional = None
+        if self.n_conditional:
+            conditional = self._history_mask(players, 0, self.n_conditional, state, ignore_cooldown=True)
+            for group in self.condition_groups:
+                group.apply(conditional, state)
+            mask = conditional
+            if self.cooldown:
+                mask = conditional.copy()
+                self._clear_recent(mask, players, 0, state)
+            chosen = _weighted_pick(mask, self.weight[:self.n_conditional], rng)
+
+        rest = np.flatnonzero(chosen < 0)
+        if len(rest) and self.n_events > self.n_conditional:
+            chosen[rest] = self._sample_fallback(rest, state, rng)
+
+        rest = np.flatnonzero(chosen < 0)
+        if len(rest) and self.cooldown:
+            # Повторный выбор без cooldown: лучше повторить событие, чем оборвать правление
+            if conditional is not None:
+                chosen[rest] = _weighted_pick(conditional[rest], self.weight[:self.n_conditional], rng)
+                rest = rest[chosen[rest] < 0]
+            if len(rest) and self.n_events > self.n_conditional:
+                mask = self._history_mask(rest, self.n_conditional, self.n_events, state, ignore_cooldown=True)
+                pick = _weighted_pick(mask, self.weight[self.n_conditional:], rng)
+                chosen[rest] = np.where(pick >= 0, self.n_conditional + pick, -1)
+        return chosen
+
+
+def _weighted_pick(mask: np.ndarray, weight: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Взвешенный выбор столбца в каждой строке маски (-1, если доступных столбцов нет)."""
+    cum = np.cumsum(mask * weight[None, :], axis=1)
+    total = cum[:, -1]
+    pick = np.full(len(mask), -1, dtype=np.int64)
+    has = total > 0
+    if has.any():
+        r = rng.random(int(has.sum())) * total[has]
+        pick[has] = np.argmax(cum[has] > r[:, None], axis=1)
+    return pick
+
+
+# --- Политики выбора варианта ---
+# Политика получает модель, индексы событий, состояние и генератор и возвращает индексы вариантов.
+Policy = Callable[[SimulationModel, np.ndarray, Dict[str, np.ndarray], np.random.Generator], np.ndarray]
+
+
+def policy_random(model: SimulationModel, events: np.ndarray, state: Dict[str, np.ndarray], rng: np.random.Generator) -> np.ndarray:
+    """Равновероятный выбор варианта."""
+    return (rng.random(len(events)) * model.n_options[events]).astype(np.int64)
+
+
+def policy_first(model: SimulationModel, events: np.ndarray, state: Dict[str, np.ndarray], rng: np.random.Generator) -> np.ndarray:
+    """Всегда первый вариант (по display_order)."""
+    return np.zeros(len(events), dtype=np.int64)
+
+
+def _greedy(deltas: np.ndarray) -> Policy:
+    def policy(model: SimulationModel, events: np.ndarray, state: Dict[str, np.ndarray], rng: np.random.Generator) -> np.ndarray:
+        scores = deltas(model)[events].astype(np.float64)
+        valid = np.arange(scores.shape[1])[None, :] < model.n_options[events][:, None]
+        scores[~valid] = -np.inf
+        return np.argmax(scores, axis=1)
+    return policy
+
+
+POLICIES: Dict[str, Policy] = {
+    "random": policy_random,
+    "first": policy_first,
+    "max_support": _greedy(lambda model: model.d_support),
+    "max_treasury": _greedy(lambda model: model.d_treasury),
+}
+
+
+class SimulationReport:
+    """Итоги симуляции: кривая выживания, причины окончания правления и частоты событий."""
+
+    def __init__(self, model: SimulationModel, n_players: int, max_turns: int):
+        self.n_players = n_players
+        self.max_turns = max_turns
+        self.event_ids = model.event_ids
+        # Сколько правлений закончилось после каждого хода
+        self.ended_at_turn = np.zeros(max_turns + 1, dtype=np.int64)
+        self.reasons = np.zeros(len(REASON_NAMES), dtype=np.int64)
+        self.event_counts = np.zeros(model.n_events, dtype=np.int64)
+        self.total_turns = 0
+        self.elapsed_seconds = 0.0
+
+    @property
+    def survival(self) -> np.ndarray:
+        """Доля правлений, продолжающихся после хода t (t = 0..max_turns)."""
+        return 1.0 - np.cumsum(self.ended_at_turn) / max(self.n_players, 1)
+
+    @property
+    def mean_reign_turns(self) -> float:
+        return self.total_turns / max(self.n_players, 1)
+
+    def event_frequencies(self) -> Dict[int, float]:
+        """event_id -> доля показов события среди всех ходов."""
+        total = max(int(self.event_counts.sum()), 1)
+        return {int(event_id): count / total for event_id, count in zip(self.event_ids, self.event_counts)}
+
+    def format(self, top_events: int = 15) -> str:
+        lines = [
+            f"Reigns simulated: {self.n_players} in {self.elapsed_seconds:.1f}s",
+            f"Mean reign length: {self.mean_reign_turns:.2f} turns",
+            "",
+            "Outcomes:",
+        ]
+        for code, name in REASON_NAMES.items():
+            lines.append(f"  {name:<15} {self.reasons[code] / max(self.n_players, 1):7.2%}")
+        lines += ["", "Survival (share still reigning after turn):"]
+        survival = self.survival
+        for turn in range(0, self.max_turns + 1, 5):
+            lines.append(f"  turn {turn:>3}: {survival[turn]:7.2%}")
+        lines += ["", f"Most frequent events (top {top_events}):"]
+        order = np.argsort(-self.event_counts)[:top_events]
+        total = max(int(self.event_counts.sum()), 1)
+        for e in order:
+            if self.event_counts[e]:
+                lines.append(f"  event {int(self.event_ids[e]):>6}: {self.event_counts[e] / total:7.2%}")
+        never = int((self.event_counts == 0).sum())
+        lines.append(f"Events never shown: {never}/{len(self.event_ids)}")
+        return "\n".join(lines)
+
+
+def _simulate_chunk(model: SimulationModel, n: int, policy: Policy, rng: np.random.Generator,
+                    max_turns: int, report: SimulationReport) -> None:
+    state = {
+        "support": np.full(n, config.INITIAL_SUPPORT, dtype=np.int64),
+        "treasury": np.full(n, config.INITIAL_TREASURY, dtype=np.int64),
+        "army": np.full(n, ARMY_LEVELS[config.INITIAL_ARMY], dtype=np.int64),
+        "peasants": np.full(n, PEASANT_LEVELS[config.INITIAL_PEASANTS], dtype=np.int64),
+        "current_year": np.ones(n, dtype=np.int64),
+        **model.initial_history(n),
+    }
+
+    for turn in range(1, max_turns + 1):
+        n_alive = len(state["support"])
+        if n_alive == 0:
+            return
+
+        events = model.select_events(state, rng)
+        no_event = events < 0
+        if no_event.any():
+            ended = int(no_event.sum())
+            report.reasons[REASON_NO_EVENT] += ended
+            report.ended_at_turn[turn - 1] += ended
+            report.total_turns += ended * (turn - 1)
+            state = {key: arr[~no_event] for key, arr in state.items()}
+            events = events[~no_event]
+            if len(events) == 0:
+                return
+
+        report.event_counts += np.bincount(events, minlength=model.n_events)
+        model.record_events(state, events, turn)
+        options = policy(model, events, state, rng)
+
+        # Применяем эффекты варианта (как Country.apply_effect) и переходим к следующему году
+        state["support"] += model.d_support[events, options]
+        state["treasury"] += model.d_treasury[events, options]
+        state["current_year"] += model.d_year[events, options] + 1
+        new_army = model.set_army[events, options]
+        state["army"] = np.where(new_army > 0, new_army, state["army"])
+        new_peasants = model.set_peasants[events, options]
+        state["peasants"] = np.where(new_peasants > 0, new_peasants, state["peasants"])
+        if model.economy:
+            state["treasury"] += model.income[state["peasants"]] - model.expenses[state["army"]]
+
+        # Векторная версия check_game_over_conditions (тот же порядок проверок)
+        reason = np.where(
+            state["support"] <= 0, REASON_SUPPORT,
+            np.where(state["treasury"] < 0, REASON_TREASURY,
+                     np.where(state["current_year"] > MAX_REIGN_YEARS, REASON_OLD_AGE, REASON_NONE)),
+        )
+        over = reason != REASON_NONE
+        if over.any():
+            report.reasons += np.bincount(reason[over], minlength=len(REASON_NAMES))
+            ended = int(over.sum())
+            report.ended_at_turn[turn] += ended
+            report.total_turns += ended * turn
+            state = {key: arr[~over] for key, arr in state.items()}
+
+    # Правления, не закончившиеся за max_turns
+    still = len(state["support"])
+    report.reasons[REASON_NONE] += still
+    report.total_turns += still * max_turns
+
+
+def simulate(snapshot: CatalogSnapshot, n_players: int, policy: str | Policy = "random",
+             seed: Optional[int] = None, max_turns: int = MAX_REIGN_YEARS + 1,
+             economy: bool = False, chunk_size: Optional[int] = None) -> SimulationReport:
+    """Симулирует n_players правлений по каталогу событий.
+
+    Args:
+        snapshot: Снимок каталога (см. game.catalog).
+        n_players: Число правлений.
+        policy: Имя политики из POLICIES или функция-политика.
+        seed: Зерно генератора для воспроизводимости.
+        max_turns: Максимум ходов одного правления.
+        economy: Начислять ли годовой доход/расходы (calculate_yearly_income/expenses).
+            В боте они пока не применяются, поэтому по умолчанию выключено.
+        chunk_size: Размер пачки игроков (по умолчанию - по объему временных матриц).
+    """
+    model = SimulationModel(snapshot, economy=economy)
+    policy_fn = POLICIES[policy] if isinstance(policy, str) else policy
+    rng = np.random.default_rng(seed)
+    if chunk_size is None:
+        chunk_size = max(1_000, MAX_CHUNK_CELLS // max(model.n_conditional, 1))
+
+    report = SimulationReport(model, n_players, max_turns)
+    started = time.perf_counter()
+    for start in range(0, n_players, chunk_size):
+        _simulate_chunk(model, min(chunk_size, n_players - start), policy_fn, rng, max_turns, report)
+    report.elapsed_seconds = time.perf_counter() - started
+    return report
+
+
+def load_content_file(path: str) -> CatalogSnapshot:
+    """Загружает каталог из JSON-файла вида {"events": [...], "event_options": [...]}."""
+    with open(path, encoding="utf-8") as f:
+        content = json.load(f)
+    return CatalogSnapshot(content["events"], content["event_options"])
+
+
+async def _load_from_storage() -> CatalogSnapshot:
+    from data.database import init_storage
+    from game.catalog import EventCatalog
+
+    storage = await init_storage()
+    if storage is None:
+        raise SystemExit("Storage is not configured.")
+    try:
+        catalog = EventCatalog()
+        if not await catalog.load(storage):
+            raise SystemExit("Failed to load event catalog.")
+        return catalog.snapshot
+    finally:
+        await storage.close()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of reigns for content balancing.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--content", help="JSON file with 'events' and 'event_options' lists")
+    source.add_argument("--from-storage", action="store_true", help="load the catalog from the configured storage")
+    parser.add_argument("--players", type=int, default=100_000)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-turns", type=int, default=MAX_REIGN_YEARS + 1)
+    parser.add_argument("--economy", action="store_true", help="apply yearly income and expenses")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    snapshot = load_content_file(args.content) if args.content else asyncio.run(_load_from_storage())
+    report = simulate(snapshot, args.players, args.policy, seed=args.seed, max_turns=args.max_turns,
+                      economy=args.economy, chunk_size=args.chunk_size)
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import random
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+import config
+from data.models import CountryState
+from data.storage import Storage
+from game.catalog import EventCatalog, option_order
+from game.core import Country
+from game.events import EventData, get_next_event
+from game.mechanics import check_game_over_conditions
+
+
+class Branch:
+    """Просчитанный исход одного варианта: новое состояние, конец игры и следующее событие."""
+    __slots__ = ("choice_index", "country", "game_over_reason", "next_event")
+
+    def __init__(self, choice_index: int, country: Country, game_over_reason: Optional[str], next_event: Optional[EventData]):
+        self.choice_index = choice_index
+        self.country = country
+        self.game_over_reason = game_over_reason
+        self.next_event = next_event
+
+
+class _Speculation:
+    __slots__ = ("event_id", "state_key", "catalog_version", "task")
+
+    def __init__(self, event_id: int, state_key: Tuple[Any, ...], catalog_version: Optional[int], task: "asyncio.Task[List[Branch]]"):
+        self.event_id = event_id
+        self.state_key = state_key
+        self.catalog_version = catalog_version
+        self.task = task
+
+
+def _state_key(support: int, treasury: int, army: str, peasants: str, current_year: int) -> Tuple[Any, ...]:
+    return (support, treasury, army, peasants, current_year)
+
+
+class TurnSpeculator:
+    """Спекулятивный просчет следующего хода, пока игрок читает событие.
+
+    После отправки события для каждого варианта в фоне считаются новое
+    состояние страны, проверка конца игры и выбор следующего события.
+    По нажатию кнопки take() отдает готовую ветку, если с момента просчета
+    не изменились ни событие, ни состояние игрока, ни версия каталога;
+    иначе просчет отбрасывается и ход считается обычным путем.
+    """
+
+    def __init__(self, max_players: int = config.SPECULATION_MAX_PLAYERS):
+        self.max_players = max_players
+        self._entries: "OrderedDict[int, _Speculation]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, player_id: int, event_data: EventData, country: Country, db_client: Storage,
+                 event_catalog: Optional[EventCatalog] = None, rng: Optional[random.Random] = None) -> None:
+        """Запускает фоновый просчет всех вариантов показанного события.
+
+        Только при загруженном каталоге: без него каждый вариант стоил бы
+        отдельного запроса событий к БД, то есть умножал бы чтения на каждом ходу.
+        """
+        self.discard(player_id)
+        if event_catalog is None or not event_catalog.is_loaded:
+            return
+        base = country.copy()
+        task = asyncio.create_task(self._compute(event_data, base, db_client, event_catalog, rng))
+        self._entries[player_id] = _Speculation(
+            event_id=event_data.id,
+            state_key=_state_key(base.support, base.treasury, base.army, base.peasants, base.current_year),
+            catalog_version=event_catalog.version,
+            task=task,
+        )
+        while len(self._entries) > self.max_players:
+            _, oldest = self._entries.popitem(last=False)
+            oldest.task.cancel()
+
+    async def _compute(self, event_data: EventData, base: Country, db_client: Storage,
+                       event_catalog: EventCatalog, rng: Optional[random.Random]) -> List[Branch]:
+        branches = []
+        # Порядок вариантов совпадает с кнопками (bot/rendering.py, build_event_keyboard)
+        options = sorted(event_data.options, key=option_order)
+        for index, option in enumerate(options):
+            effect = event_catalog.get_effect(option)
+            country = base.copy()
+            country.apply_effect(effect)
+            country.current_year += 1
+            reason = check_game_over_conditions(country)
+            next_event = None if reason else await get_next_event(db_client, country, event_catalog, rng)
+            branches.append(Branch(index, country, reason, next_event))
+        return branches
+
+    async def take(self, player_id: int, event_id: int, choice_index: int, country_state: CountryState,
+                   event_catalog: Optional[EventCatalog] = None) -> Optional[Branch]:
+        """Забирает просчитанную ветку выбора или None, если просчет устарел или отсутствует."""
+        entry = self._entries.pop(player_id, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        current_key = _state_key(country_state.support, country_state.treasury, country_state.army,
+                                 country_state.peasants, country_state.current_year)
+        current_version = event_catalog.version if event_catalog is not None else None
+        if entry.event_id != event_id or entry.state_key != current_key or entry.catalog_version != current_version:
+            entry.task.cancel()
+            self.misses += 1
+            logging.debug(f"Dropped stale speculation for player {player_id} (event {entry.event_id}).")
+            return None
+        if entry.task.cancelled():
+            self.misses += 1
+            return None
+        try:
+            branches = await entry.task # Обычно уже готово; иначе дожидаемся той же работы
+        except Exception as e:
+            logging.exception(f"Speculation failed for player {player_id}: {e}")
+            self.misses += 1
+            return None
+        if not 0 <= choice_index < len(branches):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return branches[choice_index]
+
+    def discard(self, player_id: int) -> None:
+        """Отбрасывает просчет игрока (например, при конце игры или /start)."""
+        entry = self._entries.pop(player_id, None)
+        if entry is not None:
+            entry.task.cancel()
+
+    def close(self) -> None:
+        """Отменяет все незавершенные просчеты (вызывать при остановке)."""
+        for entry in self._entries.values():
+            entry.task.cancel()
+        self._entries.clear()
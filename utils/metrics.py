@@ -0,0 +1,209 @@
+"""Метрики горячего пути в формате Prometheus (без внешних зависимостей).
+
+Гистограммы задержек и счетчики собираются в памяти процесса и отдаются
+текстом exposition format на локальном HTTP-эндпоинте (start_metrics_server).
+"""
+import bisect
+import functools
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+import config
+
+# Границы корзин задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Базовый класс метрики с набором меток."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.register(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> Iterable[str]:
+        return []
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики по корзинам (+Inf последней), сумма]
+        self._series: Dict[Tuple[Any, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def _samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = ("le", _format_value(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class GaugeCallback(Metric):
+    """Gauge, значения которого читаются функцией в момент запроса /metrics.
+
+    Функций может быть несколько (по одной на владельца, ключ key): повторный
+    set_function с тем же ключом заменяет прежнюю, remove_function ее убирает.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._callbacks: Dict[Any, Callable[[], Dict[Tuple[Any, ...], float]]] = {}
+
+    def set_function(self, func: Callable[[], Dict[Tuple[Any, ...], float]], key: Any = None) -> None:
+        """func возвращает словарь: кортеж значений меток -> значение."""
+        self._callbacks[key] = func
+
+    def remove_function(self, key: Any = None) -> None:
+        self._callbacks.pop(key, None)
+
+    def _samples(self) -> Iterable[str]:
+        for func in list(self._callbacks.values()):
+            try:
+                values = func()
+            except Exception as e:
+                logging.warning(f"Metric {self.name} callback failed: {e}")
+                continue
+            for labels, value in values.items():
+                yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- Метрики бота ---
+HANDLER_LATENCY = Histogram("bot_handler_latency_seconds", "Latency of update handlers.", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Update handlers that raised an exception.", ("handler",))
+STORAGE_LATENCY = Histogram("bot_storage_latency_seconds", "Latency of storage and content lookups.", ("operation",))
+STORAGE_ERRORS = Counter("bot_storage_errors_total", "Storage operations that raised an exception.", ("operation",))
+STORAGE_RETRIES = Counter("bot_storage_retries_total", "Storage calls retried after a transient error.", ("operation",))
+CIRCUIT_BREAKER_STATE = GaugeCallback(
+    "bot_circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open.", ("breaker",))
+TELEGRAM_API_LATENCY = Histogram(
+    "bot_telegram_api_latency_seconds", "Latency of Telegram Bot API calls, including outbound queueing.", ("method", "status"))
+OUTBOUND_QUEUE_DEPTH = GaugeCallback("bot_outbound_queue_depth", "Requests waiting in the outbound scheduler.", ("priority",))
+STARTUP_PHASE_SECONDS = GaugeCallback("bot_startup_phase_seconds", "Duration of startup phases of this process.", ("phase",))
+
+# Готовность процесса: /ready отвечает 200 только после прогрева (см. bot/startup.py)
+_ready = False
+
+
+def set_ready(ready: bool) -> None:
+    global _ready
+    _ready = ready
+
+
+def timed(histogram: Histogram, label: str) -> Callable:
+    """Декоратор корутины: пишет длительность вызова в histogram с меткой label."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, label)
+        return wrapper
+    return decorator
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=REGISTRY.render().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def _handle_ready(request: web.Request) -> web.Response:
+    if _ready:
+        return web.Response(text="ready\n")
+    return web.Response(status=503, text="starting\n")
+
+
+async def start_metrics_server(host: str = config.METRICS_HOST, port: int = config.METRICS_PORT) -> Optional[web.AppRunner]:
+    """Запускает HTTP-эндпоинты /metrics и /ready. Возвращает runner для остановки (runner.cleanup()).
+
+    Если порт занят или недоступен, ошибка только логируется и возвращается None:
+    бот работает дальше без эндпоинта.
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    app.router.add_get("/ready", _handle_ready)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=host, port=port).start()
+    except OSError as e:
+        logging.error(f"Metrics endpoint not started on {host}:{port}: {e}. Continuing without /metrics and /ready.")
+        await runner.cleanup()
+        return None
+    logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,132 @@
+"""Повторы с экспоненциальной задержкой и предохранитель (circuit breaker) для внешних вызовов.
+
+Предохранитель считает подряд идущие транзиентные ошибки. После failure_threshold
+ошибок цепь размыкается: вызовы сразу получают CircuitOpenError, не дожидаясь
+таймаутов и не накапливая тысячи ожидающих корутин. Через reset_seconds
+пропускается одна пробная попытка: успех замыкает цепь, ошибка снова размыкает.
+Кроме того, число одновременных вызовов ограничено max_pending: лишние вызовы
+отклоняются сразу, а не ждут в очереди пула соединений.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from utils.metrics import CIRCUIT_BREAKER_STATE, STORAGE_RETRIES
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен без попытки: предохранитель разомкнут."""
+
+
+class CircuitBreaker:
+    """Предохранитель одного внешнего сервиса (состояние экспортируется в bot_circuit_breaker_state)."""
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, max_pending: Optional[int] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_pending = max_pending
+        self.pending = 0 # Попытки, которые сейчас выполняются
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        # Новый предохранитель с тем же именем заменяет прежний в метрике
+        CIRCUIT_BREAKER_STATE.set_function(lambda: {(self.name,): self.state}, key=name)
+
+    def close(self) -> None:
+        """Убирает предохранитель из метрики (при закрытии хранилища)."""
+        CIRCUIT_BREAKER_STATE.remove_function(self.name)
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def before_call(self) -> None:
+        """Пропускает вызов или бросает CircuitOpenError."""
+        if self.max_pending is not None and self.pending >= self.max_pending:
+            raise CircuitOpenError(f"{self.name} has {self.pending} calls in flight")
+        if self.state == self.CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self._opened_at < self.reset_seconds:
+                raise CircuitOpenError(f"{self.name} circuit is open after {self.failures} consecutive failures")
+            self.state = self.HALF_OPEN
+            logging.info(f"{self.name} circuit half-open: sending a probe request.")
+        elif now - self._probe_started < self.reset_seconds:
+            # Пробная попытка уже идет; повторная разрешается, только если прежняя зависла
+            raise CircuitOpenError(f"{self.name} circuit is half-open, probe in progress")
+        self._probe_started = now
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logging.info(f"{self.name} circuit closed: calls succeed again.")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            if self.state == self.CLOSED:
+                logging.warning(f"{self.name} circuit open after {self.failures} consecutive failures; "
+                                f"failing fast for {self.reset_seconds:.0f}s.")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+async def call_with_retries(
+    func: Callable[[], Awaitable[T]],
+    *,
+    operation: str,
+    is_transient: Callable[[BaseException], bool],
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+    timeout: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    rng: Optional[random.Random] = None,
+) -> T:
+    """Вызывает func с ограниченным числом повторов при транзиентных ошибках.
+
+    Задержка перед повтором - "полный джиттер": случайная в [0, min(max_delay, base_delay * 2^n)],
+    чтобы повторы многих клиентов не приходили волной. timeout ограничивает каждую попытку.
+    Нетранзиентные ошибки (неверный запрос, нарушение ограничений) пробрасываются сразу
+    и не размыкают предохранитель: сервис ответил, значит он доступен.
+    """
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+            breaker.pending += 1
+        try:
+            # wait_for, а не asyncio.timeout: бот поддерживает Python 3.10
+            result = await (func() if timeout is None else asyncio.wait_for(func(), timeout))
+        except Exception as e:
+            if not is_transient(e):
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            attempt += 1
+            if attempt >= attempts or (breaker is not None and breaker.is_open):
+                raise
+            delay = (rng or random).uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            STORAGE_RETRIES.inc(operation)
+            logging.warning(f"{operation} failed ({type(e).__name__}: {e}), retry {attempt}/{attempts - 1} in {delay * 1000:.0f} ms.")
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+        finally:
+            if breaker is not None:
+                breaker.pending -= 1
+        await asyncio.sleep(delay)
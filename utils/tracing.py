@@ -0,0 +1,169 @@
+"""Трассировка обработки апдейтов: дерево спанов на каждый апдейт.
+
+TracingMiddleware открывает трассу на апдейт, а функции горячего пути,
+помеченные @traced, записывают в нее дочерние спаны. Трасса сохраняется,
+если попала в выборку (TRACE_SAMPLE_RATE) или обработка длилась дольше
+TRACE_SLOW_MS. Сохраненные трассы пишутся в TRACE_DIR в формате
+Chrome Trace Event (открываются в chrome://tracing, Perfetto и speedscope);
+хранятся только последние TRACE_MAX_FILES файлов.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import glob
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import config
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """Спаны одного апдейта. Время - в микросекундах от perf_counter."""
+    __slots__ = ("trace_id", "name", "owner", "start_us", "end_us", "spans", "args")
+
+    def __init__(self, trace_id: int, name: str, args: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.name = name
+        # Спаны пишет только задача, обрабатывающая апдейт; фоновые задачи
+        # (удаление сообщений, спекулятивный просчет) наследуют контекст, но не пишут
+        self.owner = asyncio.current_task()
+        self.start_us = _now_us()
+        self.end_us: Optional[float] = None
+        self.spans: List[tuple] = [] # (name, start_us, end_us, args)
+        self.args = args or {}
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_us or _now_us()) - self.start_us) / 1000
+
+    def to_events(self, pid: int) -> List[Dict[str, Any]]:
+        """Спаны в формате Chrome Trace Event ("X" - complete event); одна трасса - один поток (tid)."""
+        events = [{
+            "name": self.name, "ph": "X", "pid": pid, "tid": self.trace_id,
+            "ts": self.start_us, "dur": (self.end_us or self.start_us) - self.start_us, "args": self.args,
+        }]
+        for name, start_us, end_us, args in self.spans:
+            events.append({"name": name, "ph": "X", "pid": pid, "tid": self.trace_id,
+                           "ts": start_us, "dur": end_us - start_us, "args": args})
+        return events
+
+
+def _now_us() -> float:
+    return time.perf_counter() * 1_000_000
+
+
+@contextlib.contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """Записывает дочерний спан в текущую трассу (без трассы ничего не делает)."""
+    trace = _current_trace.get()
+    if trace is None or trace.end_us is not None or asyncio.current_task() is not trace.owner:
+        yield
+        return
+    start = _now_us()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, start, _now_us(), args))
+
+
+def traced(name: str) -> Callable:
+    """Декоратор корутины: каждый вызов - спан name в текущей трассе."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TraceRecorder:
+    """Решает, сохранять ли трассу, и пачками пишет сохраненные в файлы TRACE_DIR."""
+
+    def __init__(
+        self,
+        sample_rate: float = config.TRACE_SAMPLE_RATE,
+        slow_ms: float = config.TRACE_SLOW_MS,
+        directory: str = config.TRACE_DIR,
+        flush_every: int = config.TRACE_FLUSH_EVERY,
+        max_files: int = config.TRACE_MAX_FILES,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self.flush_every = flush_every
+        self.max_files = max_files
+        self.pid = os.getpid()
+        self.kept = 0
+        self.dropped = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffered_traces = 0
+        self._next_id = 1
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **args: Any) -> Iterator[Trace]:
+        """Открывает трассу на время блока with и решает ее судьбу по завершении."""
+        trace = Trace(self._next_id, name, args)
+        self._next_id += 1
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            trace.end_us = _now_us()
+            _current_trace.reset(token)
+            self.finish(trace)
+
+    def finish(self, trace: Trace) -> None:
+        if trace.duration_ms >= self.slow_ms:
+            trace.args["slow"] = True
+        elif random.random() >= self.sample_rate:
+            self.dropped += 1
+            return
+        self.kept += 1
+        trace.args["duration_ms"] = round(trace.duration_ms, 3)
+        self._buffer.extend(trace.to_events(self.pid))
+        self._buffered_traces += 1
+        if self._buffered_traces >= self.flush_every:
+            self._start_flush()
+
+    def _start_flush(self) -> None:
+        events, self._buffer, self._buffered_traces = self._buffer, [], 0
+        task = asyncio.create_task(asyncio.to_thread(self._write, events))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _write(self, events: List[Dict[str, Any]]) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"trace-{self.pid}-{int(time.time() * 1000)}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+            logging.info(f"Wrote {len(events)} trace events to {path}")
+            if self.max_files > 0:
+                self._prune()
+        except OSError as e:
+            logging.error(f"Failed to write traces to {self.directory}: {e}")
+
+    def _prune(self) -> None:
+        """Удаляет самые старые файлы трасс сверх max_files."""
+        paths = sorted(glob.glob(os.path.join(self.directory, "trace-*.json")), key=os.path.getmtime)
+        for path in paths[:-self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass # Уже удален параллельной записью
+
+    async def close(self) -> None:
+        """Записывает оставшиеся трассы (вызывать при остановке)."""
+        if self._buffer:
+            self._start_flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)